@@ -1,59 +1,1028 @@
-from datetime import datetime
-from pathlib import Path
-from fastapi import APIRouter, File, HTTPException, UploadFile
-import subprocess
+import base64
+import logging
+import os
 import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Annotated, Any, BinaryIO
+
+from fastapi import (
+    APIRouter,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketException,
+    status,
+)
+from fastapi.responses import JSONResponse, RedirectResponse
+from sqlalchemy import literal, tuple_
+from sqlmodel import col, select
+from starlette.concurrency import run_in_threadpool
+
+from app import crud
+from app.api.deps import CurrentUser, SessionDep, get_user_from_token
+from app.core.config import settings
+from app.models import (
+    FeatureSummary,
+    Message,
+    Recording,
+    RecordingBatchItem,
+    RecordingBatchPublic,
+    RecordingBlob,
+    RecordingDirectUploadPublic,
+    RecordingDuplicate,
+    RecordingDuplicatesPublic,
+    RecordingFeaturesAggregate,
+    RecordingFeaturesPublic,
+    RecordingJob,
+    RecordingJobPublic,
+    RecordingPublic,
+    RecordingsPublic,
+    RecordingTranscriptPublic,
+    RecordingUploadCreate,
+    RecordingUploadPublic,
+    TranscriptSegment,
+    User,
+    utcnow,
+)
+from app.recordings import (
+    direct,
+    features,
+    fingerprint,
+    hls,
+    lifecycle,
+    peaks,
+    resumable,
+)
+from app.recordings.admission import check_transcode_admission, get_live_slots
+from app.recordings.ffmpeg import FFmpegError
+from app.recordings.formats import (
+    PROFILES,
+    AudioFormat,
+    derived_audio,
+    master_format,
+)
+from app.recordings.ingest import (
+    UploadPart,
+    iter_upload_chunks,
+    remove_quietly,
+    stream_upload_to_file,
+)
+from app.recordings.jobs import (
+    abort_live_job,
+    create_live_job,
+    finish_live_job,
+    register_direct_upload,
+    register_upload,
+    release_quota,
+    transcode_queue,
+)
+from app.recordings.live import LiveRecording
+from app.recordings.serving import (
+    RangeFileResponse,
+    RangeNotSatisfiable,
+    etag_matches,
+    parse_range,
+)
+from app.recordings.storage import StorageError, get_storage, spool_dir
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# recordings/ at project root (inside container)
-RECORDINGS_DIR = Path("recordings")
-RECORDINGS_DIR.mkdir(parents=True, exist_ok=True)
-
-
-@router.post("/", summary="Upload a voice recording")
-async def upload_recording(file: UploadFile = File(...)):
-    if not file.content_type or not file.content_type.startswith("audio/"):
-        raise HTTPException(status_code=400, detail="File must be an audio type")
-
-    # Unique filename for the final MP3
-    timestamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S-%f")
-    mp3_filename = f"recording-{timestamp}.mp3"
-    mp3_path = RECORDINGS_DIR / mp3_filename
-
-    # Read uploaded blob into a temp webm file
-    contents = await file.read()
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as tmp:
-        tmp.write(contents)
-        tmp_path = Path(tmp.name)
-
-    try:
-        # ffmpeg command: webm -> mp3
-        cmd = [
-            "ffmpeg",
-            "-y",                 # overwrite if exists
-            "-i", str(tmp_path),  # input file
-            "-vn",                # no video
-            "-acodec", "libmp3lame",
-            str(mp3_path),
-        ]
-        subprocess.run(
-            cmd,
-            check=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-    except subprocess.CalledProcessError as e:
-        raise HTTPException(status_code=500, detail=f"Conversion error: {e}") from e
-    finally:
-        # Clean up temp webm file
+# The multipart body is parsed by hand so it can be streamed, document it here
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+
+BATCH_UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "items": {"type": "string", "format": "binary"},
+                        }
+                    },
+                    "required": ["files"],
+                }
+            }
+        },
+    }
+}
+
+
+def _encode_cursor(recording: Recording) -> str:
+    raw = f"{recording.created_at.isoformat()}|{recording.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        created_at, id = base64.urlsafe_b64decode(cursor).decode().split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/", response_model=RecordingsPublic)
+def read_recordings(
+    session: SessionDep,
+    current_user: CurrentUser,
+    cursor: str | None = None,
+    limit: Annotated[int, Query(ge=1, le=100)] = 50,
+    owner_id: uuid.UUID | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> Any:
+    """
+    Retrieve recordings, newest first.
+
+    Pages are walked with the opaque next_cursor rather than an offset, so each
+    page is a single index range scan however deep it is.
+    """
+    statement = select(Recording)
+    if not current_user.is_superuser:
+        if owner_id is not None and owner_id != current_user.id:
+            raise HTTPException(status_code=400, detail="Not enough permissions")
+        owner_id = current_user.id
+    if owner_id is not None:
+        statement = statement.where(Recording.owner_id == owner_id)
+    if created_after is not None:
+        statement = statement.where(Recording.created_at >= created_after)
+    if created_before is not None:
+        statement = statement.where(Recording.created_at < created_before)
+    if cursor is not None:
+        after_created_at, after_id = _decode_cursor(cursor)
+        statement = statement.where(
+            tuple_(col(Recording.created_at), col(Recording.id))
+            < tuple_(literal(after_created_at), literal(after_id))
+        )
+    statement = statement.order_by(
+        col(Recording.created_at).desc(), col(Recording.id).desc()
+    ).limit(limit + 1)
+    recordings = session.exec(statement).all()
+    next_cursor = None
+    if len(recordings) > limit:
+        recordings = recordings[:limit]
+        next_cursor = _encode_cursor(recordings[-1])
+    return RecordingsPublic(data=recordings, next_cursor=next_cursor)
+
+
+def _get_recording_or_404(
+    session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+) -> Recording:
+    recording = session.get(Recording, id)
+    if not recording:
+        raise HTTPException(status_code=404, detail="Recording not found")
+    if not current_user.is_superuser and (recording.owner_id != current_user.id):
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    return recording
+
+
+def _audio_etag(session: SessionDep, recording: Recording, representation: str) -> str:
+    # The hash names the audio, the revision which encoding of it is stored
+    blob = session.get(RecordingBlob, recording.content_hash)
+    revision = blob.revision if blob is not None else 0
+    return f'"{recording.content_hash}.{revision}.{representation}"'
+
+
+@router.get("/features/aggregate", response_model=RecordingFeaturesAggregate)
+def read_recording_features_aggregate(
+    session: SessionDep,
+    current_user: CurrentUser,
+    owner_id: uuid.UUID | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> Any:
+    """
+    Summary statistics of the analytics features of the matching recordings.
+
+    Served from the feature store, no audio is decoded.
+    """
+    if not current_user.is_superuser:
+        if owner_id is not None and owner_id != current_user.id:
+            raise HTTPException(status_code=400, detail="Not enough permissions")
+        owner_id = current_user.id
+    content_hashes = crud.get_recording_hashes(
+        session=session,
+        owner_id=owner_id,
+        created_after=created_after,
+        created_before=created_before,
+    )
+    count, summaries = features.summarize_features(
+        features.get_feature_store(), content_hashes
+    )
+    return RecordingFeaturesAggregate(
+        count=count,
+        features={
+            name: FeatureSummary.model_validate(summary)
+            for name, summary in summaries.items()
+        },
+    )
+
+
+@router.get("/{id}", response_model=RecordingPublic)
+def read_recording(
+    session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+) -> Any:
+    """
+    Get recording by ID.
+    """
+    return _get_recording_or_404(session, current_user, id)
+
+
+def _file_response(
+    path: Path, headers: dict[str, str], media_type: str, range: str | None
+) -> Response:
+    if settings.RECORDINGS_ACCEL_REDIRECT_PREFIX:
+        # nginx handles Range itself on the internal location
+        location = settings.RECORDINGS_ACCEL_REDIRECT_PREFIX.rstrip("/")
+        relative = path.relative_to(settings.RECORDINGS_DIR)
+        headers["x-accel-redirect"] = f"{location}/{relative}"
+        return Response(headers=headers, media_type=media_type)
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Recording audio not found")
+    try:
+        byte_range = parse_range(range, size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={"content-range": f"bytes */{size}"})
+    if byte_range is None:
+        return RangeFileResponse(
+            path, offset=0, count=size, headers=headers, media_type=media_type
+        )
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return RangeFileResponse(
+        path,
+        offset=start,
+        count=end - start + 1,
+        status_code=206,
+        headers=headers,
+        media_type=media_type,
+    )
+
+
+@router.get(
+    "/{id}/audio",
+    response_class=Response,
+    responses={
+        200: {"content": {"audio/mpeg": {}, "audio/ogg": {}}},
+        206: {"description": "Partial content"},
+        307: {"description": "Download from the object store"},
+        304: {"description": "Not modified"},
+        416: {"description": "Range not satisfiable"},
+    },
+)
+async def read_recording_audio(
+    session: SessionDep,
+    current_user: CurrentUser,
+    id: uuid.UUID,
+    format: AudioFormat = "mp3",
+    range: Annotated[str | None, Header()] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    """
+    Stream the audio of a recording, with Range and ETag support for seeking.
+
+    Only an Opus master is stored, other formats are converted on their first
+    download and then served from a cache.
+    """
+    recording = await run_in_threadpool(
+        _get_recording_or_404, session, current_user, id
+    )
+    # Archiving, restoring and re-encoding the master change the bytes under
+    # the same URL, so clients revalidate, and mostly get a 304
+    headers = {
+        "etag": await run_in_threadpool(_audio_etag, session, recording, format),
+        "accept-ranges": "bytes",
+        "cache-control": "private, no-cache",
+    }
+    if etag_matches(if_none_match, headers["etag"]):
+        return Response(status_code=304, headers=headers)
+    media_type = PROFILES[format].media_type
+    try:
+        filename = await lifecycle.playable_filename(recording)
+    except (FileNotFoundError, StorageError):
+        raise HTTPException(status_code=404, detail="Recording audio not found")
+    if format == master_format(filename):
+        storage = get_storage()
+        path = storage.local_path(filename)
+        if path is None:
+            # The object store serves Range requests itself
+            url = storage.presigned_get_url(filename)
+            assert url is not None
+            return RedirectResponse(url, headers={"cache-control": "private, no-store"})
+    else:
         try:
-            tmp_path.unlink(missing_ok=True)
-        except Exception:
-            pass
-
-    return {
-        "message": "Recording uploaded successfully",
-        "filename": mp3_filename,
-        "path": str(mp3_path),
+            path = await derived_audio(filename, recording.content_hash, format)
+        except (FileNotFoundError, StorageError):
+            raise HTTPException(status_code=404, detail="Recording audio not found")
+        except FFmpegError as e:
+            logger.warning("Could not convert recording %s: %s", id, e)
+            raise HTTPException(
+                status_code=500, detail="Recording could not be converted"
+            )
+    return _file_response(path, headers, media_type, range)
+
+
+@router.get(
+    "/{id}/peaks",
+    response_class=Response,
+    responses={200: {"content": {"application/octet-stream": {}}}},
+)
+def read_recording_peaks(
+    session: SessionDep,
+    current_user: CurrentUser,
+    id: uuid.UUID,
+    resolution: Annotated[int | None, Query(ge=1)] = None,
+) -> Response:
+    """
+    Get the waveform of a recording as little-endian int16 (min, max) pairs.
+
+    ``resolution`` is the number of pairs the client wants to draw, the
+    coarsest precomputed level with at least that many is returned. Its
+    samples per pair and the sample rate are in the X-Peaks-* headers.
+    """
+    recording = _get_recording_or_404(session, current_user, id)
+    storage = get_storage()
+    key = peaks.peaks_key(recording.content_hash)
+    header = storage.read_range(
+        key, 0, peaks.HEADER.size + peaks.LEVEL.size * peaks.MAX_LEVELS
+    )
+    if header is None:
+        raise HTTPException(status_code=404, detail="Recording peaks not found")
+    sample_rate, levels = peaks.decode_header(header)
+    level = peaks.choose_level(levels, resolution)
+    data = b""
+    if level.length:
+        data = storage.read_range(key, level.offset, level.byte_size) or b""
+    return Response(
+        content=data,
+        media_type="application/octet-stream",
+        headers={
+            "etag": f'"{recording.content_hash}-{level.samples_per_peak}"',
+            "cache-control": "private, max-age=31536000, immutable",
+            "x-peaks-sample-rate": str(sample_rate),
+            "x-peaks-samples-per-peak": str(level.samples_per_peak),
+        },
+    )
+
+
+@router.get("/{id}/features", response_model=RecordingFeaturesPublic)
+def read_recording_features(
+    session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+) -> Any:
+    """
+    Get the analytics features extracted when the recording was stored.
+    """
+    recording = _get_recording_or_404(session, current_user, id)
+    values = features.read_features(
+        features.get_feature_store(), recording.content_hash
+    )
+    if values is None:
+        raise HTTPException(status_code=404, detail="Recording features not found")
+    return values
+
+
+@router.get("/{id}/duplicates", response_model=RecordingDuplicatesPublic)
+def read_recording_duplicates(
+    session: SessionDep,
+    current_user: CurrentUser,
+    id: uuid.UUID,
+    min_score: Annotated[float, Query(ge=0, le=1)] = 0.1,
+    limit: Annotated[int, Query(ge=1, le=100)] = 50,
+) -> Any:
+    """
+    Recordings of the same audio, also after it was re-encoded or trimmed,
+    best match first.
+
+    Looked up in the fingerprint index, no audio is decoded.
+    """
+    recording = _get_recording_or_404(session, current_user, id)
+    scores = fingerprint.find_duplicates(
+        session=session, content_hash=recording.content_hash, min_score=min_score
+    )
+    if scores is None:
+        raise HTTPException(status_code=404, detail="Recording fingerprint not found")
+    # Uploads of the very same bytes share the stored file
+    scores[recording.content_hash] = 1.0
+    duplicates = [
+        RecordingDuplicate(
+            recording=RecordingPublic.model_validate(duplicate),
+            score=scores[duplicate.content_hash],
+        )
+        for duplicate in crud.get_recordings_by_hashes(
+            session=session,
+            content_hashes=list(scores),
+            owner_id=None if current_user.is_superuser else current_user.id,
+        )
+        if duplicate.id != recording.id
+    ]
+    duplicates.sort(key=lambda d: (d.score, d.recording.created_at), reverse=True)
+    return RecordingDuplicatesPublic(data=duplicates[:limit])
+
+
+@router.get("/{id}/transcript", response_model=RecordingTranscriptPublic)
+def read_recording_transcript(
+    session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+) -> Any:
+    """
+    Get the speech to text of the recording, with the start and end in
+    seconds of every segment.
+
+    Written in the background after the recording is stored, poll until the
+    status is "done" or "failed".
+    """
+    recording = _get_recording_or_404(session, current_user, id)
+    transcript = crud.get_recording_transcript(
+        session=session, content_hash=recording.content_hash
+    )
+    if transcript is None:
+        raise HTTPException(status_code=404, detail="Recording transcript not found")
+    return RecordingTranscriptPublic(
+        status=transcript.status,
+        engine=transcript.engine,
+        text=transcript.text,
+        segments=[
+            TranscriptSegment(start=start, end=end, text=text)
+            for start, end, text in transcript.segments or []
+        ],
+        error=transcript.error,
+        updated_at=transcript.updated_at,
+    )
+
+
+@router.get(
+    "/{id}/hls/{name}",
+    response_class=Response,
+    responses={
+        200: {"content": {"application/vnd.apple.mpegurl": {}, "video/mp2t": {}}},
+        307: {"description": "Download from the object store"},
+        304: {"description": "Not modified"},
+    },
+)
+def read_recording_hls(
+    session: SessionDep,
+    current_user: CurrentUser,
+    id: uuid.UUID,
+    name: str,
+    range: Annotated[str | None, Header()] = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    """
+    Get the HLS playlist (``index.m3u8``) or a segment of a long recording.
+
+    Segment URLs in the playlist are relative, so players fetch them from
+    here with the same Authorization header. Not every recording is packaged,
+    play the audio endpoint when the playlist is not found.
+    """
+    if name != hls.PLAYLIST and not hls.SEGMENT_NAME.fullmatch(name):
+        raise HTTPException(status_code=404, detail="Recording HLS file not found")
+    recording = _get_recording_or_404(session, current_user, id)
+    # Packaged again from a restored file, revalidated like the audio
+    headers = {
+        "etag": _audio_etag(session, recording, f"hls.{name}"),
+        "cache-control": "private, no-cache",
     }
+    if etag_matches(if_none_match, headers["etag"]):
+        return Response(status_code=304, headers=headers)
+    storage = get_storage()
+    key = hls.hls_key(recording.content_hash, name)
+    if name == hls.PLAYLIST:
+        playlist = storage.read_range(key, 0, hls.MAX_PLAYLIST_BYTES)
+        if playlist is None:
+            raise HTTPException(status_code=404, detail="Recording HLS file not found")
+        return Response(
+            content=playlist,
+            headers=headers,
+            media_type="application/vnd.apple.mpegurl",
+        )
+    path = storage.local_path(key)
+    if path is None:
+        url = storage.presigned_get_url(key)
+        assert url is not None
+        return RedirectResponse(url, headers={"cache-control": "private, no-store"})
+    headers["accept-ranges"] = "bytes"
+    return _file_response(path, headers, "video/mp2t", range)
+
+
+@router.delete("/{id}")
+def delete_recording(
+    session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+) -> Message:
+    """
+    Delete a recording, its audio is removed once no other recording uses it.
+    """
+    recording = _get_recording_or_404(session, current_user, id)
+    lifecycle.delete_recording(session, recording)
+    return Message(message="Recording deleted successfully")
+
+
+def _try_reserve_quota(session: SessionDep, user: User) -> bool:
+    # Superusers are counted too, only never turned away
+    limited = not user.is_superuser
+    return crud.reserve_recording_quota(
+        session=session,
+        user_id=user.id,
+        max_count=settings.RECORDINGS_USER_MAX_COUNT if limited else None,
+        max_bytes=settings.RECORDINGS_USER_MAX_BYTES if limited else None,
+    )
+
+
+def _reserve_quota(session: SessionDep, user: User) -> None:
+    if not _try_reserve_quota(session, user):
+        raise HTTPException(status_code=403, detail="Recording quota exceeded")
+
+
+@router.post(
+    "/",
+    summary="Upload a voice recording",
+    status_code=202,
+    response_model=RecordingJobPublic,
+    openapi_extra=UPLOAD_REQUEST_BODY,
+    responses={
+        403: {"description": "Recording quota exceeded"},
+        429: {"description": "Conversion backlog is full"},
+    },
+)
+async def upload_recording(
+    request: Request, response: Response, session: SessionDep, current_user: CurrentUser
+) -> Any:
+    """
+    Upload a recording and queue it for conversion.
+
+    Bytes that were uploaded before are not converted again, the finished job
+    is returned with a 200 instead. While too many uploads wait for conversion
+    the upload is refused with a 429 and a Retry-After, and a user at their
+    quota is refused with a 403 before the body is read.
+    """
+    await run_in_threadpool(check_transcode_admission, session)
+    await run_in_threadpool(_reserve_quota, session, current_user)
+    fd, name = tempfile.mkstemp(dir=spool_dir("incoming"), suffix=".upload")
+    source_path = Path(name)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            upload = await stream_upload_to_file(
+                request, f, max_file_bytes=settings.RECORDINGS_MAX_UPLOAD_BYTES
+            )
+        assert upload.sha256 is not None
+        return await _queue_upload(
+            session, response, source_path, upload.sha256, current_user.id
+        )
+    except BaseException:
+        remove_quietly(source_path)
+        release_quota(session, current_user.id)
+        raise
+
+
+@router.post(
+    "/batch",
+    summary="Upload several voice recordings",
+    status_code=202,
+    response_model=RecordingBatchPublic,
+    openapi_extra=BATCH_UPLOAD_REQUEST_BODY,
+    responses={429: {"description": "Conversion backlog is full"}},
+)
+async def upload_recordings(
+    request: Request, session: SessionDep, current_user: CurrentUser
+) -> Any:
+    """
+    Upload many recordings in one multipart request and queue them together.
+
+    Every file is streamed to disk as it arrives and gets its own result, in
+    the order of the request. Each file counts against the quota, files past
+    it get an error and the others go ahead. A file that is not audio or is
+    too large fails the whole request before anything is queued.
+    """
+    await run_in_threadpool(check_transcode_admission, session)
+    # Every file part and its spooled bytes, None when over the quota
+    parts: list[tuple[UploadPart, Path | None]] = []
+    registered = 0
+    queued: list[uuid.UUID] = []
+    f: BinaryIO | None = None
+    try:
+        async for part, chunk in iter_upload_chunks(
+            request,
+            max_file_bytes=settings.RECORDINGS_MAX_UPLOAD_BYTES,
+            max_files=settings.RECORDINGS_BATCH_MAX_FILES,
+        ):
+            if not parts or parts[-1][0] is not part:
+                path = None
+                if await run_in_threadpool(_try_reserve_quota, session, current_user):
+                    fd, name = tempfile.mkstemp(
+                        dir=spool_dir("incoming"), suffix=".upload"
+                    )
+                    path = Path(name)
+                    f = os.fdopen(fd, "wb")
+                parts.append((part, path))
+            if f is None:
+                continue
+            if chunk:
+                await run_in_threadpool(f.write, chunk)
+            else:
+                await run_in_threadpool(f.close)
+                f = None
+        results = []
+        # Registered only once the whole body is in, then queued at once
+        for part, path in parts:
+            if path is None:
+                item = RecordingBatchItem(
+                    filename=part.filename, error="Recording quota exceeded"
+                )
+            else:
+                assert part.sha256 is not None
+                job, needs_transcode = await run_in_threadpool(
+                    register_upload,
+                    session=session,
+                    source_path=path,
+                    content_hash=part.sha256,
+                    owner_id=current_user.id,
+                )
+                if needs_transcode:
+                    queued.append(job.id)
+                item = RecordingBatchItem(
+                    filename=part.filename,
+                    job=RecordingJobPublic.model_validate(job),
+                )
+            registered += 1
+            results.append(item)
+    except BaseException:
+        if f is not None:
+            f.close()
+        for _, path in parts[registered:]:
+            if path is not None:
+                remove_quietly(path)
+                release_quota(session, current_user.id)
+        raise
+    finally:
+        for job_id in queued:
+            transcode_queue.enqueue(job_id)
+    return RecordingBatchPublic(data=results)
+
+
+async def _queue_upload(
+    session: SessionDep,
+    response: Response,
+    source_path: Path,
+    content_hash: str,
+    owner_id: uuid.UUID,
+) -> RecordingJob:
+    job, needs_transcode = await run_in_threadpool(
+        register_upload,
+        session=session,
+        source_path=source_path,
+        content_hash=content_hash,
+        owner_id=owner_id,
+    )
+    if needs_transcode:
+        transcode_queue.enqueue(job.id)
+    elif job.status == "done":
+        response.status_code = 200
+    return job
+
+
+def _websocket_user(websocket: WebSocket, session: SessionDep) -> User:
+    # Browsers cannot set headers on a WebSocket, so the token may come in
+    # the query string instead
+    token = websocket.query_params.get("token")
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        token = authorization[len("bearer ") :]
+    if not token:
+        raise WebSocketException(
+            code=status.WS_1008_POLICY_VIOLATION, reason="Not authenticated"
+        )
+    try:
+        return get_user_from_token(session, token)
+    except HTTPException as e:
+        raise WebSocketException(
+            code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail)
+        )
+
+
+@router.websocket("/live")
+async def record_live(websocket: WebSocket, session: SessionDep) -> None:
+    """
+    Record over a WebSocket, converting while the recording is being made.
+
+    Authenticate with a bearer token, in the Authorization header or the
+    ``token`` query parameter. Send the audio as binary messages as it is
+    recorded (e.g. MediaRecorder timeslices), then the text message ``stop``.
+    The finished job is sent back as JSON before the socket closes. A client
+    that disconnects without ``stop`` keeps what was received so far, the
+    text message ``cancel`` discards it instead.
+
+    The handshake is refused with a 429 while the node already encodes
+    RECORDINGS_LIVE_CONCURRENCY live recordings.
+    """
+    user = await run_in_threadpool(_websocket_user, websocket, session)
+    try:
+        await run_in_threadpool(check_transcode_admission, session)
+    except HTTPException as e:
+        raise WebSocketException(
+            code=status.WS_1013_TRY_AGAIN_LATER, reason=str(e.detail)
+        )
+    async with get_live_slots().hold_free(1) as held:
+        if not held:
+            await _deny_live(websocket, "Too many live recordings, retry later")
+            return
+        await _record_live(websocket, session, user)
+
+
+async def _deny_live(websocket: WebSocket, detail: str) -> None:
+    try:
+        await websocket.send_denial_response(
+            JSONResponse({"detail": detail}, status_code=429)
+        )
+    except RuntimeError:
+        # The server cannot answer the handshake with an HTTP response
+        raise WebSocketException(code=status.WS_1013_TRY_AGAIN_LATER, reason=detail)
+
+
+async def _record_live(websocket: WebSocket, session: SessionDep, user: User) -> None:
+    try:
+        await run_in_threadpool(_reserve_quota, session, user)
+    except HTTPException as e:
+        raise WebSocketException(
+            code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail)
+        )
+    try:
+        await websocket.accept()
+        live = LiveRecording(max_bytes=settings.RECORDINGS_MAX_UPLOAD_BYTES)
+        job = await run_in_threadpool(create_live_job, live.master_path, user.id)
+    except BaseException:
+        release_quota(session, user.id)
+        raise
+    recording = connected = True
+    cancelled = False
+    try:
+        while recording:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                connected = False
+                break
+            if cancelled := message.get("text") == "cancel":
+                break
+            if message.get("bytes"):
+                await live.feed(message["bytes"])
+            recording = message.get("text") != "stop"
+    except FFmpegError:
+        # The encoder gave up, finishing the job records why
+        pass
+    except WebSocketException as e:
+        await abort_live_job(job, live, e.reason)
+        raise
+    except BaseException:
+        await abort_live_job(job, live, "Recording was interrupted")
+        raise
+    if cancelled:
+        await abort_live_job(job, live, "Recording was cancelled")
+        await websocket.close()
+        return
+    job = await finish_live_job(job, live)
+    if connected:
+        public = RecordingJobPublic.model_validate(job)
+        await websocket.send_json(public.model_dump(mode="json"))
+        await websocket.close()
+
+
+def _get_upload_or_404(
+    current_user: CurrentUser, id: uuid.UUID
+) -> resumable.ResumableUpload:
+    upload = resumable.get_upload(id)
+    if not upload or upload.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return upload
+
+
+def _upload_public(
+    upload: resumable.ResumableUpload, response: Response, offset: int | None = None
+) -> RecordingUploadPublic:
+    offset = upload.offset if offset is None else offset
+    response.headers["Upload-Offset"] = str(offset)
+    return RecordingUploadPublic(id=upload.id, offset=offset, size=upload.size)
+
+
+def _max_open_uploads(user: User | None) -> int | None:
+    if user is not None and user.is_superuser:
+        return None
+    return settings.RECORDINGS_USER_MAX_OPEN_UPLOADS
+
+
+@router.post("/uploads/", status_code=201, response_model=RecordingUploadPublic)
+def create_recording_upload(
+    current_user: CurrentUser, upload_in: RecordingUploadCreate, response: Response
+) -> Any:
+    """
+    Start a resumable upload, send its bytes with PATCH and then complete it.
+    """
+    upload = resumable.create_upload(
+        upload_in.size, current_user.id, max_open=_max_open_uploads(current_user)
+    )
+    return _upload_public(upload, response)
+
+
+@router.get("/uploads/{id}", response_model=RecordingUploadPublic)
+def read_recording_upload(
+    current_user: CurrentUser, id: uuid.UUID, response: Response
+) -> Any:
+    """
+    Get the current offset of a resumable upload, resume sending from there.
+    """
+    upload = _get_upload_or_404(current_user, id)
+    return _upload_public(upload, response)
+
+
+@router.patch(
+    "/uploads/{id}",
+    response_model=RecordingUploadPublic,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/offset+octet-stream": {
+                    "schema": {"type": "string", "format": "binary"}
+                }
+            },
+        }
+    },
+)
+async def append_recording_upload(
+    current_user: CurrentUser,
+    id: uuid.UUID,
+    request: Request,
+    response: Response,
+    upload_offset: Annotated[int, Header(ge=0)],
+) -> Any:
+    """
+    Append the raw request body to a resumable upload at Upload-Offset.
+    """
+    upload = _get_upload_or_404(current_user, id)
+    offset = await resumable.append_chunks(upload, upload_offset, request.stream())
+    return _upload_public(upload, response, offset)
+
+
+@router.post(
+    "/uploads/{id}/complete",
+    status_code=202,
+    response_model=RecordingJobPublic,
+    responses={403: {"description": "Recording quota exceeded"}},
+)
+async def complete_recording_upload(
+    current_user: CurrentUser, id: uuid.UUID, response: Response, session: SessionDep
+) -> Any:
+    """
+    Finish a resumable upload and queue it for conversion.
+    """
+    upload = _get_upload_or_404(current_user, id)
+    await run_in_threadpool(check_transcode_admission, session)
+    await run_in_threadpool(_reserve_quota, session, current_user)
+    source_path = spool_dir("incoming") / f"{upload.id}.upload"
+    try:
+        content_hash = await resumable.finish_upload(upload, source_path)
+        return await _queue_upload(
+            session, response, source_path, content_hash, current_user.id
+        )
+    except BaseException:
+        remove_quietly(source_path)
+        release_quota(session, current_user.id)
+        raise
+
+
+@router.post("/direct/", status_code=201, response_model=RecordingDirectUploadPublic)
+def create_recording_direct_upload(request: Request, current_user: CurrentUser) -> Any:
+    """
+    Get a short lived URL to PUT a recording to, then complete the upload.
+
+    With an object store the URL is presigned for it and the bytes never pass
+    through the API. Without one the API serves the URL itself.
+    """
+    id = uuid.uuid4()
+    key = direct.direct_key(current_user.id, id)
+    expires_in = settings.RECORDINGS_DIRECT_UPLOAD_EXPIRE_SECONDS
+    storage = get_storage()
+    url = storage.presigned_put_url(key, expires_in)
+    if url is None:
+        direct.prune_expired(storage)
+        expires = int(time.time()) + expires_in
+        url = str(
+            request.url_for(
+                "put_recording_direct_upload", owner_id=current_user.id, id=id
+            ).include_query_params(
+                expires=expires, signature=direct.sign_key(key, expires)
+            )
+        )
+    return RecordingDirectUploadPublic(
+        id=id, url=url, expires_at=utcnow() + timedelta(seconds=expires_in)
+    )
+
+
+@router.put(
+    "/direct/{owner_id}/{id}",
+    status_code=204,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/octet-stream": {
+                    "schema": {"type": "string", "format": "binary"}
+                }
+            },
+        }
+    },
+)
+async def put_recording_direct_upload(
+    owner_id: uuid.UUID,
+    id: uuid.UUID,
+    expires: int,
+    signature: str,
+    request: Request,
+    session: SessionDep,
+) -> Response:
+    """
+    Store the raw request body of a direct upload, when there is no object
+    store to upload to. The signed URL is the authorization.
+    """
+    key = direct.direct_key(owner_id, id)
+    direct.check_signature(key, expires, signature)
+    storage = get_storage()
+    owner = await run_in_threadpool(session.get, User, owner_id)
+    await run_in_threadpool(
+        direct.check_open_uploads, storage, key, owner_id, _max_open_uploads(owner)
+    )
+    spool = spool_dir("incoming") / f"{id}.direct"
+    await direct.store_object(storage, key, request.stream(), spool)
+    return Response(status_code=204)
+
+
+@router.post(
+    "/direct/{id}/complete",
+    status_code=202,
+    response_model=RecordingJobPublic,
+    responses={403: {"description": "Recording quota exceeded"}},
+)
+async def complete_recording_direct_upload(
+    current_user: CurrentUser, id: uuid.UUID, session: SessionDep
+) -> Any:
+    """
+    Register the object of a direct upload and queue it for conversion.
+
+    Only the object's size is checked here, the transcode worker downloads,
+    checks and hashes it.
+    """
+    await run_in_threadpool(check_transcode_admission, session)
+    key = direct.direct_key(current_user.id, id)
+    await direct.check_object(get_storage(), key)
+    await run_in_threadpool(_reserve_quota, session, current_user)
+    try:
+        job, needs_transcode = await run_in_threadpool(
+            register_direct_upload,
+            session=session,
+            source_path=spool_dir("incoming") / f"{id}.upload",
+            source_key=key,
+            owner_id=current_user.id,
+        )
+    except BaseException:
+        release_quota(session, current_user.id)
+        raise
+    if needs_transcode:
+        transcode_queue.enqueue(job.id)
+    return job
+
+
+@router.get("/jobs/{id}", response_model=RecordingJobPublic)
+def read_recording_job(
+    session: SessionDep, current_user: CurrentUser, id: uuid.UUID
+) -> Any:
+    """
+    Get the status of a recording conversion job.
+    """
+    job = session.get(RecordingJob, id)
+    # Someone else's job is not found, its id tells nothing about it
+    if not job or (not current_user.is_superuser and job.owner_id != current_user.id):
+        raise HTTPException(status_code=404, detail="Recording job not found")
+    return job
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
 from pydantic.networks import EmailStr
 
-from app.api.deps import get_current_active_superuser
+from app.api.deps import get_current_active_superuser, verify_metrics_token
 from app.models import Message
+from app.recordings.metrics import process_metrics
 from app.utils import generate_test_email, send_email
 
 router = APIRouter(prefix="/utils", tags=["utils"])
@@ -29,3 +31,16 @@ def test_email(email_to: EmailStr) -> Message:
 @router.get("/health-check/")
 async def health_check() -> bool:
     return True
+
+
+@router.get(
+    "/metrics/",
+    dependencies=[Depends(verify_metrics_token)],
+    response_class=PlainTextResponse,
+)
+def metrics() -> str:
+    """
+    ffmpeg process counters of every API process on the node, for Prometheus
+    to scrape with the RECORDINGS_METRICS_TOKEN bearer token.
+    """
+    return process_metrics.render()
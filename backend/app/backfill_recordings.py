@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Recording, RecordingBlob, RecordingJob
+from app.recordings.admission import get_slots
+from app.recordings.features import store_features
+from app.recordings.ffmpeg import (
+    OPUS_OUTPUT_ARGS,
+    iter_file_chunks,
+    probe_audio,
+    transcode_stream,
+)
+from app.recordings.fingerprint import store_fingerprint
+from app.recordings.formats import get_cache
+from app.recordings.heartbeat import stale_before
+from app.recordings.hls import delete_hls, store_hls
+from app.recordings.ingest import remove_quietly
+from app.recordings.jobs import register_upload, run_transcode_job, store_peaks
+from app.recordings.resumable import hash_file
+from app.recordings.storage import RecordingStorage, get_storage, spool_dir
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TASKS = ("master", "probe", "peaks", "hls", "features", "fingerprint", "transcript")
+# Re-encoding the lossy master loses quality for good, so it is only run when
+# named
+DEFAULT_TASKS = tuple(task for task in TASKS if task != "master")
+# Files of the flat layout from before recordings were in the database
+LEGACY_PATTERN = "recording-*.mp3"
+
+
+def _init_worker(niceness: int) -> None:
+    os.nice(niceness)
+    # Connections inherited from the parent must not be shared
+    engine.dispose(close=False)
+
+
+def _replace_master(content_hash: str, encoded: Path) -> dict[str, Any]:
+    filename = RecordingStorage.key_for(content_hash, ".opus")
+    byte_size = get_storage().save(filename, encoded)
+    with Session(engine) as session:
+        blob = session.get(RecordingBlob, content_hash)
+        if blob is not None:
+            blob.filename = filename
+            blob.byte_size = byte_size
+            blob.revision += 1
+            session.add(blob)
+            session.commit()
+    get_cache().discard(content_hash)
+    return {"filename": filename, "byte_size": byte_size}
+
+
+async def _reprocess(content_hash: str, tasks: list[str]) -> None:
+    with Session(engine) as session:
+        blob = session.get(RecordingBlob, content_hash)
+    if blob is None or blob.tier != "hot":
+        # Deleted since the batch was listed, or archived without a master
+        return
+    storage = get_storage()
+    old_filename = blob.filename
+    work = spool_dir("backfill")
+    fetched = work / f"{content_hash}.master"
+    encoded = work / f"{content_hash}.opus"
+    source = storage.local_path(blob.filename)
+    try:
+        if source is None:
+            source = fetched
+            await run_in_threadpool(storage.fetch, blob.filename, fetched)
+        values: dict[str, Any] = {}
+        async with get_slots().hold():
+            if "master" in tasks:
+                await transcode_stream(
+                    iter_file_chunks(source), encoded, OPUS_OUTPUT_ARGS
+                )
+                source = encoded
+            if "probe" in tasks:
+                probe = await probe_audio(source)
+                values.update(duration=probe.duration, codec=probe.codec)
+            if "peaks" in tasks:
+                await store_peaks(content_hash, source)
+            if "hls" in tasks:
+                duration = values.get("duration")
+                if duration is None:
+                    duration = (await probe_audio(source)).duration
+                await run_in_threadpool(delete_hls, content_hash)
+                await store_hls(content_hash, source, duration)
+            if "features" in tasks:
+                await store_features(content_hash, source)
+            if "fingerprint" in tasks:
+                await store_fingerprint(content_hash, source)
+        if "master" in tasks:
+            values.update(
+                await run_in_threadpool(_replace_master, content_hash, encoded)
+            )
+            if values["filename"] != old_filename:
+                await run_in_threadpool(storage.delete, old_filename)
+        if values:
+            with Session(engine) as session:
+                crud.update_recordings_by_hash(
+                    session=session, content_hash=content_hash, values=values
+                )
+        if "transcript" in tasks and settings.RECORDINGS_TRANSCRIPTION_ENGINE != "none":
+            # Transcribed in batches by the API's transcription worker
+            with Session(engine) as session:
+                crud.queue_recording_transcript(
+                    session=session,
+                    content_hash=content_hash,
+                    requeue=True,
+                    stale_before=stale_before(),
+                )
+    finally:
+        remove_quietly(fetched)
+        remove_quietly(encoded)
+
+
+def reprocess(content_hash: str, tasks: list[str]) -> None:
+    asyncio.run(_reprocess(content_hash, tasks))
+
+
+def _register_legacy(
+    source: Path, content_hash: str, owner_id: uuid.UUID
+) -> tuple[uuid.UUID, bool]:
+    with Session(engine) as session:
+        # Counted against the owner like an upload, never turned away
+        crud.reserve_recording_quota(
+            session=session, user_id=owner_id, max_count=None, max_bytes=None
+        )
+        job, needs_transcode = register_upload(
+            session=session,
+            source_path=source,
+            content_hash=content_hash,
+            owner_id=owner_id,
+        )
+        return job.id, needs_transcode
+
+
+def _date_legacy(job_id: uuid.UUID, created_at: datetime) -> None:
+    with Session(engine) as session:
+        job = session.get(RecordingJob, job_id)
+        if job is None or job.status != "done":
+            raise RuntimeError(job.error if job else "Recording job was deleted")
+        recording = session.get(Recording, job.recording_id)
+        if recording is not None:
+            # Keeps its place in listings and in the retention policy
+            recording.created_at = created_at
+            session.add(recording)
+            session.commit()
+
+
+async def _import_legacy(path: Path, owner_id: uuid.UUID) -> None:
+    created_at = datetime.fromtimestamp(path.stat().st_mtime, timezone.utc)
+    # Converted from a copy, the original stays until the recording is stored
+    source = spool_dir("incoming") / f"{uuid.uuid4()}.upload"
+    await run_in_threadpool(shutil.copyfile, path, source)
+    try:
+        content_hash = await run_in_threadpool(hash_file, source)
+        job_id, needs_transcode = await run_in_threadpool(
+            _register_legacy, source, content_hash, owner_id
+        )
+    except BaseException:
+        remove_quietly(source)
+        raise
+    if needs_transcode:
+        await run_transcode_job(job_id)
+    await run_in_threadpool(_date_legacy, job_id, created_at)
+    path.unlink()
+
+
+def import_legacy(path: Path, owner_id: uuid.UUID) -> None:
+    asyncio.run(_import_legacy(path, owner_id))
+
+
+def _legacy_owner_id(email: str) -> uuid.UUID:
+    with Session(engine) as session:
+        user = crud.get_user_by_email(session=session, email=email)
+    if user is None:
+        raise ValueError(f"No user {email} to own the imported recordings")
+    return user.id
+
+
+def _load_checkpoint(path: Path) -> dict[str, Any]:
+    try:
+        checkpoint: dict[str, Any] = json.loads(path.read_text())
+    except FileNotFoundError:
+        return {"after": None, "done": 0, "imported": 0, "failed": []}
+    checkpoint.setdefault("imported", 0)
+    return checkpoint
+
+
+def _save_checkpoint(path: Path, checkpoint: dict[str, Any]) -> None:
+    # Written next to the old one and renamed, a crash never leaves half a file
+    partial = path.with_name(path.name + ".part")
+    partial.write_text(json.dumps(checkpoint))
+    os.replace(partial, path)
+
+
+def backfill(
+    tasks: list[str],
+    *,
+    checkpoint_path: Path,
+    workers: int | None = None,
+    rate: float | None = None,
+    batch_size: int = 100,
+    niceness: int = 10,
+    legacy_owner: str | None = None,
+) -> dict[str, Any]:
+    """
+    Run ``tasks`` over every stored recording after the checkpoint.
+
+    With a ``legacy_owner`` email, recordings left in the flat layout of
+    RECORDINGS_DIR are first imported as that user's recordings, through the
+    same conversion as an upload, and their files removed once stored.
+
+    Progress is saved after every batch so an interrupted run resumes where
+    it stopped. Workers run niced, ``rate`` caps how many recordings start
+    per second, and conversions take the same node-wide transcode slots as
+    the API, so a backfill can run beside live uploads.
+    """
+    checkpoint = _load_checkpoint(checkpoint_path)
+    interval = 1 / rate if rate else 0.0
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(niceness,)
+    ) as pool:
+        legacy = sorted(settings.RECORDINGS_DIR.glob(LEGACY_PATTERN))
+        if legacy_owner is not None and legacy:
+            owner_id = _legacy_owner_id(legacy_owner)
+            imports: dict[Path, Future[None]] = {}
+            for path in legacy:
+                imports[path] = pool.submit(import_legacy, path, owner_id)
+                time.sleep(interval)
+            for path, future in imports.items():
+                try:
+                    future.result()
+                except Exception:
+                    # Left in place, the next run tries it again
+                    logger.exception("Could not import %s", path)
+                else:
+                    checkpoint["imported"] += 1
+            _save_checkpoint(checkpoint_path, checkpoint)
+            logger.info("Imported %d legacy recordings", checkpoint["imported"])
+        while True:
+            with Session(engine) as session:
+                blobs = crud.get_recording_blobs_after(
+                    session=session, after=checkpoint["after"], limit=batch_size
+                )
+            if not blobs:
+                break
+            futures = {}
+            for blob in blobs:
+                futures[blob.content_hash] = pool.submit(
+                    reprocess, blob.content_hash, tasks
+                )
+                time.sleep(interval)
+            for content_hash, future in futures.items():
+                try:
+                    future.result()
+                except Exception:
+                    logger.exception("Could not reprocess %s", content_hash)
+                    checkpoint["failed"].append(content_hash)
+            checkpoint["after"] = blobs[-1].content_hash
+            checkpoint["done"] += len(blobs)
+            _save_checkpoint(checkpoint_path, checkpoint)
+            logger.info(
+                "Reprocessed %d recordings, %d failed",
+                checkpoint["done"],
+                len(checkpoint["failed"]),
+            )
+    return checkpoint
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Reprocess stored recordings, e.g. after codec settings change"
+    )
+    parser.add_argument(
+        "--tasks",
+        nargs="+",
+        choices=TASKS,
+        default=list(DEFAULT_TASKS),
+        help="everything but master by default, it re-encodes the lossy master",
+    )
+    parser.add_argument(
+        "--legacy-owner",
+        default=settings.FIRST_SUPERUSER,
+        help=f"user the {LEGACY_PATTERN} files of the old flat layout are imported for",
+    )
+    parser.add_argument("--workers", type=int, help="defaults to the CPU count")
+    parser.add_argument("--rate", type=float, help="recordings started per second")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--nice", type=int, default=10)
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        default=settings.RECORDINGS_DIR / "backfill.json",
+    )
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    args = parser.parse_args()
+    if args.restart:
+        remove_quietly(args.checkpoint)
+    logger.info("Reprocessing recordings: %s", ", ".join(args.tasks))
+    checkpoint = backfill(
+        args.tasks,
+        checkpoint_path=args.checkpoint,
+        workers=args.workers,
+        rate=args.rate,
+        batch_size=args.batch_size,
+        niceness=args.nice,
+        legacy_owner=args.legacy_owner,
+    )
+    logger.info(
+        "Finished, %d recordings imported, %d reprocessed, failed: %s",
+        checkpoint["imported"],
+        checkpoint["done"],
+        checkpoint["failed"],
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+import httpx
+import numpy as np
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from app.core import security
+from app.core.config import settings
+from app.core.db import engine
+from app.main import app
+from app.models import Recording, RecordingJob, User
+from app.recordings.lifecycle import delete_recording
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ENCODERS = ("fake", "real")
+# Copies its input and reports a fixed probe, so only the server's own work
+# is measured and runs are comparable between machines
+FAKE_FFMPEG = "#!/bin/sh\nexec cat\n"
+FAKE_FFPROBE = (
+    "#!/bin/sh\n"
+    'echo \'{"format": {"duration": "1.0"}, "streams": [{"codec_name": "pcm_s16le"}]}\'\n'
+)
+
+SAMPLE_RATE = 16000
+JOB_POLL_SECONDS = 0.02
+# Wakeups later than this count as the event loop being blocked
+LOOP_MONITOR_SECONDS = 0.005
+LOOP_BLOCKED_SECONDS = 0.002
+RSS_SAMPLE_SECONDS = 0.01
+
+SIZE_UNITS = {"K": 1024, "M": 1024 * 1024}
+
+
+def parse_size(value: str) -> int:
+    unit = SIZE_UNITS.get(value[-1:].upper())
+    if unit is None:
+        return int(value)
+    return int(value[:-1]) * unit
+
+
+def make_wav(size: int, seed: int) -> bytes:
+    """
+    A mono 16 bit WAV of about ``size`` bytes: a tone in noise, different
+    for every seed so uploads are never deduplicated.
+    """
+    rng = np.random.default_rng(seed)
+    count = max(size - 44, 2) // 2
+    t = np.arange(count) / SAMPLE_RATE
+    signal = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(count)
+    samples = (np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes()
+    header = b"".join(
+        [
+            b"RIFF",
+            (36 + len(samples)).to_bytes(4, "little"),
+            b"WAVEfmt ",
+            (16).to_bytes(4, "little"),
+            (1).to_bytes(2, "little"),  # PCM
+            (1).to_bytes(2, "little"),  # mono
+            SAMPLE_RATE.to_bytes(4, "little"),
+            (SAMPLE_RATE * 2).to_bytes(4, "little"),
+            (2).to_bytes(2, "little"),
+            (16).to_bytes(2, "little"),
+            b"data",
+            len(samples).to_bytes(4, "little"),
+        ]
+    )
+    return header + samples
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Only the high-water mark of the whole run, in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """
+    Peak resident memory of this process while it is used, sampled from a
+    thread. The ffmpeg processes are not included.
+    """
+
+    def __init__(self) -> None:
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while True:
+            self.peak = max(self.peak, _rss_bytes())
+            if self._stop.wait(RSS_SAMPLE_SECONDS):
+                return
+
+    def __enter__(self) -> "RssSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+class LoopMonitor:
+    """
+    How long the event loop was blocked, from how late a periodic wakeup
+    runs. Blocking calls on the loop delay every other request by as much.
+    """
+
+    def __init__(self) -> None:
+        self.blocked = 0.0
+        self.max_lag = 0.0
+        self._task: asyncio.Task[None] | None = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LOOP_MONITOR_SECONDS)
+            lag = loop.time() - start - LOOP_MONITOR_SECONDS
+            self.max_lag = max(self.max_lag, lag)
+            if lag > LOOP_BLOCKED_SECONDS:
+                self.blocked += lag
+
+    async def __aenter__(self) -> "LoopMonitor":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        assert self._task is not None
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+@contextmanager
+def encoder(name: str) -> Iterator[None]:
+    """
+    Point the recordings settings at the fake or the configured ffmpeg.
+    """
+    if name == "real":
+        yield
+        return
+    saved = settings.RECORDINGS_FFMPEG_PATH, settings.RECORDINGS_FFPROBE_PATH
+    with tempfile.TemporaryDirectory() as directory:
+        for script, content in (("ffmpeg", FAKE_FFMPEG), ("ffprobe", FAKE_FFPROBE)):
+            path = Path(directory) / script
+            path.write_text(content)
+            path.chmod(0o755)
+        settings.RECORDINGS_FFMPEG_PATH = str(Path(directory) / "ffmpeg")
+        settings.RECORDINGS_FFPROBE_PATH = str(Path(directory) / "ffprobe")
+        try:
+            yield
+        finally:
+            settings.RECORDINGS_FFMPEG_PATH, settings.RECORDINGS_FFPROBE_PATH = saved
+
+
+def _auth_headers() -> dict[str, str]:
+    # The first superuser is not held to recording quotas
+    with Session(engine) as session:
+        user = session.exec(
+            select(User).where(User.email == settings.FIRST_SUPERUSER)
+        ).first()
+    if user is None:
+        raise SystemExit(f"{settings.FIRST_SUPERUSER} does not exist, run prestart")
+    token = security.create_access_token(user.id, timedelta(hours=1))
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def _upload(client: httpx.AsyncClient, data: bytes) -> dict[str, Any]:
+    start = time.perf_counter()
+    r = await client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("benchmark.wav", data, "audio/wav")},
+    )
+    accepted = time.perf_counter() - start
+    if r.status_code not in (200, 202):
+        return {"status": r.status_code}
+    job = r.json()
+    while job["status"] not in ("done", "failed"):
+        await asyncio.sleep(JOB_POLL_SECONDS)
+        r = await client.get(f"{settings.API_V1_STR}/recordings/jobs/{job['id']}")
+        job = r.json()
+    return {
+        "status": job["status"],
+        "accepted": accepted,
+        "finished": time.perf_counter() - start,
+        "job_id": job["id"],
+        "recording_id": job["recording_id"],
+    }
+
+
+def _percentiles(values: list[float]) -> dict[str, float | None]:
+    if not values:
+        return {"p50": None, "p99": None}
+    p50, p99 = np.percentile(values, [50, 99])
+    return {"p50": float(p50), "p99": float(p99)}
+
+
+def _cleanup(results: list[dict[str, Any]]) -> None:
+    # Leaves the database and storage as they were before the scenario
+    with Session(engine) as session:
+        for result in results:
+            if result.get("recording_id"):
+                recording = session.get(Recording, uuid.UUID(result["recording_id"]))
+                if recording is not None:
+                    delete_recording(session, recording)
+            if result.get("job_id"):
+                job = session.get(RecordingJob, uuid.UUID(result["job_id"]))
+                if job is not None:
+                    session.delete(job)
+        session.commit()
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, *, size: int, concurrency: int, uploads: int
+) -> dict[str, Any]:
+    """
+    Upload ``uploads`` files of ``size`` bytes, ``concurrency`` at a time, and
+    wait for every job to finish.
+    """
+    # Seeded per run too, so repeated runs are not deduplicated either
+    base = uuid.uuid4().int
+    payloads = [make_wav(size, base + i) for i in range(uploads)]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def upload(data: bytes) -> dict[str, Any]:
+        async with semaphore:
+            return await _upload(client, data)
+
+    with RssSampler() as rss:
+        async with LoopMonitor() as loop:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(upload(p) for p in payloads))
+            elapsed = time.perf_counter() - start
+    await run_in_threadpool(_cleanup, results)
+    done = [r for r in results if r["status"] == "done"]
+    return {
+        "size_bytes": len(payloads[0]),
+        "concurrency": concurrency,
+        "uploads": uploads,
+        "done": len(done),
+        "failed": sum(r["status"] == "failed" for r in results),
+        # Refused before conversion, e.g. 429 while the backlog is full
+        "rejected": sum(isinstance(r["status"], int) for r in results),
+        "seconds": elapsed,
+        "uploads_per_second": len(done) / elapsed,
+        "bytes_per_second": len(done) * len(payloads[0]) / elapsed,
+        "accept_latency_seconds": _percentiles([r["accepted"] for r in done]),
+        "finish_latency_seconds": _percentiles([r["finished"] for r in done]),
+        "peak_rss_bytes": rss.peak,
+        "loop_blocked_seconds": loop.blocked,
+        "loop_max_lag_seconds": loop.max_lag,
+    }
+
+
+@asynccontextmanager
+async def benchmark_client() -> AsyncIterator[httpx.AsyncClient]:
+    """
+    A client talking to the app in this process, with its workers running.
+    """
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://benchmark",
+            headers=await run_in_threadpool(_auth_headers),
+            timeout=None,
+        ) as client:
+            yield client
+
+
+async def run_benchmark(
+    *,
+    encoders: list[str],
+    sizes: list[int],
+    concurrencies: list[int],
+    uploads: int,
+) -> dict[str, Any]:
+    results = []
+    async with benchmark_client() as client:
+        for name in encoders:
+            with encoder(name):
+                for size in sizes:
+                    for concurrency in concurrencies:
+                        logger.info(
+                            "%s encoder, %d bytes, %d concurrent",
+                            name,
+                            size,
+                            concurrency,
+                        )
+                        result = await run_scenario(
+                            client,
+                            size=size,
+                            concurrency=concurrency,
+                            uploads=uploads,
+                        )
+                        results.append({"encoder": name, **result})
+    return {
+        "benchmark": "recordings-ingest",
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {
+            "transcode_workers": settings.RECORDINGS_TRANSCODE_WORKERS,
+            "transcode_concurrency": settings.RECORDINGS_TRANSCODE_CONCURRENCY,
+            "transcode_queue_limit": settings.RECORDINGS_TRANSCODE_QUEUE_LIMIT,
+            "trim_silence": settings.RECORDINGS_TRIM_SILENCE,
+            "features": settings.RECORDINGS_FEATURES,
+            "hls": settings.RECORDINGS_HLS,
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark recording uploads through the API, in process"
+    )
+    parser.add_argument(
+        "--encoders", nargs="+", choices=ENCODERS, default=list(ENCODERS)
+    )
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        type=parse_size,
+        default=[parse_size(s) for s in ("64K", "1M", "8M")],
+        help="upload sizes, e.g. 64K 1M",
+    )
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--uploads", type=int, default=32, help="per scenario")
+    parser.add_argument("--output", type=Path, help="JSON results, stdout if unset")
+    args = parser.parse_args()
+    if "real" in args.encoders and not shutil.which(settings.RECORDINGS_FFMPEG_PATH):
+        parser.error(
+            f"{settings.RECORDINGS_FFMPEG_PATH} not found, use --encoders fake"
+        )
+    report = asyncio.run(
+        run_benchmark(
+            encoders=args.encoders,
+            sizes=args.sizes,
+            concurrencies=args.concurrency,
+            uploads=args.uploads,
+        )
+    )
+    output = json.dumps(report, indent=2)
+    if args.output is None:
+        sys.stdout.write(output + "\n")
+    else:
+        args.output.write_text(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import secrets
 import warnings
+from pathlib import Path
 from typing import Annotated, Any, Literal
 
 from pydantic import (
@@ -94,6 +95,119 @@ class Settings(BaseSettings):
     FIRST_SUPERUSER: EmailStr
     FIRST_SUPERUSER_PASSWORD: str
 
+    RECORDINGS_DIR: Path = Path("recordings")
+    # Hard cap on a single recording upload, enforced while the body streams in
+    RECORDINGS_MAX_UPLOAD_BYTES: int = 200 * 1024 * 1024
+    # Files in one batch upload, each up to RECORDINGS_MAX_UPLOAD_BYTES
+    RECORDINGS_BATCH_MAX_FILES: int = 100
+    RECORDINGS_FFMPEG_PATH: str = "ffmpeg"
+    RECORDINGS_FFPROBE_PATH: str = "ffprobe"
+    # ffmpeg and ffprobe are killed after this long. Live recordings are not,
+    # they last as long as the stream. None lets them run forever.
+    RECORDINGS_FFMPEG_TIMEOUT_SECONDS: float | None = 1800
+    # Added to their nice value, so API requests win the CPU over encodes
+    RECORDINGS_FFMPEG_NICE: int = 10
+    # Threads each ffmpeg decodes and encodes with, None lets it use every core
+    RECORDINGS_FFMPEG_THREADS: int | None = 2
+    # Address space each process may map, allocations past it fail
+    RECORDINGS_FFMPEG_MAX_MEMORY_BYTES: int | None = 2 * 1024 * 1024 * 1024
+    # Bearer token Prometheus scrapes the ffmpeg metrics with, they are not
+    # served while it is unset
+    RECORDINGS_METRICS_TOKEN: str | None = None
+    # When set, audio downloads answer with an X-Accel-Redirect to this internal
+    # location and the nginx in front of the API streams the file itself
+    RECORDINGS_ACCEL_REDIRECT_PREFIX: str | None = None
+    # Resumable uploads that see no new chunk for this long are discarded
+    RECORDINGS_UPLOAD_EXPIRE_HOURS: int = 24
+    # Resumable uploads, and direct uploads to local storage, each user may
+    # have started and not completed at once. Their bytes only count towards
+    # the quota once completed. None for no limit, superusers are exempt.
+    RECORDINGS_USER_MAX_OPEN_UPLOADS: int | None = 10
+    # How long the URL of a direct upload to the storage backend stays valid
+    RECORDINGS_DIRECT_UPLOAD_EXPIRE_SECONDS: int = 3600
+    # Background tasks per API process that drain the transcode queue
+    RECORDINGS_TRANSCODE_WORKERS: int = 2
+    # ffmpeg conversions running at once on a node, across all API processes
+    RECORDINGS_TRANSCODE_CONCURRENCY: int = 2
+    # Uploads are refused with a 429 while this many jobs wait for conversion
+    RECORDINGS_TRANSCODE_QUEUE_LIMIT: int = 32
+    # Live recordings encoding at once on a node. They hold an encoder for as
+    # long as the stream lasts, so they have their own slots and do not starve
+    # the conversion of uploads. More are refused with a 429.
+    RECORDINGS_LIVE_CONCURRENCY: int = 8
+    # Workers refresh the heartbeat of the jobs and transcripts they run this
+    # often. Work whose heartbeat is older than RECORDINGS_JOB_STALE_SECONDS
+    # was left by a process that died: jobs are failed and transcripts queued
+    # again when a worker process starts.
+    RECORDINGS_JOB_HEARTBEAT_SECONDS: float = 30
+    RECORDINGS_JOB_STALE_SECONDS: float = 300
+    # Masters of recordings at least this long are encoded in segments split
+    # at pauses, on as many free transcode slots as there are, and joined
+    # without re-encoding. None encodes every recording in one piece.
+    RECORDINGS_PARALLEL_MIN_SECONDS: float | None = 600
+    RECORDINGS_PARALLEL_SEGMENT_SECONDS: float = 120
+    # Drop leading and trailing silence before the master is encoded, and
+    # shorten pauses longer than RECORDINGS_MAX_PAUSE_SECONDS when it is set
+    RECORDINGS_TRIM_SILENCE: bool = True
+    RECORDINGS_MAX_PAUSE_SECONDS: float | None = None
+    # Formats converted from the Opus master on first download are kept in a
+    # least recently used cache on the local disk, bounded to this size
+    RECORDINGS_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    # Where finished recordings are kept. "local" shards them under
+    # RECORDINGS_DIR, "s3" puts them in any S3 compatible bucket (AWS, MinIO)
+    RECORDINGS_STORAGE_BACKEND: Literal["local", "s3"] = "local"
+    RECORDINGS_S3_ENDPOINT_URL: str | None = None
+    RECORDINGS_S3_BUCKET: str | None = None
+    RECORDINGS_S3_REGION: str = "us-east-1"
+    RECORDINGS_S3_ACCESS_KEY_ID: str = ""
+    RECORDINGS_S3_SECRET_ACCESS_KEY: str = ""
+    # Per user quotas on stored recordings, None for no limit. Superusers are
+    # not held to them.
+    RECORDINGS_USER_MAX_COUNT: int | None = 1000
+    RECORDINGS_USER_MAX_BYTES: int | None = 5 * 1024 * 1024 * 1024
+    # Long recordings are also packaged as HLS, short AAC segments and a
+    # playlist, so players start at once and only fetch what is listened to
+    RECORDINGS_HLS: bool = False
+    RECORDINGS_HLS_MIN_SECONDS: float = 600
+    RECORDINGS_HLS_SEGMENT_SECONDS: int = 6
+    # Analytics features are extracted from every new recording into a
+    # columnar store, RECORDINGS_DIR/features unless set. Use a shared
+    # volume when several nodes ingest recordings.
+    RECORDINGS_FEATURES: bool = True
+    RECORDINGS_FEATURES_DIR: Path | None = None
+    # Every new recording is also fingerprinted, so re-encoded or trimmed
+    # copies of the same audio can be found
+    RECORDINGS_FINGERPRINTS: bool = True
+    # Speech to text after ingest. "whisper" runs faster-whisper on the CPU
+    # (installed separately), "stub" writes placeholder text for development
+    # and tests. Queued recordings are transcribed up to
+    # RECORDINGS_TRANSCRIPTION_BATCH_SIZE per engine call, and the model stays
+    # loaded between calls.
+    RECORDINGS_TRANSCRIPTION_ENGINE: Literal["none", "stub", "whisper"] = "none"
+    RECORDINGS_TRANSCRIPTION_MODEL: str = "small"
+    # Detected per recording when not set
+    RECORDINGS_TRANSCRIPTION_LANGUAGE: str | None = None
+    RECORDINGS_TRANSCRIPTION_BATCH_SIZE: int = 8
+    # Recordings not played for this long are re-encoded to a small Opus file
+    # and moved to the archive, a separate directory (e.g. a cheaper disk) or
+    # an infrequent access storage class. They are restored when played.
+    RECORDINGS_ARCHIVE_AFTER_DAYS: int | None = 90
+    RECORDINGS_ARCHIVE_DIR: Path = Path("recordings-archive")
+    RECORDINGS_S3_ARCHIVE_STORAGE_CLASS: str = "STANDARD_IA"
+    # Recordings older than this are deleted, kept forever when unset
+    RECORDINGS_RETENTION_DAYS: int | None = None
+
+    @model_validator(mode="after")
+    def _check_recordings_storage(self) -> Self:
+        if self.RECORDINGS_STORAGE_BACKEND == "s3" and not (
+            self.RECORDINGS_S3_ENDPOINT_URL and self.RECORDINGS_S3_BUCKET
+        ):
+            raise ValueError(
+                "RECORDINGS_S3_ENDPOINT_URL and RECORDINGS_S3_BUCKET are required "
+                "when RECORDINGS_STORAGE_BACKEND is s3"
+            )
+        return self
+
     def _check_default_secret(self, var_name: str, value: str | None) -> None:
         if value == "changethis":
             message = (
@@ -1,10 +1,26 @@
 import uuid
+from datetime import datetime
 from typing import Any
 
-from sqlmodel import Session, select
+from sqlalchemy import insert, literal, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, col, delete, func, or_, select, update
 
 from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
+from app.models import (
+    Item,
+    ItemCreate,
+    Recording,
+    RecordingBlob,
+    RecordingFingerprint,
+    RecordingFingerprintHash,
+    RecordingJob,
+    RecordingTranscript,
+    User,
+    UserCreate,
+    UserUpdate,
+    utcnow,
+)
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
@@ -52,3 +68,718 @@ def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -
     session.commit()
     session.refresh(db_item)
     return db_item
+
+
+def create_recording_job(
+    *,
+    session: Session,
+    source_path: str,
+    content_hash: str | None = None,
+    status: str = "queued",
+    filename: str | None = None,
+    recording_id: uuid.UUID | None = None,
+    owner_id: uuid.UUID | None = None,
+    source_key: str | None = None,
+) -> RecordingJob:
+    db_job = RecordingJob(
+        source_path=source_path,
+        source_key=source_key,
+        content_hash=content_hash,
+        status=status,
+        filename=filename,
+        recording_id=recording_id,
+        owner_id=owner_id,
+    )
+    if status == "running":
+        db_job.started_at = db_job.heartbeat_at = db_job.created_at
+    if status == "done":
+        db_job.finished_at = db_job.created_at
+    session.add(db_job)
+    session.commit()
+    session.refresh(db_job)
+    return db_job
+
+
+def claim_recording_job(*, session: Session, job_id: uuid.UUID) -> RecordingJob | None:
+    # Compare-and-set on the status, so a job is only ever run by one worker
+    now = utcnow()
+    statement = (
+        update(RecordingJob)
+        .where(col(RecordingJob.id) == job_id)
+        .where(col(RecordingJob.status) == "queued")
+        .values(status="running", started_at=now, heartbeat_at=now)
+    )
+    result = session.exec(statement)  # type: ignore[call-overload]
+    session.commit()
+    if result.rowcount != 1:
+        return None
+    return session.get(RecordingJob, job_id)
+
+
+def requeue_recording_job(*, session: Session, job_id: uuid.UUID) -> None:
+    statement = (
+        update(RecordingJob)
+        .where(col(RecordingJob.id) == job_id)
+        .where(col(RecordingJob.status) == "running")
+        .values(status="queued", started_at=None, heartbeat_at=None)
+    )
+    session.exec(statement)  # type: ignore[call-overload]
+    session.commit()
+
+
+def beat_recording_job(*, session: Session, job_id: uuid.UUID) -> None:
+    statement = (
+        update(RecordingJob)
+        .where(col(RecordingJob.id) == job_id)
+        .where(col(RecordingJob.status) == "running")
+        .values(heartbeat_at=utcnow())
+    )
+    session.exec(statement)  # type: ignore[call-overload]
+    session.commit()
+
+
+def finish_recording_job(
+    *,
+    session: Session,
+    db_job: RecordingJob,
+    filename: str | None = None,
+    recording_id: uuid.UUID | None = None,
+    error: str | None = None,
+) -> RecordingJob | None:
+    """
+    Mark a running job done, or failed with ``error``, together with whatever
+    else is pending in the session.
+
+    Returns None and rolls the session back when the job is not running any
+    more, e.g. it was failed as abandoned meanwhile.
+    """
+    # Compare-and-set like claim_recording_job, a job only ever ends once
+    statement = (
+        update(RecordingJob)
+        .where(col(RecordingJob.id) == db_job.id)
+        .where(col(RecordingJob.status) == "running")
+        .values(
+            status="failed" if error else "done",
+            # Only known once the stream ended for live recordings
+            content_hash=db_job.content_hash,
+            filename=filename,
+            recording_id=recording_id,
+            error=error[:1024] if error else None,
+            finished_at=utcnow(),
+        )
+    )
+    result = session.exec(statement)  # type: ignore[call-overload]
+    if result.rowcount != 1:
+        session.rollback()
+        return None
+    session.commit()
+    return session.get(RecordingJob, db_job.id)
+
+
+def get_active_recording_job(
+    *, session: Session, content_hash: str, owner_id: uuid.UUID | None
+) -> RecordingJob | None:
+    owner = col(RecordingJob.owner_id)
+    statement = select(RecordingJob).where(
+        RecordingJob.content_hash == content_hash,
+        col(RecordingJob.status).in_(("queued", "running")),
+        owner.is_(None) if owner_id is None else owner == owner_id,
+    )
+    return session.exec(statement).first()
+
+
+def get_active_direct_recording_job(
+    *, session: Session, source_key: str
+) -> RecordingJob | None:
+    statement = select(RecordingJob).where(
+        RecordingJob.source_key == source_key,
+        col(RecordingJob.status).in_(("queued", "running")),
+    )
+    return session.exec(statement).first()
+
+
+def fail_stale_recording_jobs(
+    *, session: Session, beat_before: datetime, error: str
+) -> list[RecordingJob]:
+    """
+    Fail running uploads whose heartbeat stopped before ``beat_before``, left
+    behind by a worker process that died, and return them.
+    """
+    statement = select(RecordingJob.id).where(
+        RecordingJob.status == "running",
+        col(RecordingJob.heartbeat_at) < beat_before,
+        # Live recordings last as long as their stream, they have neither
+        or_(
+            col(RecordingJob.content_hash).is_not(None),
+            col(RecordingJob.source_key).is_not(None),
+        ),
+    )
+    failed = []
+    for job_id in session.exec(statement).all():
+        # Compare-and-set, the worker may finish it after all
+        result = session.exec(  # type: ignore[call-overload]
+            update(RecordingJob)
+            .where(col(RecordingJob.id) == job_id)
+            .where(col(RecordingJob.status) == "running")
+            .values(status="failed", error=error, finished_at=utcnow())
+        )
+        if result.rowcount == 1:
+            failed.append(job_id)
+    session.commit()
+    return [job for job_id in failed if (job := session.get(RecordingJob, job_id))]
+
+
+def count_recording_jobs(*, session: Session, status: str) -> int:
+    statement = (
+        select(func.count())
+        .select_from(RecordingJob)
+        .where(RecordingJob.status == status)
+    )
+    return session.exec(statement).one()
+
+
+def get_recent_recording_job_durations(*, session: Session, limit: int) -> list[float]:
+    """
+    Seconds the last ``limit`` conversions took, newest first.
+    """
+    statement = (
+        select(RecordingJob.started_at, RecordingJob.finished_at)
+        .where(
+            RecordingJob.status == "done",
+            col(RecordingJob.started_at).is_not(None),
+            col(RecordingJob.finished_at).is_not(None),
+        )
+        .order_by(col(RecordingJob.finished_at).desc())
+        .limit(limit)
+    )
+    return [
+        (finished_at - started_at).total_seconds()
+        for started_at, finished_at in session.exec(statement)
+        if started_at is not None and finished_at is not None
+    ]
+
+
+def acquire_recording_blob(
+    *, session: Session, content_hash: str
+) -> RecordingBlob | None:
+    # Atomic increment, returns None when nothing is stored under this hash yet
+    statement = (
+        update(RecordingBlob)
+        .where(col(RecordingBlob.content_hash) == content_hash)
+        .values(ref_count=col(RecordingBlob.ref_count) + 1)
+    )
+    result = session.exec(statement)  # type: ignore[call-overload]
+    session.commit()
+    if result.rowcount != 1:
+        return None
+    return session.get(RecordingBlob, content_hash)
+
+
+def create_recording_blob(
+    *, session: Session, content_hash: str, filename: str, byte_size: int
+) -> RecordingBlob:
+    db_blob = RecordingBlob(
+        content_hash=content_hash, filename=filename, byte_size=byte_size
+    )
+    session.add(db_blob)
+    try:
+        session.commit()
+    except IntegrityError:
+        # The same bytes finished transcoding elsewhere first, share that copy
+        session.rollback()
+        existing = acquire_recording_blob(session=session, content_hash=content_hash)
+        assert existing is not None
+        return existing
+    session.refresh(db_blob)
+    return db_blob
+
+
+def release_recording_blob(
+    *, session: Session, content_hash: str
+) -> RecordingBlob | None:
+    """
+    Drop one reference, returns the blob when it was the last one so the
+    caller can remove the file.
+    """
+    # Row lock so concurrent releases cannot both see the last reference
+    db_blob = session.get(RecordingBlob, content_hash, with_for_update=True)
+    if db_blob is None:
+        return None
+    db_blob.ref_count -= 1
+    if db_blob.ref_count > 0:
+        session.add(db_blob)
+        session.commit()
+        return None
+    session.delete(db_blob)
+    _delete_recording_fingerprint(session, content_hash)
+    session.exec(  # type: ignore[call-overload]
+        delete(RecordingTranscript).where(
+            col(RecordingTranscript.content_hash) == content_hash
+        )
+    )
+    session.commit()
+    return db_blob
+
+
+def reserve_recording_quota(
+    *,
+    session: Session,
+    user_id: uuid.UUID,
+    max_count: int | None,
+    max_bytes: int | None,
+) -> bool:
+    """
+    Count an upload against the user's quota before it is converted, False
+    when the user is already at a limit.
+    """
+    # Checked and incremented in one statement, so concurrent uploads cannot
+    # both take the last slot
+    statement = (
+        update(User)
+        .where(col(User.id) == user_id)
+        .values(recording_count=User.recording_count + 1)
+    )
+    if max_count is not None:
+        statement = statement.where(col(User.recording_count) < max_count)
+    if max_bytes is not None:
+        statement = statement.where(col(User.recording_bytes) < max_bytes)
+    result = session.exec(statement)  # type: ignore[call-overload]
+    session.commit()
+    return bool(result.rowcount == 1)
+
+
+def _add_to_quota(
+    session: Session, user_id: uuid.UUID, *, count: int, byte_size: int
+) -> None:
+    # Not committed, the caller commits it with the change it accounts for
+    statement = (
+        update(User)
+        .where(col(User.id) == user_id)
+        .values(
+            recording_count=User.recording_count + count,
+            recording_bytes=User.recording_bytes + byte_size,
+        )
+    )
+    session.exec(statement)  # type: ignore[call-overload]
+
+
+def release_recording_quota(
+    *, session: Session, user_id: uuid.UUID, commit: bool = True
+) -> None:
+    """
+    Give back a reservation for an upload that did not become a recording.
+    """
+    _add_to_quota(session, user_id, count=-1, byte_size=0)
+    if commit:
+        session.commit()
+
+
+def create_recording(
+    *,
+    session: Session,
+    blob: RecordingBlob,
+    duration: float | None,
+    codec: str | None,
+    speech_segments: list[tuple[float, float]] | None = None,
+    owner_id: uuid.UUID | None = None,
+    quota_reserved: bool = False,
+    commit: bool = True,
+) -> Recording:
+    """
+    Create a recording and account for it in the owner's quota, on top of a
+    reservation when ``quota_reserved``. Without ``commit`` it is left pending
+    in the session, for the caller to commit along with something else.
+    """
+    db_recording = Recording(
+        filename=blob.filename,
+        content_hash=blob.content_hash,
+        byte_size=blob.byte_size,
+        duration=duration,
+        codec=codec,
+        speech_segments=speech_segments,
+        owner_id=owner_id,
+    )
+    session.add(db_recording)
+    if owner_id is not None:
+        _add_to_quota(
+            session,
+            owner_id,
+            count=0 if quota_reserved else 1,
+            byte_size=blob.byte_size,
+        )
+    if commit:
+        session.commit()
+        session.refresh(db_recording)
+    return db_recording
+
+
+def delete_recording(*, session: Session, db_recording: Recording) -> None:
+    session.delete(db_recording)
+    if db_recording.owner_id is not None:
+        _add_to_quota(
+            session,
+            db_recording.owner_id,
+            count=-1,
+            byte_size=-db_recording.byte_size,
+        )
+    session.commit()
+
+
+def get_recording_by_hash(*, session: Session, content_hash: str) -> Recording | None:
+    statement = select(Recording).where(Recording.content_hash == content_hash)
+    return session.exec(statement).first()
+
+
+def get_recording_blobs_after(
+    *, session: Session, after: str | None, limit: int
+) -> list[RecordingBlob]:
+    """
+    Stored files in content hash order, for walks that resume from a hash.
+    """
+    statement = select(RecordingBlob).order_by(col(RecordingBlob.content_hash))
+    if after is not None:
+        statement = statement.where(col(RecordingBlob.content_hash) > after)
+    return list(session.exec(statement.limit(limit)).all())
+
+
+def update_recordings_by_hash(
+    *, session: Session, content_hash: str, values: dict[str, Any]
+) -> None:
+    if "byte_size" in values:
+        # Owners' quotas follow the size, e.g. when the file is archived
+        owned = session.exec(
+            select(Recording.owner_id, Recording.byte_size).where(
+                Recording.content_hash == content_hash,
+                col(Recording.owner_id).is_not(None),
+            )
+        ).all()
+        for owner_id, byte_size in owned:
+            assert owner_id is not None
+            _add_to_quota(
+                session, owner_id, count=0, byte_size=values["byte_size"] - byte_size
+            )
+    statement = (
+        update(Recording)
+        .where(col(Recording.content_hash) == content_hash)
+        .values(**values)
+    )
+    session.exec(statement)  # type: ignore[call-overload]
+    session.commit()
+
+
+def claim_recording_blob_tier(
+    *, session: Session, content_hash: str, from_tier: str, to_tier: str
+) -> bool:
+    # Compare-and-set like claim_recording_job, one worker moves a file at a time
+    statement = (
+        update(RecordingBlob)
+        .where(col(RecordingBlob.content_hash) == content_hash)
+        .where(col(RecordingBlob.tier) == from_tier)
+        .values(tier=to_tier)
+    )
+    result = session.exec(statement)  # type: ignore[call-overload]
+    session.commit()
+    return bool(result.rowcount == 1)
+
+
+def touch_recording_blob(
+    *, session: Session, content_hash: str, accessed_at: datetime, stale: datetime
+) -> None:
+    # Only written when the stored time is older than ``stale``
+    statement = (
+        update(RecordingBlob)
+        .where(col(RecordingBlob.content_hash) == content_hash)
+        .where(col(RecordingBlob.accessed_at) < stale)
+        .values(accessed_at=accessed_at)
+    )
+    session.exec(statement)  # type: ignore[call-overload]
+    session.commit()
+
+
+def get_recording_blobs_to_archive(
+    *,
+    session: Session,
+    accessed_before: datetime,
+    after: tuple[datetime, str] | None,
+    limit: int,
+) -> list[RecordingBlob]:
+    """
+    Hot files not accessed since ``accessed_before``, least recent first,
+    resuming after ``(accessed_at, content_hash)``.
+    """
+    statement = select(RecordingBlob).where(
+        RecordingBlob.tier == "hot",
+        col(RecordingBlob.accessed_at) < accessed_before,
+    )
+    if after is not None:
+        statement = statement.where(
+            tuple_(col(RecordingBlob.accessed_at), col(RecordingBlob.content_hash))
+            > tuple_(literal(after[0]), literal(after[1]))
+        )
+    statement = statement.order_by(
+        col(RecordingBlob.accessed_at), col(RecordingBlob.content_hash)
+    ).limit(limit)
+    return list(session.exec(statement).all())
+
+
+def get_recordings_created_before(
+    *, session: Session, before: datetime, limit: int
+) -> list[Recording]:
+    statement = (
+        select(Recording)
+        .where(col(Recording.created_at) < before)
+        .order_by(col(Recording.created_at), col(Recording.id))
+        .limit(limit)
+    )
+    return list(session.exec(statement).all())
+
+
+def get_recording_hashes(
+    *,
+    session: Session,
+    owner_id: uuid.UUID | None = None,
+    created_after: datetime | None = None,
+    created_before: datetime | None = None,
+) -> list[str]:
+    statement = select(Recording.content_hash).distinct()
+    if owner_id is not None:
+        statement = statement.where(Recording.owner_id == owner_id)
+    if created_after is not None:
+        statement = statement.where(Recording.created_at >= created_after)
+    if created_before is not None:
+        statement = statement.where(Recording.created_at < created_before)
+    return list(session.exec(statement).all())
+
+
+def _delete_recording_fingerprint(session: Session, content_hash: str) -> None:
+    fingerprint = session.exec(
+        select(RecordingFingerprint).where(
+            RecordingFingerprint.content_hash == content_hash
+        )
+    ).first()
+    if fingerprint is None:
+        return
+    session.exec(  # type: ignore[call-overload]
+        delete(RecordingFingerprintHash).where(
+            col(RecordingFingerprintHash.fingerprint_id) == fingerprint.id
+        )
+    )
+    session.delete(fingerprint)
+
+
+def replace_recording_fingerprint(
+    *, session: Session, content_hash: str, hashes: list[int], frames: list[int]
+) -> RecordingFingerprint:
+    _delete_recording_fingerprint(session, content_hash)
+    # Deleted first, the new row takes the same content hash
+    session.flush()
+    db_fingerprint = RecordingFingerprint(
+        content_hash=content_hash, hash_count=len(hashes)
+    )
+    session.add(db_fingerprint)
+    session.flush()
+    if hashes:
+        session.exec(  # type: ignore[call-overload]
+            insert(RecordingFingerprintHash),
+            params=[
+                {"hash": hash, "fingerprint_id": db_fingerprint.id, "frame": frame}
+                for hash, frame in zip(hashes, frames, strict=True)
+            ],
+        )
+    session.commit()
+    session.refresh(db_fingerprint)
+    return db_fingerprint
+
+
+def get_recording_fingerprint(
+    *, session: Session, content_hash: str
+) -> RecordingFingerprint | None:
+    statement = select(RecordingFingerprint).where(
+        RecordingFingerprint.content_hash == content_hash
+    )
+    return session.exec(statement).first()
+
+
+def get_recording_fingerprint_hashes(
+    *, session: Session, fingerprint_id: int
+) -> list[tuple[int, int]]:
+    statement = select(
+        RecordingFingerprintHash.hash, RecordingFingerprintHash.frame
+    ).where(RecordingFingerprintHash.fingerprint_id == fingerprint_id)
+    return list(session.exec(statement).all())
+
+
+def get_recording_fingerprint_postings(
+    *, session: Session, hashes: list[int], exclude_id: int, chunk_size: int = 1000
+) -> list[tuple[int, int, int]]:
+    """
+    (hash, fingerprint id, frame) of every other fingerprint with the hashes.
+    """
+    postings: list[tuple[int, int, int]] = []
+    for start in range(0, len(hashes), chunk_size):
+        statement = select(
+            RecordingFingerprintHash.hash,
+            RecordingFingerprintHash.fingerprint_id,
+            RecordingFingerprintHash.frame,
+        ).where(
+            col(RecordingFingerprintHash.hash).in_(hashes[start : start + chunk_size]),
+            RecordingFingerprintHash.fingerprint_id != exclude_id,
+        )
+        postings.extend(session.exec(statement).all())
+    return postings
+
+
+def get_recording_fingerprints(
+    *, session: Session, ids: list[int]
+) -> list[RecordingFingerprint]:
+    statement = select(RecordingFingerprint).where(
+        col(RecordingFingerprint.id).in_(ids)
+    )
+    return list(session.exec(statement).all())
+
+
+def get_recordings_by_hashes(
+    *, session: Session, content_hashes: list[str], owner_id: uuid.UUID | None
+) -> list[Recording]:
+    statement = select(Recording).where(col(Recording.content_hash).in_(content_hashes))
+    if owner_id is not None:
+        statement = statement.where(Recording.owner_id == owner_id)
+    return list(session.exec(statement).all())
+
+
+def queue_recording_transcript(
+    *,
+    session: Session,
+    content_hash: str,
+    requeue: bool = False,
+    stale_before: datetime | None = None,
+) -> RecordingTranscript:
+    """
+    Queue a file for transcription, ``requeue`` transcribes it again when it
+    already was, or when it is running without a heartbeat since
+    ``stale_before``.
+    """
+    db_transcript = session.get(RecordingTranscript, content_hash)
+    if db_transcript is None:
+        db_transcript = RecordingTranscript(content_hash=content_hash)
+    elif requeue and db_transcript.status in ("done", "failed"):
+        db_transcript.status = "queued"
+        db_transcript.updated_at = utcnow()
+    elif requeue and db_transcript.status == "running" and stale_before is not None:
+        # Compared in the database, the worker may still beat meanwhile
+        session.exec(  # type: ignore[call-overload]
+            update(RecordingTranscript)
+            .where(col(RecordingTranscript.content_hash) == content_hash)
+            .where(col(RecordingTranscript.status) == "running")
+            .where(col(RecordingTranscript.updated_at) < stale_before)
+            .values(status="queued", updated_at=utcnow())
+            # Refreshed below instead
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        session.refresh(db_transcript)
+        return db_transcript
+    else:
+        return db_transcript
+    session.add(db_transcript)
+    session.commit()
+    session.refresh(db_transcript)
+    return db_transcript
+
+
+def get_recording_transcript(
+    *, session: Session, content_hash: str
+) -> RecordingTranscript | None:
+    return session.get(RecordingTranscript, content_hash)
+
+
+def claim_recording_transcripts(*, session: Session, limit: int) -> list[str]:
+    """
+    Content hashes of up to ``limit`` of the oldest queued transcripts, now
+    running in this worker.
+    """
+    statement = (
+        select(RecordingTranscript.content_hash)
+        .where(RecordingTranscript.status == "queued")
+        .order_by(col(RecordingTranscript.created_at))
+        .limit(limit)
+    )
+    claimed = []
+    for content_hash in session.exec(statement).all():
+        # Compare-and-set like jobs, other workers may claim the same rows
+        result = session.exec(  # type: ignore[call-overload]
+            update(RecordingTranscript)
+            .where(col(RecordingTranscript.content_hash) == content_hash)
+            .where(col(RecordingTranscript.status) == "queued")
+            .values(status="running", updated_at=utcnow())
+        )
+        if result.rowcount == 1:
+            claimed.append(content_hash)
+    session.commit()
+    return claimed
+
+
+def requeue_recording_transcripts(
+    *, session: Session, content_hashes: list[str]
+) -> None:
+    session.exec(  # type: ignore[call-overload]
+        update(RecordingTranscript)
+        .where(col(RecordingTranscript.content_hash).in_(content_hashes))
+        .where(col(RecordingTranscript.status) == "running")
+        .values(status="queued", updated_at=utcnow())
+    )
+    session.commit()
+
+
+def beat_recording_transcripts(*, session: Session, content_hashes: list[str]) -> None:
+    # updated_at of a running transcript is its heartbeat
+    session.exec(  # type: ignore[call-overload]
+        update(RecordingTranscript)
+        .where(col(RecordingTranscript.content_hash).in_(content_hashes))
+        .where(col(RecordingTranscript.status) == "running")
+        .values(updated_at=utcnow())
+    )
+    session.commit()
+
+
+def requeue_stale_recording_transcripts(
+    *, session: Session, stale_before: datetime
+) -> int:
+    """
+    Queue again transcripts running without a heartbeat since
+    ``stale_before``, left behind by a worker process that died.
+    """
+    result = session.exec(  # type: ignore[call-overload]
+        update(RecordingTranscript)
+        .where(col(RecordingTranscript.status) == "running")
+        .where(col(RecordingTranscript.updated_at) < stale_before)
+        .values(status="queued", updated_at=utcnow())
+    )
+    session.commit()
+    return int(result.rowcount)
+
+
+def finish_recording_transcript(
+    *,
+    session: Session,
+    content_hash: str,
+    engine: str,
+    segments: list[tuple[float, float, str]] | None = None,
+    error: str | None = None,
+) -> RecordingTranscript | None:
+    db_transcript = session.get(RecordingTranscript, content_hash)
+    if db_transcript is None:
+        # The file was deleted while it was transcribed
+        return None
+    db_transcript.status = "failed" if error else "done"
+    db_transcript.engine = engine
+    db_transcript.segments = segments
+    db_transcript.text = (
+        " ".join(text for _, _, text in segments) if segments is not None else None
+    )
+    db_transcript.error = error[:1024] if error else None
+    db_transcript.updated_at = utcnow()
+    session.add(db_transcript)
+    session.commit()
+    session.refresh(db_transcript)
+    return db_transcript
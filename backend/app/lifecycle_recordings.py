@@ -0,0 +1,33 @@
+import argparse
+import asyncio
+import logging
+
+from app.recordings.lifecycle import run_lifecycle
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def run(batch_size: int, interval: float | None) -> None:
+    while True:
+        archived, expired = await run_lifecycle(batch_size)
+        logger.info("Archived %d recording files, expired %d", archived, expired)
+        if interval is None:
+            return
+        await asyncio.sleep(interval)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Archive recordings nobody plays and delete expired ones"
+    )
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument(
+        "--interval", type=float, help="seconds between passes, runs once if unset"
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.batch_size, args.interval))
+
+
+if __name__ == "__main__":
+    main()
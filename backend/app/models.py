@@ -1,6 +1,8 @@
 import uuid
+from datetime import datetime, timezone
 
 from pydantic import EmailStr
+from sqlalchemy import JSON, BigInteger, DateTime, Index, Text
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -44,11 +46,17 @@ class User(UserBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     hashed_password: str
     items: list["Item"] = Relationship(back_populates="owner", cascade_delete=True)
+    # Quota counters, kept in step with the recordings in the same transaction.
+    # The count includes uploads reserved while they are converted.
+    recording_count: int = 0
+    recording_bytes: int = Field(default=0, sa_type=BigInteger)
 
 
 # Properties to return via API, id is always required
 class UserPublic(UserBase):
     id: uuid.UUID
+    recording_count: int = 0
+    recording_bytes: int = 0
 
 
 class UsersPublic(SQLModel):
@@ -92,6 +100,271 @@ class ItemsPublic(SQLModel):
     count: int
 
 
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+# Shared properties of a background recording transcode
+class RecordingJobBase(SQLModel):
+    # One of "queued", "running", "done" or "failed"
+    status: str = Field(default="queued", max_length=16, index=True)
+    filename: str | None = Field(default=None, max_length=255)
+    error: str | None = Field(default=None, max_length=1024)
+    content_hash: str | None = Field(default=None, max_length=64, index=True)
+    # Set once the job is done
+    recording_id: uuid.UUID | None = Field(
+        default=None, foreign_key="recording.id", ondelete="SET NULL"
+    )
+
+
+# Database model, database table inferred from class name
+class RecordingJob(RecordingJobBase, table=True):
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    # Whose quota the upload is reserved on, the recording is theirs
+    owner_id: uuid.UUID | None = Field(
+        default=None, foreign_key="user.id", ondelete="SET NULL"
+    )
+    # Uploaded bytes waiting to be transcoded, removed once the job finishes
+    source_path: str = Field(max_length=1024)
+    # Object of a direct upload, moved to source_path and hashed by the worker
+    source_key: str | None = Field(default=None, max_length=1024, index=True)
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+    started_at: datetime | None = Field(
+        default=None,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+    finished_at: datetime | None = Field(
+        default=None,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+    # Refreshed by the worker while the job runs, it stops when the worker dies
+    heartbeat_at: datetime | None = Field(
+        default=None,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+
+
+# Properties to return via API, id is always required
+class RecordingJobPublic(RecordingJobBase):
+    id: uuid.UUID
+    created_at: datetime
+    finished_at: datetime | None
+
+
+# Where to PUT the bytes of a direct upload before completing it
+class RecordingDirectUploadPublic(SQLModel):
+    id: uuid.UUID
+    url: str
+    expires_at: datetime
+
+
+# Result of one file of a batch upload, the job or why it was refused
+class RecordingBatchItem(SQLModel):
+    filename: str
+    job: RecordingJobPublic | None = None
+    error: str | None = None
+
+
+class RecordingBatchPublic(SQLModel):
+    data: list[RecordingBatchItem]
+
+
+# Properties to receive on resumable upload creation
+class RecordingUploadCreate(SQLModel):
+    # Total size in bytes, when the client knows it up front
+    size: int | None = Field(default=None, ge=1)
+
+
+class RecordingUploadPublic(SQLModel):
+    id: uuid.UUID
+    offset: int
+    size: int | None
+
+
+# Transcoded audio stored once per distinct upload, keyed by the upload's sha256
+class RecordingBlob(SQLModel, table=True):
+    # The lifecycle worker picks what to archive straight off this index
+    __table_args__ = (
+        Index("ix_recordingblob_tier_accessed_at", "tier", "accessed_at"),
+    )
+
+    content_hash: str = Field(primary_key=True, max_length=64)
+    filename: str = Field(max_length=255)
+    byte_size: int
+    # Number of recordings pointing at this file, it is deleted when this drops to 0
+    ref_count: int = 1
+    # "hot", "archiving" or "archive", archived files are restored when played
+    tier: str = Field(default="hot", max_length=16)
+    # Bumped whenever the audio played changes (archived, master re-encoded),
+    # part of the ETag of what is served
+    revision: int = 0
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+    # When the file was last played, kept to the day so plays don't all write
+    accessed_at: datetime = Field(
+        default_factory=utcnow,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+
+
+# Acoustic fingerprint of a stored file, its hashes are in the index below
+class RecordingFingerprint(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    content_hash: str = Field(max_length=64, unique=True)
+    hash_count: int
+
+
+# Inverted index of fingerprint hashes, looked up by hash through the primary
+# key. The frame is where the hash starts, in fingerprint frames.
+class RecordingFingerprintHash(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_recordingfingerprinthash_fingerprint_id", "fingerprint_id"),
+    )
+
+    hash: int = Field(primary_key=True)
+    fingerprint_id: int = Field(
+        primary_key=True, foreign_key="recordingfingerprint.id", ondelete="CASCADE"
+    )
+    frame: int = Field(primary_key=True)
+
+
+# Speech to text of a stored file, queued when the file is stored and written
+# by the transcription worker
+class RecordingTranscript(SQLModel, table=True):
+    # The worker claims the oldest queued transcripts straight off this index
+    __table_args__ = (
+        Index("ix_recordingtranscript_status_created_at", "status", "created_at"),
+    )
+
+    content_hash: str = Field(primary_key=True, max_length=64)
+    # One of "queued", "running", "done" or "failed"
+    status: str = Field(default="queued", max_length=16)
+    # Engine and model that wrote the transcript
+    engine: str | None = Field(default=None, max_length=64)
+    text: str | None = Field(default=None, sa_type=Text)
+    # (start, end, text) of every segment, start and end in seconds
+    segments: list[tuple[float, float, str]] | None = Field(default=None, sa_type=JSON)
+    error: str | None = Field(default=None, max_length=1024)
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+    updated_at: datetime = Field(
+        default_factory=utcnow,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+
+
+# Shared properties
+class RecordingBase(SQLModel):
+    filename: str = Field(max_length=255)
+    content_hash: str = Field(max_length=64, index=True)
+    # Filled from ffprobe when the recording is ingested
+    duration: float | None = None
+    codec: str | None = Field(default=None, max_length=32)
+    byte_size: int
+    # (start, end) seconds of speech found when silence was trimmed
+    speech_segments: list[tuple[float, float]] | None = Field(
+        default=None, sa_type=JSON
+    )
+
+
+# Database model, database table inferred from class name
+class Recording(RecordingBase, table=True):
+    # Keyset pagination walks (created_at, id), overall and per owner
+    __table_args__ = (
+        Index("ix_recording_created_at_id", "created_at", "id"),
+        Index("ix_recording_owner_id_created_at_id", "owner_id", "created_at", "id"),
+    )
+
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    owner_id: uuid.UUID | None = Field(
+        default=None, foreign_key="user.id", ondelete="SET NULL"
+    )
+    created_at: datetime = Field(
+        default_factory=utcnow,
+        sa_type=DateTime(timezone=True),  # type: ignore
+    )
+
+
+# Properties to return via API, id is always required
+class RecordingPublic(RecordingBase):
+    id: uuid.UUID
+    owner_id: uuid.UUID | None
+    created_at: datetime
+
+
+class RecordingsPublic(SQLModel):
+    data: list[RecordingPublic]
+    # Pass back as ?cursor= to get the next page, None on the last page
+    next_cursor: str | None
+
+
+# Features extracted when a recording is stored, None where not measurable
+class RecordingFeaturesPublic(SQLModel):
+    duration: float | None
+    # Share of the recording that is speech
+    speech_ratio: float | None
+    # Energy peaks per second of speech, a proxy for syllables
+    speaking_rate: float | None
+    pause_count: float | None
+    pause_seconds: float | None
+    rms_mean_db: float | None
+    rms_std_db: float | None
+    pitch_mean_hz: float | None
+    pitch_std_hz: float | None
+    pitch_median_hz: float | None
+
+
+class FeatureSummary(SQLModel):
+    # Recordings the feature could be measured on
+    count: int
+    mean: float | None
+    std: float | None
+    min: float | None
+    median: float | None
+    p90: float | None
+    max: float | None
+
+
+class RecordingFeaturesAggregate(SQLModel):
+    # Recordings matching the filters that have features
+    count: int
+    features: dict[str, FeatureSummary]
+
+
+class RecordingDuplicate(SQLModel):
+    recording: RecordingPublic
+    # Share of the shorter recording's fingerprint that lines up, 1 when the
+    # bytes are identical
+    score: float
+
+
+class RecordingDuplicatesPublic(SQLModel):
+    data: list[RecordingDuplicate]
+
+
+class TranscriptSegment(SQLModel):
+    start: float
+    end: float
+    text: str
+
+
+class RecordingTranscriptPublic(SQLModel):
+    # One of "queued", "running", "done" or "failed"
+    status: str
+    engine: str | None
+    text: str | None
+    segments: list[TranscriptSegment]
+    error: str | None
+    updated_at: datetime
+
+
 # Generic message
 class Message(SQLModel):
     message: str
@@ -0,0 +1,106 @@
+import asyncio
+import fcntl
+import math
+import os
+import statistics
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from pathlib import Path
+
+from fastapi import HTTPException
+from sqlmodel import Session
+
+from app import crud
+from app.core.config import settings
+from app.recordings.storage import spool_dir
+
+RECENT_JOBS = 20
+# Assumed conversion time until some jobs have finished
+DEFAULT_TRANSCODE_SECONDS = 10.0
+
+
+class TranscodeSlots:
+    """
+    Node-wide limit on concurrent ffmpeg conversions.
+
+    Each slot is a lock file, so every API process on the node shares the
+    limit and a slot held by a process that dies is released by the kernel.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, directory: Path, limit: int) -> None:
+        self.directory = directory
+        self.limit = limit
+
+    def _try_acquire(self) -> int | None:
+        for i in range(self.limit):
+            fd = os.open(self.directory / f"{i}.lock", os.O_CREAT | os.O_RDWR)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            return fd
+        return None
+
+    @asynccontextmanager
+    async def hold(self) -> AsyncIterator[None]:
+        while (fd := self._try_acquire()) is None:
+            await asyncio.sleep(self.poll_interval)
+        try:
+            yield
+        finally:
+            os.close(fd)
+
+    @asynccontextmanager
+    async def hold_free(self, count: int) -> AsyncIterator[int]:
+        """
+        Hold up to ``count`` more slots without waiting, yields how many.
+
+        For work that can use extra cores while they are idle, on top of a
+        slot it already holds.
+        """
+        fds: list[int] = []
+        while len(fds) < count and (fd := self._try_acquire()) is not None:
+            fds.append(fd)
+        try:
+            yield len(fds)
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+
+@lru_cache
+def get_slots() -> TranscodeSlots:
+    return TranscodeSlots(spool_dir("slots"), settings.RECORDINGS_TRANSCODE_CONCURRENCY)
+
+
+@lru_cache
+def get_live_slots() -> TranscodeSlots:
+    return TranscodeSlots(spool_dir("live-slots"), settings.RECORDINGS_LIVE_CONCURRENCY)
+
+
+def check_transcode_admission(session: Session) -> None:
+    """
+    Refuse a new upload while the conversion backlog is full.
+
+    Retry-After estimates when a place frees up from how long recent
+    conversions took.
+    """
+    limit = settings.RECORDINGS_TRANSCODE_QUEUE_LIMIT
+    queued = crud.count_recording_jobs(session=session, status="queued")
+    if queued < limit:
+        return
+    durations = crud.get_recent_recording_job_durations(
+        session=session, limit=RECENT_JOBS
+    )
+    average = statistics.fmean(durations) if durations else DEFAULT_TRANSCODE_SECONDS
+    ahead = queued - limit + 1
+    retry_after = math.ceil(ahead * average / settings.RECORDINGS_TRANSCODE_CONCURRENCY)
+    raise HTTPException(
+        status_code=429,
+        detail="Too many recordings are waiting for conversion, retry later",
+        headers={"Retry-After": str(max(retry_after, 1))},
+    )
@@ -0,0 +1,134 @@
+import hashlib
+import hmac
+import os
+import time
+import uuid
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.recordings.ingest import SNIFF_BYTES, remove_quietly, sniff_audio_format
+from app.recordings.resumable import TOO_MANY_OPEN_UPLOADS, hash_file
+from app.recordings.storage import RecordingStorage
+
+
+class UnsupportedAudio(Exception):
+    pass
+
+
+def direct_key(owner_id: uuid.UUID, upload_id: uuid.UUID) -> str:
+    # Only the owner's completion finds the object again
+    return f"direct/{owner_id}/{upload_id}"
+
+
+def sign_key(key: str, expires: int) -> str:
+    """
+    Signature of the upload URL the API serves itself when the storage
+    backend cannot presign one.
+    """
+    message = f"PUT {key} {expires}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def check_signature(key: str, expires: int, signature: str) -> None:
+    if expires < time.time() or not hmac.compare_digest(
+        sign_key(key, expires), signature
+    ):
+        raise HTTPException(status_code=403, detail="Invalid or expired upload URL")
+
+
+async def store_object(
+    storage: RecordingStorage, key: str, chunks: AsyncIterator[bytes], spool: Path
+) -> int:
+    """
+    Write a request body to the storage under ``key``, the local stand-in for
+    a PUT to a presigned object store URL.
+    """
+    received = 0
+    try:
+        with spool.open("wb") as f:
+            async for chunk in chunks:
+                received += len(chunk)
+                if received > settings.RECORDINGS_MAX_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=413, detail="Recording is too large"
+                    )
+                await run_in_threadpool(f.write, chunk)
+        return await run_in_threadpool(storage.save, key, spool)
+    finally:
+        remove_quietly(spool)
+
+
+async def check_object(storage: RecordingStorage, key: str) -> None:
+    """
+    Check that an uploaded object exists and fits the size limit, from its
+    metadata alone. Objects that are too large are deleted.
+    """
+    size = await run_in_threadpool(storage.size, key)
+    if size is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if size > settings.RECORDINGS_MAX_UPLOAD_BYTES:
+        await run_in_threadpool(storage.delete, key)
+        raise HTTPException(status_code=413, detail="Recording is too large")
+
+
+def _read_head(path: Path) -> bytes:
+    with path.open("rb") as f:
+        return f.read(SNIFF_BYTES)
+
+
+def take_object(storage: RecordingStorage, key: str, destination: Path) -> str:
+    """
+    Move an uploaded object to ``destination`` and return its sha256.
+
+    Runs in the transcode worker, so the API never downloads the object. An
+    object that does not start like an audio file is deleted all the same.
+    """
+    local = storage.local_path(key)
+    if local is None:
+        storage.fetch(key, destination)
+        storage.delete(key)
+    else:
+        os.replace(local, destination)
+    if sniff_audio_format(_read_head(destination)) is None:
+        raise UnsupportedAudio("File content is not a supported audio format")
+    return hash_file(destination)
+
+
+def prune_expired(storage: RecordingStorage) -> None:
+    """
+    Remove local direct uploads nobody completed. Object stores expire them
+    with a lifecycle rule on the ``direct/`` prefix instead.
+    """
+    root = storage.local_path("direct")
+    if root is None:
+        return
+    cutoff = time.time() - settings.RECORDINGS_UPLOAD_EXPIRE_HOURS * 3600
+    for path in root.glob("*/*"):
+        try:
+            expired = path.stat().st_mtime < cutoff
+        except FileNotFoundError:
+            # Completed or pruned by another request meanwhile
+            continue
+        if expired:
+            remove_quietly(path)
+
+
+def check_open_uploads(
+    storage: RecordingStorage, key: str, owner_id: uuid.UUID, max_open: int | None
+) -> None:
+    """
+    Refuse a new local direct upload while its owner has ``max_open`` others
+    stored and not completed. Objects in an object store are not counted.
+    """
+    root = storage.local_path(f"direct/{owner_id}")
+    if max_open is None or root is None or not root.is_dir():
+        return
+    name = key.rpartition("/")[2]
+    # Sending the same upload again replaces it
+    others = sum(path.name != name for path in root.iterdir())
+    if others >= max_open:
+        raise HTTPException(status_code=429, detail=TOO_MANY_OPEN_UPLOADS)
@@ -0,0 +1,294 @@
+import fcntl
+import logging
+import os
+import tempfile
+import time
+import uuid
+from collections.abc import AsyncIterator, Iterator
+from contextlib import aclosing, contextmanager
+from functools import lru_cache
+from itertools import pairwise
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.recordings.ffmpeg import FFmpegError, iter_file_chunks, pipe_stream
+from app.recordings.ingest import remove_quietly
+from app.recordings.storage import spool_dir
+from app.recordings.vad import detect_speech
+
+logger = logging.getLogger(__name__)
+
+FEATURES_SAMPLE_RATE = 16000
+PCM_OUTPUT_ARGS = ["-vn", "-ac", "1", "-ar", str(FEATURES_SAMPLE_RATE), "-f", "s16le"]
+
+# Long enough for two periods of the lowest pitch
+FRAME_SECONDS = 0.04
+# Frames are analysed this many at a time to bound memory
+FRAMES_PER_BLOCK = 4096
+MIN_PITCH_HZ = 75
+MAX_PITCH_HZ = 400
+# Normalised autocorrelation a frame needs at its pitch lag to count as voiced
+VOICING_THRESHOLD = 0.3
+# Energy peaks closer than this to the loudest speech count as syllables
+SYLLABLE_RANGE_DB = 25.0
+
+# Every column is float32, counts included, so missing values can be NaN
+FEATURE_COLUMNS = (
+    "duration",
+    "speech_ratio",
+    "speaking_rate",
+    "pause_count",
+    "pause_seconds",
+    "rms_mean_db",
+    "rms_std_db",
+    "pitch_mean_hz",
+    "pitch_std_hz",
+    "pitch_median_hz",
+)
+# Shards are merged into one once there are this many
+COMPACT_AFTER_SHARDS = 64
+
+
+def frame_features(
+    samples: NDArray[np.int16], sample_rate: int
+) -> tuple[NDArray[np.float32], NDArray[np.float32]]:
+    """
+    RMS energy in dBFS and pitch in Hz of each full frame, pitch is NaN
+    where the frame is not voiced.
+    """
+    frame = int(sample_rate * FRAME_SECONDS)
+    frames = samples[: len(samples) // frame * frame].reshape(-1, frame)
+    rms_db = np.empty(len(frames), dtype=np.float32)
+    pitch = np.full(len(frames), np.nan, dtype=np.float32)
+    min_lag = sample_rate // MAX_PITCH_HZ
+    max_lag = sample_rate // MIN_PITCH_HZ
+    # Zero padded so the circular autocorrelation is the linear one
+    n_fft = 1 << (2 * frame - 1).bit_length()
+    for start in range(0, len(frames), FRAMES_PER_BLOCK):
+        block = frames[start : start + FRAMES_PER_BLOCK].astype(np.float32) / 32768
+        block -= block.mean(axis=1, keepdims=True)
+        energy = np.einsum("ij,ij->i", block, block)
+        rms_db[start : start + len(block)] = 10 * np.log10(energy / frame + 1e-10)
+        spectrum = np.fft.rfft(block, n=n_fft, axis=1)
+        autocorrelation = np.fft.irfft(spectrum * spectrum.conj(), n=n_fft, axis=1)
+        candidates = autocorrelation[:, min_lag : max_lag + 1]
+        lag = candidates.argmax(axis=1)
+        strength = candidates[np.arange(len(block)), lag] / (energy + 1e-10)
+        voiced = strength > VOICING_THRESHOLD
+        block_pitch = sample_rate / (lag + min_lag)
+        pitch[start : start + len(block)][voiced] = block_pitch[voiced]
+    return rms_db, pitch
+
+
+def _syllable_peaks(rms_db: NDArray[np.float32], in_speech: NDArray[np.bool_]) -> int:
+    if len(rms_db) < 3 or not in_speech.any():
+        return 0
+    floor = rms_db[in_speech].max() - SYLLABLE_RANGE_DB
+    middle = rms_db[1:-1]
+    peaks = (middle > rms_db[:-2]) & (middle >= rms_db[2:]) & (middle > floor)
+    return int((peaks & in_speech[1:-1]).sum())
+
+
+def extract_features(samples: NDArray[np.int16], sample_rate: int) -> dict[str, float]:
+    """
+    Per recording features from mono PCM, NaN where there is nothing to measure.
+    """
+    duration = len(samples) / sample_rate
+    segments = detect_speech(samples, sample_rate)
+    speech = sum(end - start for start, end in segments) / sample_rate
+    pauses = [start - end for (_, end), (start, _) in pairwise(segments)]
+    rms_db, pitch = frame_features(samples, sample_rate)
+    frame = int(sample_rate * FRAME_SECONDS)
+    in_speech = np.zeros(len(rms_db), dtype=bool)
+    for start, end in segments:
+        in_speech[start // frame : end // frame] = True
+    voiced = pitch[in_speech & ~np.isnan(pitch)]
+    nan = float("nan")
+    return {
+        "duration": duration,
+        "speech_ratio": speech / duration if duration else nan,
+        # Energy peaks stand in for syllables, a proxy and not a word count
+        "speaking_rate": _syllable_peaks(rms_db, in_speech) / speech if speech else nan,
+        "pause_count": len(pauses),
+        "pause_seconds": sum(pauses) / sample_rate,
+        "rms_mean_db": float(rms_db.mean()) if len(rms_db) else nan,
+        "rms_std_db": float(rms_db.std()) if len(rms_db) else nan,
+        "pitch_mean_hz": float(voiced.mean()) if len(voiced) else nan,
+        "pitch_std_hz": float(voiced.std()) if len(voiced) else nan,
+        "pitch_median_hz": float(np.median(voiced)) if len(voiced) else nan,
+    }
+
+
+def _extract_from_file(pcm_path: Path) -> dict[str, float]:
+    length = pcm_path.stat().st_size // 2
+    if not length:
+        return extract_features(np.zeros(0, dtype=np.int16), FEATURES_SAMPLE_RATE)
+    samples = np.memmap(pcm_path, dtype="<i2", mode="r", shape=(length,))
+    return extract_features(samples, FEATURES_SAMPLE_RATE)
+
+
+async def compute_features(chunks: AsyncIterator[bytes]) -> dict[str, float]:
+    """
+    Decode the audio in ``chunks`` and extract its features.
+
+    The PCM is spooled and memory-mapped, like for silence trimming.
+    """
+    fd, name = tempfile.mkstemp(dir=spool_dir("features"), suffix=".pcm")
+    pcm_path = Path(name)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async with aclosing(pipe_stream(chunks, PCM_OUTPUT_ARGS)) as pcm:
+                async for chunk in pcm:
+                    await run_in_threadpool(f.write, chunk)
+        return await run_in_threadpool(_extract_from_file, pcm_path)
+    finally:
+        remove_quietly(pcm_path)
+
+
+class FeatureStore:
+    """
+    Columnar store of recording features, one row per content hash.
+
+    Rows are appended as small immutable ``.npz`` shards, one array per
+    column, and merged into one shard once enough pile up. Readers only load
+    the columns they need. A lock file keeps readers off a merge in progress.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    @contextmanager
+    def _lock(self, operation: int) -> Iterator[None]:
+        self.root.mkdir(parents=True, exist_ok=True)
+        with (self.root / ".lock").open("a") as f:
+            fcntl.flock(f, operation)
+            yield
+
+    def _shards(self) -> list[Path]:
+        # Named by creation time, so later rows win on a repeated hash
+        return sorted(self.root.glob("*.npz"))
+
+    def _write(self, columns: dict[str, NDArray[np.generic]]) -> None:
+        name = f"{time.time_ns():020d}-{uuid.uuid4().hex}.npz"
+        partial = self.root / f".{name}.part"
+        with partial.open("wb") as f:
+            np.savez(f, **columns)  # type: ignore[arg-type]
+        os.replace(partial, self.root / name)
+
+    def append(self, content_hash: str, features: dict[str, float]) -> None:
+        columns: dict[str, NDArray[np.generic]] = {
+            "content_hash": np.array([content_hash], dtype="S64")
+        }
+        for column in FEATURE_COLUMNS:
+            columns[column] = np.array([features[column]], dtype=np.float32)
+        with self._lock(fcntl.LOCK_SH):
+            self._write(columns)
+            shards = len(self._shards())
+        if shards >= COMPACT_AFTER_SHARDS:
+            self.compact()
+
+    def _read(self, columns: tuple[str, ...]) -> dict[str, NDArray[np.generic]]:
+        parts: dict[str, list[NDArray[np.generic]]] = {c: [] for c in columns}
+        for shard in self._shards():
+            with np.load(shard) as data:
+                for column in columns:
+                    parts[column].append(data[column])
+        if not parts["content_hash"]:
+            return {
+                "content_hash": np.zeros(0, dtype="S64"),
+                **{c: np.zeros(0, np.float32) for c in columns[1:]},
+            }
+        merged = {column: np.concatenate(parts[column]) for column in columns}
+        # Keep the last row of every hash
+        hashes = merged["content_hash"][::-1]
+        _, first = np.unique(hashes, return_index=True)
+        keep = np.sort(len(hashes) - 1 - first)
+        return {column: values[keep] for column, values in merged.items()}
+
+    def load(
+        self, columns: tuple[str, ...] = FEATURE_COLUMNS
+    ) -> dict[str, NDArray[np.generic]]:
+        """
+        The given columns plus ``content_hash``, one entry per recording.
+        """
+        with self._lock(fcntl.LOCK_SH):
+            return self._read(("content_hash", *columns))
+
+    def compact(self) -> None:
+        with self._lock(fcntl.LOCK_EX):
+            shards = self._shards()
+            if len(shards) < 2:
+                return
+            self._write(self._read(("content_hash", *FEATURE_COLUMNS)))
+            for shard in shards:
+                remove_quietly(shard)
+
+
+def _nan_to_none(value: float) -> float | None:
+    return None if np.isnan(value) else float(value)
+
+
+def read_features(
+    store: FeatureStore, content_hash: str
+) -> dict[str, float | None] | None:
+    data = store.load()
+    matches = np.flatnonzero(data["content_hash"] == content_hash.encode())
+    if not len(matches):
+        return None
+    return {
+        column: _nan_to_none(data[column][matches[0]]) for column in FEATURE_COLUMNS
+    }
+
+
+def summarize_features(
+    store: FeatureStore, content_hashes: list[str]
+) -> tuple[int, dict[str, dict[str, float | None]]]:
+    """
+    Number of the given recordings with features, and summary statistics of
+    every feature over them.
+    """
+    data = store.load()
+    rows = np.isin(data["content_hash"], np.array(content_hashes, dtype="S64"))
+    summaries = {}
+    for column in FEATURE_COLUMNS:
+        values: NDArray[np.float64] = data[column][rows].astype(np.float64)
+        values = values[np.isfinite(values)]
+        summary: dict[str, float | None] = {"count": len(values)}
+        if len(values):
+            p50, p90 = np.percentile(values, [50, 90])
+            summary.update(
+                mean=values.mean(),
+                std=values.std(),
+                min=values.min(),
+                median=p50,
+                p90=p90,
+                max=values.max(),
+            )
+        else:
+            summary.update(
+                mean=None, std=None, min=None, median=None, p90=None, max=None
+            )
+        summaries[column] = summary
+    return int(rows.sum()), summaries
+
+
+@lru_cache
+def get_feature_store() -> FeatureStore:
+    return FeatureStore(
+        settings.RECORDINGS_FEATURES_DIR or settings.RECORDINGS_DIR / "features"
+    )
+
+
+async def store_features(content_hash: str, audio_path: Path) -> None:
+    # Analytics only, a recording without features is still usable
+    if not settings.RECORDINGS_FEATURES:
+        return
+    try:
+        features = await compute_features(iter_file_chunks(audio_path))
+        await run_in_threadpool(get_feature_store().append, content_hash, features)
+    except (FFmpegError, OSError) as e:
+        logger.warning("Could not compute features for %s: %s", content_hash, e)
@@ -0,0 +1,306 @@
+import asyncio
+import json
+import logging
+import os
+import resource
+import time
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import aclosing, asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.recordings.metrics import process_metrics
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_BYTES = 64 * 1024
+FILE_CHUNK_BYTES = 256 * 1024
+# Only the tail of stderr is kept, it is enough to explain a failure
+STDERR_TAIL_BYTES = 4 * 1024
+
+MP3_OUTPUT_ARGS = ["-vn", "-acodec", "libmp3lame", "-f", "mp3"]
+# Recordings are kept as a compact Opus master, other formats derive from it
+OPUS_OUTPUT_ARGS = ["-vn", "-acodec", "libopus", "-b:a", "64k", "-f", "ogg"]
+
+
+class FFmpegError(Exception):
+    def __init__(self, returncode: int | None, stderr: bytes) -> None:
+        self.returncode = returncode
+        self.stderr = stderr
+        message = stderr.decode(errors="replace").strip().splitlines()
+        super().__init__(
+            f"ffmpeg exited with {returncode}: {message[-1] if message else ''}"
+        )
+
+
+class FFmpegTimeout(FFmpegError):
+    def __init__(self, program: str, seconds: float) -> None:
+        self.returncode = None
+        self.stderr = b""
+        Exception.__init__(self, f"{program} was killed after {seconds:g} seconds")
+
+
+def _limit_resources(pid: int, nice: int, max_memory_bytes: int | None) -> None:
+    """
+    Lower the priority of a started process and cap its address space.
+
+    Applied from the parent on the new pid, as a preexec_fn can deadlock a
+    child forked from a process running threads.
+    """
+    try:
+        if nice:
+            priority = os.getpriority(os.PRIO_PROCESS, 0) + nice
+            os.setpriority(os.PRIO_PROCESS, pid, min(priority, 19))
+        if max_memory_bytes is not None:
+            _, hard = resource.prlimit(pid, resource.RLIMIT_AS)
+            if hard != resource.RLIM_INFINITY:
+                max_memory_bytes = min(max_memory_bytes, hard)
+            resource.prlimit(pid, resource.RLIMIT_AS, (max_memory_bytes, hard))
+    except ProcessLookupError:
+        # Already exited, its status tells how
+        pass
+
+
+def _thread_args() -> list[str]:
+    threads = settings.RECORDINGS_FFMPEG_THREADS
+    return ["-threads", str(threads)] if threads is not None else []
+
+
+@asynccontextmanager
+async def _supervise(
+    program: str, args: list[str], *, timeout: bool = True, **kwargs: Any
+) -> AsyncIterator[asyncio.subprocess.Process]:
+    """
+    Start ``program`` niced and memory limited, and kill it when the block
+    ends or after RECORDINGS_FFMPEG_TIMEOUT_SECONDS.
+
+    The block raises FFmpegError when the process fails, it is replaced with
+    FFmpegTimeout when the process was killed for taking too long. How every
+    process ended is counted in the metrics.
+    """
+    path = (
+        settings.RECORDINGS_FFPROBE_PATH
+        if program == "ffprobe"
+        else settings.RECORDINGS_FFMPEG_PATH
+    )
+    seconds = settings.RECORDINGS_FFMPEG_TIMEOUT_SECONDS if timeout else None
+    nice = settings.RECORDINGS_FFMPEG_NICE
+    max_memory_bytes = settings.RECORDINGS_FFMPEG_MAX_MEMORY_BYTES
+    process = await asyncio.create_subprocess_exec(path, *args, **kwargs)
+    expired = False
+
+    def expire() -> None:
+        nonlocal expired
+        if process.returncode is None:
+            expired = True
+            process.kill()
+
+    timer = (
+        asyncio.get_running_loop().call_later(seconds, expire)
+        if seconds is not None
+        else None
+    )
+    started = time.monotonic()
+    process_metrics.started(program)
+    outcome = "cancelled"
+    try:
+        _limit_resources(process.pid, nice, max_memory_bytes)
+        yield process
+        outcome = "ok"
+    except FFmpegError as e:
+        if expired:
+            assert seconds is not None
+            outcome = "timeout"
+            logger.warning("Killed %s after %g seconds", program, seconds)
+            raise FFmpegTimeout(program, seconds) from e
+        # Killed by a signal, e.g. the kernel out of memory
+        outcome = "killed" if (process.returncode or 0) < 0 else "error"
+        raise
+    finally:
+        if timer is not None:
+            timer.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        process_metrics.ended(program, outcome, time.monotonic() - started)
+
+
+async def iter_file_chunks(path: Path) -> AsyncIterator[bytes]:
+    with path.open("rb") as f:
+        while chunk := await run_in_threadpool(f.read, FILE_CHUNK_BYTES):
+            yield chunk
+
+
+async def _feed_stdin(
+    stdin: asyncio.StreamWriter, chunks: AsyncIterator[bytes]
+) -> None:
+    try:
+        async for chunk in chunks:
+            if chunk:
+                stdin.write(chunk)
+                await stdin.drain()
+    except (BrokenPipeError, ConnectionResetError):
+        # ffmpeg gave up on the input, its exit status tells why
+        return
+    finally:
+        stdin.close()
+
+
+async def _collect_stderr(stderr: asyncio.StreamReader) -> bytes:
+    tail = b""
+    while chunk := await stderr.read(READ_CHUNK_BYTES):
+        tail = (tail + chunk)[-STDERR_TAIL_BYTES:]
+    return tail
+
+
+async def pipe_stream(
+    chunks: AsyncIterator[bytes],
+    output_args: list[str],
+    input_args: list[str] | None = None,
+    *,
+    live: bool = False,
+) -> AsyncGenerator[bytes, None]:
+    """
+    Pipe ``chunks`` through ffmpeg and yield what it writes to stdout.
+
+    ``input_args`` describe the input when it has no container, e.g. raw PCM.
+    ``live`` input lasts as long as the stream, so it is not timed out.
+
+    Use it inside ``contextlib.aclosing`` so ffmpeg is killed when the consumer
+    stops early.
+    """
+    threads = _thread_args()
+    async with _supervise(
+        "ffmpeg",
+        [
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            *threads,
+            *(input_args or []),
+            "-i",
+            "pipe:0",
+            *output_args,
+            *threads,
+            "pipe:1",
+        ],
+        timeout=not live,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    ) as process:
+        assert process.stdin and process.stdout and process.stderr
+        feeder = asyncio.create_task(_feed_stdin(process.stdin, chunks))
+        stderr_tail = asyncio.create_task(_collect_stderr(process.stderr))
+        try:
+            while chunk := await process.stdout.read(READ_CHUNK_BYTES):
+                yield chunk
+            await feeder
+            stderr = await stderr_tail
+            returncode = await process.wait()
+        except BaseException:
+            # The upload was rejected or the consumer went away, the encoder
+            # is stopped on the way out
+            feeder.cancel()
+            stderr_tail.cancel()
+            raise
+        if returncode != 0:
+            raise FFmpegError(returncode, stderr)
+
+
+async def transcode_stream(
+    chunks: AsyncIterator[bytes],
+    destination: Path,
+    output_args: list[str],
+    input_args: list[str] | None = None,
+    *,
+    live: bool = False,
+) -> None:
+    """
+    Pipe ``chunks`` through ffmpeg and write its output to ``destination``.
+
+    The input goes to ffmpeg's stdin and the encoded result is read back from
+    its stdout, so nothing touches the disk except the final file. The output
+    is written next to ``destination`` and only renamed into place on success.
+    """
+    partial = destination.with_name(destination.name + ".part")
+    try:
+        async with aclosing(
+            pipe_stream(chunks, output_args, input_args, live=live)
+        ) as stream:
+            with partial.open("wb") as f:
+                async for chunk in stream:
+                    await run_in_threadpool(f.write, chunk)
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+    os.replace(partial, destination)
+
+
+async def run_ffmpeg(args: list[str]) -> None:
+    """
+    Run ffmpeg from and to files, for outputs that are not a single stream.
+    ``args`` end with the output.
+    """
+    threads = _thread_args()
+    async with _supervise(
+        "ffmpeg",
+        [
+            "-hide_banner",
+            "-loglevel",
+            "error",
+            *threads,
+            *args[:-1],
+            *threads,
+            args[-1],
+        ],
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    ) as process:
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise FFmpegError(process.returncode, stderr[-STDERR_TAIL_BYTES:])
+
+
+@dataclass
+class AudioProbe:
+    duration: float | None
+    codec: str | None
+
+
+async def probe_audio(path: Path) -> AudioProbe:
+    """
+    Read the duration and codec of the first audio stream with ffprobe.
+    """
+    async with _supervise(
+        "ffprobe",
+        [
+            "-v",
+            "error",
+            "-select_streams",
+            "a:0",
+            "-show_entries",
+            "format=duration:stream=codec_name",
+            "-of",
+            "json",
+            str(path),
+        ],
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    ) as process:
+        stdout, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise FFmpegError(process.returncode, stderr[-STDERR_TAIL_BYTES:])
+    info = json.loads(stdout or b"{}")
+    streams = info.get("streams") or [{}]
+    duration = info.get("format", {}).get("duration")
+    return AudioProbe(
+        duration=float(duration) if duration else None,
+        codec=streams[0].get("codec_name"),
+    )
@@ -0,0 +1,252 @@
+import logging
+import os
+import tempfile
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.recordings.ffmpeg import FFmpegError, iter_file_chunks, pipe_stream
+from app.recordings.ingest import remove_quietly
+from app.recordings.storage import spool_dir
+
+logger = logging.getLogger(__name__)
+
+# Telephone bandwidth keeps the peaks that survive lossy re-encoding
+FINGERPRINT_SAMPLE_RATE = 8000
+PCM_OUTPUT_ARGS = [
+    "-vn",
+    "-ac",
+    "1",
+    "-ar",
+    str(FINGERPRINT_SAMPLE_RATE),
+    "-f",
+    "s16le",
+]
+
+WINDOW = 1024
+HOP = 512
+# Frames per block of the spectrogram, bounds memory on long recordings
+FRAMES_PER_BLOCK = 2048
+# A peak is the loudest bin within this many bins and frames around it
+PEAK_BINS = 10
+PEAK_FRAMES = 5
+# Peaks this far below the loudest one in their block are ignored as noise
+PEAK_RANGE_DB = 50.0
+# Every peak is paired with up to FAN_OUT later peaks in its target zone
+FAN_OUT = 5
+MAX_DELTA_FRAMES = 63
+MAX_DELTA_BINS = 64
+# A match needs this many hashes agreeing on the time offset
+MIN_MATCHES = 8
+
+
+def spectral_peaks(
+    samples: NDArray[np.int16],
+) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+    """
+    Frame and frequency bin of every peak in the spectrogram, sorted by frame.
+    """
+    count = max(0, (len(samples) - WINDOW) // HOP + 1)
+    window = np.hanning(WINDOW).astype(np.float32)
+    frames_out: list[NDArray[np.int64]] = []
+    bins_out: list[NDArray[np.int64]] = []
+    # Blocks overlap by the peak neighbourhood so no peak is cut at an edge
+    for start in range(0, count, FRAMES_PER_BLOCK):
+        first = max(0, start - PEAK_FRAMES)
+        last = min(count, start + FRAMES_PER_BLOCK + PEAK_FRAMES)
+        index = (np.arange(first, last) * HOP)[:, None] + np.arange(WINDOW)
+        block = samples[index].astype(np.float32) * window
+        magnitude = np.abs(np.fft.rfft(block, axis=1))[:, : WINDOW // 2]
+        db = 20 * np.log10(magnitude + 1e-3)
+        # Separable maximum filter, over frequency and then over time
+        neighbourhood = db.copy()
+        for shift in range(1, PEAK_BINS + 1):
+            neighbourhood[:, shift:] = np.maximum(
+                neighbourhood[:, shift:], db[:, :-shift]
+            )
+            neighbourhood[:, :-shift] = np.maximum(
+                neighbourhood[:, :-shift], db[:, shift:]
+            )
+        by_bin = neighbourhood.copy()
+        for shift in range(1, PEAK_FRAMES + 1):
+            neighbourhood[shift:] = np.maximum(neighbourhood[shift:], by_bin[:-shift])
+            neighbourhood[:-shift] = np.maximum(neighbourhood[:-shift], by_bin[shift:])
+        peaks = (db == neighbourhood) & (db > db.max() - PEAK_RANGE_DB)
+        frames, bins = np.nonzero(peaks)
+        frames += first
+        owned = (frames >= start) & (frames < start + FRAMES_PER_BLOCK)
+        frames_out.append(frames[owned].astype(np.int64))
+        bins_out.append(bins[owned].astype(np.int64))
+    if not frames_out:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    return np.concatenate(frames_out), np.concatenate(bins_out)
+
+
+def fingerprint(
+    samples: NDArray[np.int16],
+) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+    """
+    Landmark hashes of mono PCM at FINGERPRINT_SAMPLE_RATE and the frame each
+    one starts at.
+
+    Pairs of spectral peaks are hashed on their two frequencies and the time
+    between them, so hashes do not depend on where the audio starts and
+    survive re-encoding, trimming and level changes.
+    """
+    frames, bins = spectral_peaks(samples)
+    hashes: list[NDArray[np.int64]] = []
+    anchors: list[NDArray[np.int64]] = []
+    paired = np.zeros(len(frames), dtype=np.int64)
+    for step in range(1, len(frames)):
+        delta = frames[step:] - frames[:-step]
+        if not (delta <= MAX_DELTA_FRAMES).any():
+            # Sorted by frame, every later step is further apart still
+            break
+        anchor_bins = bins[:-step]
+        target_bins = bins[step:]
+        pair = (
+            (delta > 0)
+            & (delta <= MAX_DELTA_FRAMES)
+            & (np.abs(target_bins - anchor_bins) <= MAX_DELTA_BINS)
+            & (paired[:-step] < FAN_OUT)
+        )
+        paired[:-step] += pair
+        # 9 bits per frequency and 6 for the time between them
+        hashes.append(
+            (anchor_bins[pair] << 15) | (target_bins[pair] << 6) | delta[pair]
+        )
+        anchors.append(frames[:-step][pair])
+    if not hashes:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    # One row per hash and frame
+    keys = np.unique((np.concatenate(anchors) << 24) | np.concatenate(hashes))
+    return keys & 0xFFFFFF, keys >> 24
+
+
+def match_offsets(
+    query_hashes: NDArray[np.int64],
+    query_frames: NDArray[np.int64],
+    postings: list[tuple[int, int, int]],
+) -> dict[int, int]:
+    """
+    Hashes of each candidate that agree on one time offset with the query.
+
+    ``postings`` are (hash, fingerprint id, frame) rows of the index. A
+    recording that contains the query audio has many hashes at the same
+    offset, an unrelated one only scattered chance hits.
+    """
+    if not postings:
+        return {}
+    rows = np.array(postings, dtype=np.int64)
+    order = np.argsort(query_hashes, kind="stable")
+    sorted_hashes = query_hashes[order]
+    left = np.searchsorted(sorted_hashes, rows[:, 0], side="left")
+    right = np.searchsorted(sorted_hashes, rows[:, 0], side="right")
+    # Every posting against every query frame with the same hash
+    repeats = right - left
+    posting = np.repeat(np.arange(len(rows)), repeats)
+    within = np.arange(len(posting)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    query = order[np.repeat(left, repeats) + within]
+    candidates = rows[posting, 1]
+    offsets = rows[posting, 2] - query_frames[query]
+    pairs, votes = np.unique(
+        np.stack([candidates, offsets], axis=1), axis=0, return_counts=True
+    )
+    best: dict[int, int] = {}
+    for (candidate, _), count in zip(pairs.tolist(), votes.tolist(), strict=True):
+        best[candidate] = max(best.get(candidate, 0), count)
+    return best
+
+
+def find_duplicates(
+    *, session: Session, content_hash: str, min_score: float
+) -> dict[str, float] | None:
+    """
+    Content hashes of near duplicates of a stored file and their scores, None
+    when the file has no fingerprint.
+
+    Only the index entries of the file's own hashes are read, so the cost
+    depends on how common its hashes are and not on the size of the corpus.
+    """
+    own = crud.get_recording_fingerprint(session=session, content_hash=content_hash)
+    if own is None or own.id is None:
+        return None
+    rows = crud.get_recording_fingerprint_hashes(session=session, fingerprint_id=own.id)
+    if not rows:
+        return {}
+    query = np.array(rows, dtype=np.int64)
+    postings = crud.get_recording_fingerprint_postings(
+        session=session,
+        hashes=np.unique(query[:, 0]).tolist(),
+        exclude_id=own.id,
+    )
+    votes = match_offsets(query[:, 0], query[:, 1], postings)
+    candidates = crud.get_recording_fingerprints(
+        session=session,
+        ids=[id for id, count in votes.items() if count >= MIN_MATCHES],
+    )
+    duplicates = {}
+    for candidate in candidates:
+        assert candidate.id is not None
+        score = votes[candidate.id] / min(own.hash_count, candidate.hash_count)
+        if score >= min_score:
+            duplicates[candidate.content_hash] = min(score, 1.0)
+    return duplicates
+
+
+def _fingerprint_file(pcm_path: Path) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+    length = pcm_path.stat().st_size // 2
+    if not length:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64)
+    samples = np.memmap(pcm_path, dtype="<i2", mode="r", shape=(length,))
+    return fingerprint(samples)
+
+
+async def compute_fingerprint(
+    chunks: AsyncIterator[bytes],
+) -> tuple[NDArray[np.int64], NDArray[np.int64]]:
+    """
+    Decode the audio in ``chunks`` and fingerprint it, the PCM is spooled and
+    memory-mapped like for the features.
+    """
+    fd, name = tempfile.mkstemp(dir=spool_dir("fingerprint"), suffix=".pcm")
+    pcm_path = Path(name)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async with aclosing(pipe_stream(chunks, PCM_OUTPUT_ARGS)) as pcm:
+                async for chunk in pcm:
+                    await run_in_threadpool(f.write, chunk)
+        return await run_in_threadpool(_fingerprint_file, pcm_path)
+    finally:
+        remove_quietly(pcm_path)
+
+
+def _save(
+    content_hash: str, hashes: NDArray[np.int64], frames: NDArray[np.int64]
+) -> None:
+    with Session(engine) as session:
+        crud.replace_recording_fingerprint(
+            session=session,
+            content_hash=content_hash,
+            hashes=hashes.tolist(),
+            frames=frames.tolist(),
+        )
+
+
+async def store_fingerprint(content_hash: str, audio_path: Path) -> None:
+    # Only used to find near duplicates, a recording without one is usable
+    if not settings.RECORDINGS_FINGERPRINTS:
+        return
+    try:
+        hashes, frames = await compute_fingerprint(iter_file_chunks(audio_path))
+        await run_in_threadpool(_save, content_hash, hashes, frames)
+    except (FFmpegError, OSError) as e:
+        logger.warning("Could not fingerprint %s: %s", content_hash, e)
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import tempfile
+import weakref
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Literal
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.recordings.admission import get_slots
+from app.recordings.ffmpeg import (
+    MP3_OUTPUT_ARGS,
+    OPUS_OUTPUT_ARGS,
+    iter_file_chunks,
+    transcode_stream,
+)
+from app.recordings.ingest import remove_quietly
+from app.recordings.storage import RecordingStorage, get_storage, spool_dir
+
+AudioFormat = Literal["mp3", "opus", "low"]
+
+
+@dataclass(frozen=True)
+class AudioProfile:
+    suffix: str
+    media_type: str
+    output_args: list[str]
+
+
+PROFILES: dict[AudioFormat, AudioProfile] = {
+    "mp3": AudioProfile(".mp3", "audio/mpeg", [*MP3_OUTPUT_ARGS, "-b:a", "128k"]),
+    "opus": AudioProfile(".opus", "audio/ogg", OPUS_OUTPUT_ARGS),
+    # Mono speech quality, for slow connections
+    "low": AudioProfile(
+        ".low.opus",
+        "audio/ogg",
+        ["-vn", "-ac", "1", "-acodec", "libopus", "-b:a", "16k", "-f", "ogg"],
+    ),
+}
+
+
+def master_format(filename: str) -> AudioFormat:
+    # Recordings stored before Opus masters were introduced are mp3
+    return "mp3" if filename.endswith(".mp3") else "opus"
+
+
+class DerivedAudioCache:
+    """
+    Size-bounded LRU of derived formats on the local disk.
+
+    Recency is the file mtime, bumped on every hit, so the cache survives
+    restarts and is shared by every API process on the node.
+    """
+
+    def __init__(self, root: Path, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path_for(self, content_hash: str, format: AudioFormat) -> Path:
+        return self.root / RecordingStorage.key_for(
+            content_hash, PROFILES[format].suffix
+        )
+
+    def touch(self, path: Path) -> bool:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def add(self, path: Path, source: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(source, path)
+        self.evict(keep=path)
+
+    def evict(self, keep: Path | None = None) -> None:
+        entries = []
+        total = 0
+        for path in self.root.glob("*/*/*"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                remove_quietly(path)
+                total -= size
+
+    def discard(self, content_hash: str) -> None:
+        for format in PROFILES:
+            remove_quietly(self.path_for(content_hash, format))
+
+
+@lru_cache
+def get_cache() -> DerivedAudioCache:
+    return DerivedAudioCache(
+        settings.RECORDINGS_DIR / "cache", settings.RECORDINGS_CACHE_MAX_BYTES
+    )
+
+
+def _spool_file() -> Path:
+    fd, name = tempfile.mkstemp(dir=spool_dir("derived"))
+    os.close(fd)
+    return Path(name)
+
+
+# One conversion per file at a time in this process, others wait for it
+_conversions: weakref.WeakValueDictionary[Path, asyncio.Lock] = (
+    weakref.WeakValueDictionary()
+)
+
+
+async def derived_audio(filename: str, content_hash: str, format: AudioFormat) -> Path:
+    """
+    Local path of a recording in ``format``, converted from the master on
+    first use.
+    """
+    cache = get_cache()
+    path = cache.path_for(content_hash, format)
+    if await run_in_threadpool(cache.touch, path):
+        return path
+    lock = _conversions.get(path)
+    if lock is None:
+        lock = _conversions[path] = asyncio.Lock()
+    async with lock:
+        if await run_in_threadpool(cache.touch, path):
+            return path
+        storage = get_storage()
+        master = storage.local_path(filename)
+        fetched = None
+        if master is None:
+            fetched = master = _spool_file()
+        output = _spool_file()
+        try:
+            if fetched is not None:
+                await run_in_threadpool(storage.fetch, filename, fetched)
+            async with get_slots().hold():
+                await transcode_stream(
+                    iter_file_chunks(master), output, PROFILES[format].output_args
+                )
+            await run_in_threadpool(cache.add, path, output)
+        finally:
+            remove_quietly(output)
+            if fetched is not None:
+                remove_quietly(fetched)
+    return path
@@ -0,0 +1,41 @@
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.models import utcnow
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def heartbeat(beat: Callable[[], None]) -> AsyncIterator[None]:
+    """
+    Call ``beat`` every RECORDINGS_JOB_HEARTBEAT_SECONDS while the body runs,
+    so worker processes that start meanwhile do not take the work for
+    abandoned.
+    """
+
+    async def run() -> None:
+        while True:
+            await asyncio.sleep(settings.RECORDINGS_JOB_HEARTBEAT_SECONDS)
+            try:
+                await run_in_threadpool(beat)
+            except Exception as e:
+                # Missing one is fine, the work is only stale after several
+                logger.warning("Could not refresh a heartbeat: %s", e)
+
+    task = asyncio.create_task(run())
+    try:
+        yield
+    finally:
+        task.cancel()
+
+
+def stale_before() -> datetime:
+    # Work whose heartbeat is older was left by a process that died
+    return utcnow() - timedelta(seconds=settings.RECORDINGS_JOB_STALE_SECONDS)
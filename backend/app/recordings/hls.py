@@ -0,0 +1,98 @@
+import logging
+import re
+import shutil
+import tempfile
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.recordings.ffmpeg import FFmpegError, run_ffmpeg
+from app.recordings.storage import (
+    RecordingStorage,
+    StorageError,
+    get_storage,
+    spool_dir,
+)
+
+logger = logging.getLogger(__name__)
+
+PLAYLIST = "index.m3u8"
+SEGMENT_NAME = re.compile(r"seg\d{5}\.ts")
+# A playlist lists a segment per few seconds, this is days of audio
+MAX_PLAYLIST_BYTES = 1024 * 1024
+
+# AAC in MPEG-TS plays natively in Safari and through hls.js everywhere else
+HLS_OUTPUT_ARGS = ["-vn", "-acodec", "aac", "-b:a", "96k", "-f", "hls"]
+
+
+def hls_key(content_hash: str, name: str) -> str:
+    return RecordingStorage.key_for(content_hash, f".hls/{name}")
+
+
+def playlist_segments(playlist: bytes) -> list[str]:
+    """
+    Names of the segments a playlist refers to, in order.
+    """
+    lines = playlist.decode().splitlines()
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+async def package_hls(audio_path: Path, directory: Path) -> None:
+    await run_ffmpeg(
+        [
+            "-i",
+            str(audio_path),
+            *HLS_OUTPUT_ARGS,
+            "-hls_time",
+            str(settings.RECORDINGS_HLS_SEGMENT_SECONDS),
+            "-hls_playlist_type",
+            "vod",
+            "-hls_segment_filename",
+            str(directory / "seg%05d.ts"),
+            str(directory / PLAYLIST),
+        ]
+    )
+
+
+def _save_package(content_hash: str, directory: Path) -> None:
+    storage = get_storage()
+    playlist = directory / PLAYLIST
+    for name in playlist_segments(playlist.read_bytes()):
+        storage.save(hls_key(content_hash, name), directory / name)
+    # Stored last, a playlist is only there once all its segments are
+    storage.save(hls_key(content_hash, PLAYLIST), playlist)
+
+
+async def store_hls(
+    content_hash: str, audio_path: Path, duration: float | None
+) -> None:
+    """
+    Package a long recording as HLS, when enabled.
+    """
+    if (
+        not settings.RECORDINGS_HLS
+        or (duration or 0) < settings.RECORDINGS_HLS_MIN_SECONDS
+    ):
+        return
+    # Like the peaks, a recording without HLS still plays from its audio
+    directory = Path(tempfile.mkdtemp(dir=spool_dir("hls")))
+    try:
+        await package_hls(audio_path, directory)
+        await run_in_threadpool(_save_package, content_hash, directory)
+    except (FFmpegError, OSError, StorageError) as e:
+        logger.warning("Could not package %s as HLS: %s", content_hash, e)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def delete_hls(content_hash: str) -> None:
+    storage = get_storage()
+    playlist_key = hls_key(content_hash, PLAYLIST)
+    playlist = storage.read_range(playlist_key, 0, MAX_PLAYLIST_BYTES)
+    if playlist is None:
+        return
+    # The playlist goes first, so a half deleted package is never served
+    storage.delete(playlist_key)
+    for name in playlist_segments(playlist):
+        storage.delete(hls_key(content_hash, name))
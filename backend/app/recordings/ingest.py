@@ -0,0 +1,210 @@
+import hashlib
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO
+
+from fastapi import HTTPException, Request
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+# Leading bytes of the containers MediaRecorder and common recorders produce.
+# Checked on the first bytes of each file part, before the rest is read.
+AUDIO_SIGNATURES: dict[str, tuple[int, bytes]] = {
+    "webm": (0, b"\x1a\x45\xdf\xa3"),  # EBML header (webm / matroska)
+    "ogg": (0, b"OggS"),
+    "flac": (0, b"fLaC"),
+    "wav": (8, b"WAVE"),
+    "mp4": (4, b"ftyp"),
+    "mp3": (0, b"ID3"),
+}
+SNIFF_BYTES = 12
+
+# Multipart boundaries and part headers on top of the file bytes themselves
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+
+def sniff_audio_format(head: bytes) -> str | None:
+    for name, (offset, signature) in AUDIO_SIGNATURES.items():
+        if head[offset : offset + len(signature)] == signature:
+            return name
+    # Raw MPEG audio frames start with an 11-bit frame sync
+    if len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        return "mp3"
+    return None
+
+
+@dataclass
+class UploadPart:
+    field_name: str
+    filename: str
+    content_type: str
+    audio_format: str | None = None
+    size: int = 0
+    # Hex sha256 of the file bytes, set once the part is complete
+    sha256: str | None = None
+    _head: bytes = field(default=b"", repr=False)
+    _hasher: "hashlib._Hash" = field(default_factory=hashlib.sha256, repr=False)
+
+
+class _AudioUploadParser:
+    """
+    Incremental multipart parser that hands out file bytes as they arrive.
+
+    Only file parts are kept; plain form fields are ignored.
+    """
+
+    def __init__(self, *, max_file_bytes: int, max_files: int) -> None:
+        self.max_file_bytes = max_file_bytes
+        self.max_files = max_files
+        self.files = 0
+        self.events: list[tuple[UploadPart, bytes]] = []
+        self._part: UploadPart | None = None
+        self._headers: dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_part_begin(self) -> None:
+        self._part = None
+        self._headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        if b"filename" not in options:
+            return
+        self.files += 1
+        if self.files > self.max_files:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many files, at most {self.max_files} per request",
+            )
+        content_type = self._headers.get(b"content-type", b"").decode("latin-1")
+        if not content_type.startswith("audio/"):
+            raise HTTPException(status_code=400, detail="File must be an audio type")
+        self._part = UploadPart(
+            field_name=options.get(b"name", b"").decode("latin-1"),
+            filename=options[b"filename"].decode("latin-1"),
+            content_type=content_type,
+        )
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        part = self._part
+        if part is None:
+            return
+        chunk = data[start:end]
+        part.size += len(chunk)
+        if part.size > self.max_file_bytes:
+            raise HTTPException(status_code=413, detail="Recording is too large")
+        if part.audio_format is None:
+            # Hold back the first bytes until the container can be identified
+            part._head += chunk
+            if len(part._head) < SNIFF_BYTES:
+                return
+            self._check_signature(part)
+            chunk, part._head = part._head, b""
+        part._hasher.update(chunk)
+        self.events.append((part, chunk))
+
+    def on_part_end(self) -> None:
+        part = self._part
+        if part is None:
+            return
+        if part.audio_format is None:
+            self._check_signature(part)
+            part._hasher.update(part._head)
+            self.events.append((part, part._head))
+            part._head = b""
+        part.sha256 = part._hasher.hexdigest()
+        # An empty chunk marks the end of a file part
+        self.events.append((part, b""))
+        self._part = None
+
+    def _check_signature(self, part: UploadPart) -> None:
+        audio_format = sniff_audio_format(part._head)
+        if audio_format is None:
+            raise HTTPException(
+                status_code=400, detail="File content is not a supported audio format"
+            )
+        part.audio_format = audio_format
+
+
+async def iter_upload_chunks(
+    request: Request, *, max_file_bytes: int, max_files: int = 1
+) -> AsyncIterator[tuple[UploadPart, bytes]]:
+    """
+    Stream the audio file parts of a multipart request as ``(part, chunk)`` pairs.
+
+    Each part ends with an empty chunk. Oversized or non-audio parts are rejected
+    as soon as the offending bytes arrive, without reading the rest of the body.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(
+            status_code=400, detail="Expected a multipart/form-data body"
+        )
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit():
+        body_limit = (max_file_bytes + MULTIPART_OVERHEAD_BYTES) * max_files
+        if int(content_length) > body_limit:
+            raise HTTPException(status_code=413, detail="Recording is too large")
+
+    handler = _AudioUploadParser(max_file_bytes=max_file_bytes, max_files=max_files)
+    parser = MultipartParser(
+        params[b"boundary"],
+        {
+            "on_part_begin": handler.on_part_begin,
+            "on_part_data": handler.on_part_data,
+            "on_part_end": handler.on_part_end,
+            "on_header_field": handler.on_header_field,
+            "on_header_value": handler.on_header_value,
+            "on_header_end": handler.on_header_end,
+            "on_headers_finished": handler.on_headers_finished,
+        },
+    )
+    async for body_chunk in request.stream():
+        parser.write(body_chunk)
+        for event in handler.events:
+            yield event
+        handler.events.clear()
+    parser.finalize()
+    for event in handler.events:
+        yield event
+    if handler.files == 0:
+        raise HTTPException(status_code=400, detail="No audio file in the request")
+
+
+async def stream_upload_to_file(
+    request: Request, destination: BinaryIO, *, max_file_bytes: int
+) -> UploadPart:
+    """
+    Write the single audio file of a multipart request to ``destination``.
+
+    Disk writes run in the threadpool so the event loop keeps serving requests.
+    """
+    upload: UploadPart | None = None
+    async for part, chunk in iter_upload_chunks(request, max_file_bytes=max_file_bytes):
+        upload = part
+        if chunk:
+            await run_in_threadpool(destination.write, chunk)
+    assert upload is not None  # iter_upload_chunks rejects bodies without a file
+    await run_in_threadpool(destination.flush)
+    return upload
+
+
+def remove_quietly(path: Path) -> None:
+    try:
+        path.unlink(missing_ok=True)
+    except OSError:
+        pass
@@ -0,0 +1,477 @@
+import asyncio
+import logging
+import uuid
+from functools import partial
+from pathlib import Path
+
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Recording, RecordingBlob, RecordingJob, utcnow
+from app.recordings import direct
+from app.recordings.admission import get_slots
+from app.recordings.features import store_features
+from app.recordings.ffmpeg import (
+    AudioProbe,
+    FFmpegError,
+    iter_file_chunks,
+    probe_audio,
+)
+from app.recordings.fingerprint import store_fingerprint
+from app.recordings.heartbeat import heartbeat, stale_before
+from app.recordings.hls import store_hls
+from app.recordings.ingest import remove_quietly
+from app.recordings.lifecycle import release_blob
+from app.recordings.live import LiveRecording
+from app.recordings.parallel import encode_master
+from app.recordings.peaks import compute_peaks, peaks_key
+from app.recordings.storage import (
+    RecordingStorage,
+    StorageError,
+    get_storage,
+    spool_dir,
+)
+from app.recordings.transcription import queue_transcript, transcription_worker
+from app.recordings.vad import PCM_INPUT_ARGS, trim_silence
+
+logger = logging.getLogger(__name__)
+
+
+def _create_recording(
+    session: Session,
+    blob: RecordingBlob,
+    probe: AudioProbe | None,
+    speech_segments: list[tuple[float, float]] | None = None,
+    owner_id: uuid.UUID | None = None,
+    commit: bool = True,
+) -> Recording:
+    if probe is None:
+        # Same bytes as an earlier recording, reuse what was found then
+        sibling = crud.get_recording_by_hash(
+            session=session, content_hash=blob.content_hash
+        )
+        probe = AudioProbe(
+            duration=sibling.duration if sibling else None,
+            codec=sibling.codec if sibling else None,
+        )
+        speech_segments = sibling.speech_segments if sibling else None
+    return crud.create_recording(
+        session=session,
+        blob=blob,
+        duration=probe.duration,
+        codec=probe.codec,
+        speech_segments=speech_segments,
+        owner_id=owner_id,
+        # Every upload reserves its place in the quota before it is converted
+        quota_reserved=True,
+        commit=commit,
+    )
+
+
+def release_quota(
+    session: Session, owner_id: uuid.UUID | None, *, commit: bool = True
+) -> None:
+    if owner_id is not None:
+        crud.release_recording_quota(session=session, user_id=owner_id, commit=commit)
+
+
+def register_upload(
+    *,
+    session: Session,
+    source_path: Path,
+    content_hash: str,
+    owner_id: uuid.UUID | None = None,
+) -> tuple[RecordingJob, bool]:
+    """
+    Create the job for a spooled upload, or reuse what is already there.
+
+    Returns the job and whether it still needs transcoding. Bytes that were
+    stored before take a new reference on the existing file, and a retry of an
+    upload that is still queued or running gets the original job back. The
+    same bytes from another user get a job of their own, which shares the
+    file once it is stored.
+    """
+    blob = crud.acquire_recording_blob(session=session, content_hash=content_hash)
+    if blob is not None:
+        remove_quietly(source_path)
+        recording = _create_recording(session, blob, None, owner_id=owner_id)
+        job = crud.create_recording_job(
+            session=session,
+            source_path=str(source_path),
+            content_hash=content_hash,
+            status="done",
+            filename=blob.filename,
+            recording_id=recording.id,
+            owner_id=owner_id,
+        )
+        return job, False
+    active = crud.get_active_recording_job(
+        session=session, content_hash=content_hash, owner_id=owner_id
+    )
+    if active is not None:
+        # The recording is made for the upload that came first
+        remove_quietly(source_path)
+        release_quota(session, owner_id)
+        return active, False
+    job = crud.create_recording_job(
+        session=session,
+        source_path=str(source_path),
+        content_hash=content_hash,
+        owner_id=owner_id,
+    )
+    return job, True
+
+
+def register_direct_upload(
+    *,
+    session: Session,
+    source_path: Path,
+    source_key: str,
+    owner_id: uuid.UUID,
+) -> tuple[RecordingJob, bool]:
+    """
+    Create the job for the object of a direct upload, the worker fetches and
+    hashes it. A retry of the completion gets the original job back.
+    """
+    active = crud.get_active_direct_recording_job(
+        session=session, source_key=source_key
+    )
+    if active is not None:
+        release_quota(session, owner_id)
+        return active, False
+    job = crud.create_recording_job(
+        session=session,
+        source_path=str(source_path),
+        source_key=source_key,
+        owner_id=owner_id,
+    )
+    return job, True
+
+
+def _claim(job_id: uuid.UUID) -> RecordingJob | None:
+    with Session(engine) as session:
+        return crud.claim_recording_job(session=session, job_id=job_id)
+
+
+def _finish(
+    job: RecordingJob,
+    *,
+    blob: RecordingBlob | None = None,
+    probe: AudioProbe | None = None,
+    speech_segments: list[tuple[float, float]] | None = None,
+    error: str | None = None,
+) -> RecordingJob:
+    with Session(engine) as session:
+        if blob is None:
+            # Given back in the same transaction, so a failed job is never
+            # seen still holding its reservation
+            release_quota(session, job.owner_id, commit=False)
+            finished = crud.finish_recording_job(
+                session=session, db_job=job, error=error
+            )
+            if finished is not None:
+                return finished
+        else:
+            recording = _create_recording(
+                session,
+                blob,
+                probe,
+                speech_segments,
+                owner_id=job.owner_id,
+                commit=False,
+            )
+            finished = crud.finish_recording_job(
+                session=session,
+                db_job=job,
+                filename=blob.filename,
+                recording_id=recording.id,
+            )
+            if finished is not None:
+                queue_transcript(session, blob.content_hash)
+                session.refresh(finished)
+                return finished
+            # Failed as abandoned meanwhile and its quota given back, the
+            # recording was rolled back and the file is not needed for it
+            release_blob(session, blob.content_hash)
+        logger.warning("Recording job %s had already ended", job.id)
+        ended = session.get(RecordingJob, job.id)
+        assert ended is not None
+        return ended
+
+
+def _acquire_blob(content_hash: str) -> RecordingBlob | None:
+    with Session(engine) as session:
+        return crud.acquire_recording_blob(session=session, content_hash=content_hash)
+
+
+def _store(content_hash: str, path: Path) -> RecordingBlob:
+    filename = RecordingStorage.key_for(content_hash, path.suffix)
+    byte_size = get_storage().save(filename, path)
+    with Session(engine) as session:
+        return crud.create_recording_blob(
+            session=session,
+            content_hash=content_hash,
+            filename=filename,
+            byte_size=byte_size,
+        )
+
+
+async def store_peaks(content_hash: str, audio_path: Path) -> None:
+    # The waveform is a nice to have, a recording without one is still usable
+    peaks_path = spool_dir("encoded") / f"{content_hash}.peaks"
+    try:
+        await compute_peaks(iter_file_chunks(audio_path), peaks_path)
+        await run_in_threadpool(get_storage().save, peaks_key(content_hash), peaks_path)
+    except (FFmpegError, OSError, StorageError) as e:
+        logger.warning("Could not compute peaks for %s: %s", content_hash, e)
+    finally:
+        remove_quietly(peaks_path)
+
+
+def _set_content_hash(job: RecordingJob, content_hash: str) -> RecordingJob:
+    with Session(engine) as session:
+        job.content_hash = content_hash
+        job.source_key = None
+        job.heartbeat_at = utcnow()
+        session.add(job)
+        session.commit()
+        session.refresh(job)
+        return job
+
+
+async def _take_direct(job: RecordingJob, source: Path) -> RecordingJob:
+    # Downloaded and hashed here, the request completing the upload only
+    # looked at the object's size
+    assert job.source_key is not None
+    content_hash = await run_in_threadpool(
+        direct.take_object, get_storage(), job.source_key, source
+    )
+    return await run_in_threadpool(_set_content_hash, job, content_hash)
+
+
+def _requeue(job: RecordingJob) -> None:
+    with Session(engine) as session:
+        crud.requeue_recording_job(session=session, job_id=job.id)
+
+
+def _beat(job_id: uuid.UUID) -> None:
+    with Session(engine) as session:
+        crud.beat_recording_job(session=session, job_id=job_id)
+
+
+def fail_stale_jobs() -> int:
+    """
+    Fail uploads whose heartbeat stopped, left running by a worker process
+    that died, giving back their quota and spooled bytes.
+    """
+    with Session(engine) as session:
+        stale = crud.fail_stale_recording_jobs(
+            session=session,
+            beat_before=stale_before(),
+            error="Conversion was interrupted",
+        )
+        for job in stale:
+            release_quota(session, job.owner_id)
+            remove_quietly(Path(job.source_path))
+    return len(stale)
+
+
+def _queued_job_ids() -> list[uuid.UUID]:
+    with Session(engine) as session:
+        statement = (
+            select(RecordingJob.id)
+            .where(RecordingJob.status == "queued")
+            .order_by(RecordingJob.created_at)  # type: ignore[arg-type]
+        )
+        return list(session.exec(statement).all())
+
+
+async def _encode_master(
+    source: Path, content_hash: str
+) -> tuple[RecordingBlob, AudioProbe, list[tuple[float, float]] | None]:
+    # Only the master is encoded now, played formats derive from it
+    master_path = spool_dir("encoded") / f"{content_hash}.opus"
+    trimmed_path = spool_dir("encoded") / f"{content_hash}.pcm"
+    speech_segments = None
+    input_args = None
+    try:
+        async with get_slots().hold():
+            if settings.RECORDINGS_TRIM_SILENCE:
+                speech_segments = await trim_silence(
+                    iter_file_chunks(source),
+                    trimmed_path,
+                    max_pause_seconds=settings.RECORDINGS_MAX_PAUSE_SECONDS,
+                )
+                source, input_args = trimmed_path, PCM_INPUT_ARGS
+            await encode_master(source, master_path, input_args)
+            probe = await probe_audio(master_path)
+            await store_peaks(content_hash, master_path)
+            await store_hls(content_hash, master_path, probe.duration)
+            await store_features(content_hash, master_path)
+            await store_fingerprint(content_hash, master_path)
+        blob = await run_in_threadpool(_store, content_hash, master_path)
+    finally:
+        remove_quietly(master_path)
+        remove_quietly(trimmed_path)
+    return blob, probe, speech_segments
+
+
+async def run_transcode_job(job_id: uuid.UUID) -> None:
+    job = await run_in_threadpool(_claim, job_id)
+    if job is None:
+        # Already picked up by another worker process
+        return
+    source = Path(job.source_path)
+    async with heartbeat(partial(_beat, job_id)):
+        await _run(job, source)
+    remove_quietly(source)
+
+
+async def _run(job: RecordingJob, source: Path) -> None:
+    job_id = job.id
+    try:
+        if job.source_key is not None:
+            job = await _take_direct(job, source)
+        content_hash = job.content_hash or uuid.uuid4().hex
+        # An identical upload may have finished while this one was queued
+        blob = await run_in_threadpool(_acquire_blob, content_hash)
+        probe = None
+        speech_segments = None
+        if blob is None:
+            blob, probe, speech_segments = await _encode_master(source, content_hash)
+        await run_in_threadpool(
+            _finish, job, blob=blob, probe=probe, speech_segments=speech_segments
+        )
+    except asyncio.CancelledError:
+        # Shutting down, leave the job for the next start to pick up
+        await run_in_threadpool(_requeue, job)
+        raise
+    except (FFmpegError, OSError) as e:
+        logger.warning("Recording job %s failed: %s", job_id, e)
+        await run_in_threadpool(_finish, job, error=f"Conversion error: {e}")
+    except StorageError as e:
+        logger.warning("Recording job %s failed: %s", job_id, e)
+        await run_in_threadpool(_finish, job, error=f"Storage error: {e}")
+    except direct.UnsupportedAudio as e:
+        await run_in_threadpool(_finish, job, error=str(e))
+    except Exception:
+        # Failed all the same, or the job would hold its quota and block
+        # uploads of the same bytes for good
+        logger.exception("Recording job %s crashed", job_id)
+        await run_in_threadpool(_finish, job, error="Internal error")
+    else:
+        transcription_worker.notify()
+
+
+def create_live_job(master_path: Path, owner_id: uuid.UUID) -> RecordingJob:
+    # Running from the start, the queue never picks it up
+    with Session(engine) as session:
+        return crud.create_recording_job(
+            session=session,
+            source_path=str(master_path),
+            status="running",
+            owner_id=owner_id,
+        )
+
+
+async def finish_live_job(job: RecordingJob, live: LiveRecording) -> RecordingJob:
+    """
+    Store the master of a live recording once its stream has ended.
+
+    Live recordings are not trimmed, that would mean encoding them again
+    after the stop and lose the point of encoding while recording.
+    """
+    try:
+        content_hash, master_path = await live.finish()
+        # Saved first, from here on a job whose process dies is failed as
+        # abandoned like an upload
+        job = await run_in_threadpool(_set_content_hash, job, content_hash)
+        async with heartbeat(partial(_beat, job.id)):
+            blob = await run_in_threadpool(_acquire_blob, content_hash)
+            probe = None
+            if blob is None:
+                async with get_slots().hold():
+                    probe = await probe_audio(master_path)
+                    await store_peaks(content_hash, master_path)
+                    await store_hls(content_hash, master_path, probe.duration)
+                    await store_features(content_hash, master_path)
+                    await store_fingerprint(content_hash, master_path)
+                blob = await run_in_threadpool(_store, content_hash, master_path)
+            job = await run_in_threadpool(_finish, job, blob=blob, probe=probe)
+    except (FFmpegError, OSError) as e:
+        logger.warning("Live recording %s failed: %s", job.id, e)
+        return await run_in_threadpool(_finish, job, error=f"Conversion error: {e}")
+    except StorageError as e:
+        logger.warning("Live recording %s failed: %s", job.id, e)
+        return await run_in_threadpool(_finish, job, error=f"Storage error: {e}")
+    except Exception:
+        # Failed all the same, nothing else would end the job and give its
+        # quota back
+        logger.exception("Live recording %s crashed", job.id)
+        return await run_in_threadpool(_finish, job, error="Internal error")
+    finally:
+        await live.close()
+    transcription_worker.notify()
+    return job
+
+
+async def abort_live_job(
+    job: RecordingJob, live: LiveRecording, reason: str
+) -> RecordingJob:
+    await live.close()
+    return await run_in_threadpool(_finish, job, error=reason)
+
+
+class TranscodeQueue:
+    """
+    In-process queue of recording jobs drained by a pool of worker tasks.
+
+    Job state lives in the database, so any API process can report on a job
+    no matter which one is running it.
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue[uuid.UUID] = asyncio.Queue()
+        self._workers: list[asyncio.Task[None]] = []
+
+    async def start(self, workers: int) -> None:
+        # A fresh queue binds to the running event loop
+        self._queue = asyncio.Queue()
+        if stale := await run_in_threadpool(fail_stale_jobs):
+            logger.warning("Failed %d recording jobs left running", stale)
+        for job_id in await run_in_threadpool(_queued_job_ids):
+            self._queue.put_nowait(job_id)
+        self._workers = [
+            asyncio.create_task(self._work(), name=f"transcode-worker-{i}")
+            for i in range(workers)
+        ]
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def enqueue(self, job_id: uuid.UUID) -> None:
+        self._queue.put_nowait(job_id)
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await run_transcode_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Recording job %s crashed", job_id)
+            finally:
+                self._queue.task_done()
+
+
+transcode_queue = TranscodeQueue()
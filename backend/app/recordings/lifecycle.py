@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import weakref
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.models import Recording, RecordingBlob, utcnow
+from app.recordings.admission import get_slots
+from app.recordings.ffmpeg import FFmpegError, iter_file_chunks, transcode_stream
+from app.recordings.formats import get_cache
+from app.recordings.hls import delete_hls
+from app.recordings.ingest import remove_quietly
+from app.recordings.peaks import peaks_key
+from app.recordings.storage import (
+    RecordingStorage,
+    StorageError,
+    get_archive_storage,
+    get_storage,
+    spool_dir,
+)
+
+logger = logging.getLogger(__name__)
+
+# Speech stays intelligible at this rate, a tenth of the master's size
+ARCHIVE_OUTPUT_ARGS = [
+    "-vn",
+    "-ac",
+    "1",
+    "-acodec",
+    "libopus",
+    "-b:a",
+    "12k",
+    "-application",
+    "voip",
+    "-f",
+    "ogg",
+]
+
+# How precisely accessed_at follows plays
+ACCESS_RESOLUTION = timedelta(days=1)
+
+
+def archive_key(content_hash: str) -> str:
+    return RecordingStorage.key_for(content_hash, ".archive.opus")
+
+
+def remove_blob_files(blob: RecordingBlob) -> None:
+    """
+    Delete everything stored for a file no recording uses any more.
+    """
+    storage = get_storage()
+    if blob.tier != "archive":
+        storage.delete(blob.filename)
+    get_archive_storage().delete(archive_key(blob.content_hash))
+    storage.delete(peaks_key(blob.content_hash))
+    delete_hls(blob.content_hash)
+    get_cache().discard(blob.content_hash)
+
+
+def delete_recording(session: Session, recording: Recording) -> None:
+    content_hash = recording.content_hash
+    crud.delete_recording(session=session, db_recording=recording)
+    release_blob(session, content_hash)
+
+
+def release_blob(session: Session, content_hash: str) -> None:
+    """
+    Drop a reference to a stored file, deleting it with the last one.
+    """
+    blob = crud.release_recording_blob(session=session, content_hash=content_hash)
+    if blob is not None:
+        try:
+            remove_blob_files(blob)
+        except StorageError as e:
+            logger.warning("Could not delete recording audio: %s", e)
+
+
+def _move_blob(content_hash: str, *, tier: str, filename: str, byte_size: int) -> None:
+    with Session(engine) as session:
+        blob = session.get(RecordingBlob, content_hash)
+        if blob is None:
+            return
+        blob.tier = tier
+        blob.filename = filename
+        blob.byte_size = byte_size
+        if tier == "hot":
+            blob.accessed_at = utcnow()
+        else:
+            # Played from the archive copy from now on, restores copy it as is
+            blob.revision += 1
+        session.add(blob)
+        session.commit()
+        crud.update_recordings_by_hash(
+            session=session,
+            content_hash=content_hash,
+            values={"filename": filename, "byte_size": byte_size},
+        )
+
+
+def _get_blob(content_hash: str) -> RecordingBlob | None:
+    with Session(engine) as session:
+        return session.get(RecordingBlob, content_hash)
+
+
+def _claim(content_hash: str, from_tier: str, to_tier: str) -> bool:
+    with Session(engine) as session:
+        return crud.claim_recording_blob_tier(
+            session=session,
+            content_hash=content_hash,
+            from_tier=from_tier,
+            to_tier=to_tier,
+        )
+
+
+def _fetch(storage: RecordingStorage, key: str, destination: Path) -> Path:
+    local = storage.local_path(key)
+    if local is not None:
+        return local
+    storage.fetch(key, destination)
+    return destination
+
+
+async def archive_blob(blob: RecordingBlob) -> bool:
+    """
+    Re-encode a hot file for the archive tier, False if it was not hot.
+
+    A file that was archived and restored before still has its archive copy,
+    so it is not encoded again.
+    """
+    if not await run_in_threadpool(_claim, blob.content_hash, "hot", "archiving"):
+        return False
+    storage = get_storage()
+    archive = get_archive_storage()
+    key = archive_key(blob.content_hash)
+    work = spool_dir("archive")
+    fetched = work / f"{blob.content_hash}.master"
+    encoded = work / f"{blob.content_hash}.opus"
+    try:
+        byte_size = await run_in_threadpool(archive.size, key)
+        if byte_size is None:
+            master = await run_in_threadpool(_fetch, storage, blob.filename, fetched)
+            async with get_slots().hold():
+                await transcode_stream(
+                    iter_file_chunks(master), encoded, ARCHIVE_OUTPUT_ARGS
+                )
+            byte_size = await run_in_threadpool(archive.save, key, encoded)
+        await run_in_threadpool(
+            _move_blob,
+            blob.content_hash,
+            tier="archive",
+            filename=key,
+            byte_size=byte_size,
+        )
+    except BaseException:
+        await run_in_threadpool(_claim, blob.content_hash, "archiving", "hot")
+        raise
+    finally:
+        remove_quietly(fetched)
+        remove_quietly(encoded)
+    await run_in_threadpool(storage.delete, blob.filename)
+    # Packaged from the hot file, backfill packages a restored one again
+    await run_in_threadpool(delete_hls, blob.content_hash)
+    await run_in_threadpool(get_cache().discard, blob.content_hash)
+    return True
+
+
+# One restore per file at a time in this process, others wait for it
+_restores: weakref.WeakValueDictionary[str, asyncio.Lock] = (
+    weakref.WeakValueDictionary()
+)
+
+
+async def restore_blob(content_hash: str) -> str:
+    """
+    Bring an archived file back to the hot tier and return its key.
+    """
+    lock = _restores.get(content_hash)
+    if lock is None:
+        lock = _restores[content_hash] = asyncio.Lock()
+    async with lock:
+        blob = await run_in_threadpool(_get_blob, content_hash)
+        if blob is not None and blob.tier != "archive":
+            # Restored while this request waited
+            return blob.filename
+        storage = get_storage()
+        filename = RecordingStorage.key_for(content_hash, ".opus")
+        restored = spool_dir("archive") / f"{content_hash}.restored"
+        try:
+            # Copied, the archive keeps its own in case the file ages again
+            await run_in_threadpool(
+                get_archive_storage().fetch, archive_key(content_hash), restored
+            )
+            byte_size = await run_in_threadpool(storage.save, filename, restored)
+        finally:
+            remove_quietly(restored)
+        await run_in_threadpool(
+            _move_blob, content_hash, tier="hot", filename=filename, byte_size=byte_size
+        )
+    return filename
+
+
+def _touch(content_hash: str) -> RecordingBlob | None:
+    now = utcnow()
+    with Session(engine) as session:
+        crud.touch_recording_blob(
+            session=session,
+            content_hash=content_hash,
+            accessed_at=now,
+            stale=now - ACCESS_RESOLUTION,
+        )
+        return session.get(RecordingBlob, content_hash)
+
+
+async def playable_filename(recording: Recording) -> str:
+    """
+    Key of a recording's hot file, restoring it from the archive if needed.
+    """
+    blob = await run_in_threadpool(_touch, recording.content_hash)
+    if blob is None or blob.tier != "archive":
+        return recording.filename
+    return await restore_blob(recording.content_hash)
+
+
+def expire_recordings(before: datetime, limit: int) -> int:
+    with Session(engine) as session:
+        recordings = crud.get_recordings_created_before(
+            session=session, before=before, limit=limit
+        )
+        for recording in recordings:
+            delete_recording(session, recording)
+    return len(recordings)
+
+
+async def run_lifecycle(batch_size: int = 50) -> tuple[int, int]:
+    """
+    One pass of retention and archiving, returns (archived, expired).
+
+    Candidates come off indexes in batches and every file that is handled
+    leaves the candidate set, so a pass never rescans what it did.
+    """
+    now = utcnow()
+    expired = 0
+    if settings.RECORDINGS_RETENTION_DAYS is not None:
+        cutoff = now - timedelta(days=settings.RECORDINGS_RETENTION_DAYS)
+        while count := await run_in_threadpool(expire_recordings, cutoff, batch_size):
+            expired += count
+    archived = 0
+    if settings.RECORDINGS_ARCHIVE_AFTER_DAYS is not None:
+        cutoff = now - timedelta(days=settings.RECORDINGS_ARCHIVE_AFTER_DAYS)
+        after = None
+        while blobs := await run_in_threadpool(
+            _archive_candidates, cutoff, after, batch_size
+        ):
+            for blob in blobs:
+                try:
+                    archived += await archive_blob(blob)
+                except (FFmpegError, StorageError, OSError) as e:
+                    logger.warning("Could not archive %s: %s", blob.content_hash, e)
+            after = (blobs[-1].accessed_at, blobs[-1].content_hash)
+    return archived, expired
+
+
+def _archive_candidates(
+    cutoff: datetime, after: tuple[datetime, str] | None, limit: int
+) -> list[RecordingBlob]:
+    with Session(engine) as session:
+        return crud.get_recording_blobs_to_archive(
+            session=session, accessed_before=cutoff, after=after, limit=limit
+        )
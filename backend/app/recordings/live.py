@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import uuid
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+from fastapi import WebSocketException, status
+
+from app.recordings.ffmpeg import OPUS_OUTPUT_ARGS, transcode_stream
+from app.recordings.ingest import SNIFF_BYTES, remove_quietly, sniff_audio_format
+from app.recordings.storage import spool_dir
+
+# Chunks waiting for the encoder before the client is made to wait, a
+# MediaRecorder timeslice is a few KB so this is seconds of audio
+LIVE_QUEUE_CHUNKS = 32
+
+
+class LiveRecording:
+    """
+    A recording encoded while it is being made.
+
+    Chunks are fed to one long-running ffmpeg as they arrive, so when the
+    recording stops only the encoder's tail is left to flush. The content hash
+    is computed over the received bytes, the same as for an upload.
+    """
+
+    def __init__(self, *, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.master_path = spool_dir("encoded") / f"{uuid.uuid4()}.live.opus"
+        self._hasher = hashlib.sha256()
+        self._head = b""
+        self._queue: asyncio.Queue[bytes | None] = asyncio.Queue(LIVE_QUEUE_CHUNKS)
+        self._encoder: asyncio.Task[None] | None = None
+
+    async def _chunks(self) -> AsyncIterator[bytes]:
+        while (chunk := await self._queue.get()) is not None:
+            yield chunk
+
+    async def _put(self, chunk: bytes | None) -> None:
+        assert self._encoder is not None
+        put = asyncio.ensure_future(self._queue.put(chunk))
+        await asyncio.wait({put, self._encoder}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            # The encoder stopped reading, its result tells why
+            put.cancel()
+            await self._encoder
+
+    def _start_encoder(self) -> None:
+        if sniff_audio_format(self._head) is None:
+            raise WebSocketException(
+                code=status.WS_1003_UNSUPPORTED_DATA,
+                reason="Stream is not a supported audio format",
+            )
+        self._encoder = asyncio.create_task(
+            transcode_stream(
+                self._chunks(), self.master_path, OPUS_OUTPUT_ARGS, live=True
+            )
+        )
+
+    async def feed(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise WebSocketException(
+                code=status.WS_1009_MESSAGE_TOO_BIG, reason="Recording is too large"
+            )
+        self._hasher.update(chunk)
+        if self._encoder is None:
+            # Held back until there is enough to check the container
+            self._head += chunk
+            if len(self._head) < SNIFF_BYTES:
+                return
+            self._start_encoder()
+            chunk, self._head = self._head, b""
+        await self._put(chunk)
+
+    async def finish(self) -> tuple[str, Path]:
+        """
+        Flush the encoder, returns the content hash and the encoded master.
+        """
+        if self._encoder is None:
+            self._start_encoder()
+            await self._put(self._head)
+        await self._put(None)
+        assert self._encoder is not None
+        await self._encoder
+        return self._hasher.hexdigest(), self.master_path
+
+    async def close(self) -> None:
+        """
+        Stop the encoder if it still runs and remove what was not stored.
+        """
+        if self._encoder is not None:
+            self._encoder.cancel()
+            await asyncio.gather(self._encoder, return_exceptions=True)
+        remove_quietly(self.master_path)
@@ -0,0 +1,209 @@
+import fcntl
+import json
+import logging
+import os
+import uuid
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any
+
+from app.recordings.storage import spool_dir
+
+logger = logging.getLogger(__name__)
+
+# How an ffmpeg or ffprobe process ended
+OUTCOMES = ("ok", "error", "killed", "timeout", "cancelled")
+# What the API processes that exited had counted, folded into one file
+RETIRED = "retired"
+
+
+@contextmanager
+def _locked(path: Path) -> Iterator[None]:
+    fd = os.open(path, os.O_CREAT | os.O_RDWR)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _is_alive(lock_path: Path) -> bool:
+    # Held by its process for as long as it runs, released by the kernel
+    try:
+        fd = os.open(lock_path, os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+
+def _read(path: Path) -> dict[str, Any] | None:
+    try:
+        return json.loads(path.read_text())  # type: ignore[no-any-return]
+    except FileNotFoundError:
+        return None
+
+
+def _write(path: Path, snapshot: dict[str, Any]) -> None:
+    # Replaced at once, readers never see half of it
+    partial = path.with_suffix(".partial")
+    partial.write_text(json.dumps(snapshot))
+    os.replace(partial, path)
+
+
+class ProcessMetrics:
+    """
+    Counters of the ffmpeg and ffprobe processes run on this node.
+
+    Each API process counts its own and publishes them to a file in the
+    spool directory, with a lock it holds while it runs, like a transcode
+    slot. Rendering sums up the files of every process. Those of processes
+    that exited are folded into one, so their counters are kept and only
+    their running processes are dropped.
+    """
+
+    def __init__(self) -> None:
+        self.id = uuid.uuid4().hex
+        self.running: Counter[str] = Counter()
+        self.finished: Counter[tuple[str, str]] = Counter()
+        self.seconds: dict[str, float] = {}
+        self._directory: Path | None = None
+        self._lock_fd: int | None = None
+
+    def reset(self) -> None:
+        """
+        Count from zero under a new file, in a forked process (e.g. the
+        backfill's pool) whose parent keeps publishing its own.
+        """
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+        self.id = uuid.uuid4().hex
+        self.running.clear()
+        self.finished.clear()
+        self.seconds.clear()
+        self._directory = None
+        self._lock_fd = None
+
+    def started(self, program: str) -> None:
+        self.running[program] += 1
+        self._publish()
+
+    def ended(self, program: str, outcome: str, seconds: float) -> None:
+        self.running[program] -= 1
+        self.finished[program, outcome] += 1
+        self.seconds[program] = self.seconds.get(program, 0.0) + seconds
+        self._publish()
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "running": dict(self.running),
+            "finished": [[p, o, count] for (p, o), count in self.finished.items()],
+            "seconds": self.seconds,
+        }
+
+    def add(self, snapshot: dict[str, Any], *, running: bool = True) -> None:
+        if running:
+            self.running.update(snapshot["running"])
+        for program, outcome, count in snapshot["finished"]:
+            self.finished[program, outcome] += count
+        for program, seconds in snapshot["seconds"].items():
+            self.seconds[program] = self.seconds.get(program, 0.0) + seconds
+
+    def _publish(self) -> None:
+        # Metrics never get in the way of a conversion
+        try:
+            directory = spool_dir("metrics")
+            if directory != self._directory:
+                self._hold(directory)
+            _write(directory / f"{self.id}.json", self.snapshot())
+        except OSError as e:
+            logger.warning("Could not publish ffmpeg metrics: %s", e)
+
+    def _hold(self, directory: Path) -> None:
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        fd = os.open(directory / f"{self.id}.lock", os.O_CREAT | os.O_RDWR)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        self._lock_fd = fd
+        self._directory = directory
+
+    def collect(self) -> "ProcessMetrics":
+        """
+        The counters of every API process on the node, this one included.
+        """
+        directory = spool_dir("metrics")
+        total = ProcessMetrics()
+        total.add(self.snapshot())
+        # One reader at a time folds the files of processes that exited
+        with _locked(directory / f"{RETIRED}.lock"):
+            retired_path = directory / f"{RETIRED}.json"
+            retired = ProcessMetrics()
+            if (snapshot := _read(retired_path)) is not None:
+                retired.add(snapshot, running=False)
+            exited = []
+            for path in directory.glob("*.json"):
+                if path.stem in (self.id, RETIRED):
+                    continue
+                if (snapshot := _read(path)) is None:
+                    continue
+                if _is_alive(path.with_suffix(".lock")):
+                    total.add(snapshot)
+                else:
+                    retired.add(snapshot, running=False)
+                    exited.append(path)
+            if exited:
+                _write(retired_path, retired.snapshot())
+                for path in exited:
+                    path.unlink(missing_ok=True)
+                    path.with_suffix(".lock").unlink(missing_ok=True)
+        total.add(retired.snapshot(), running=False)
+        return total
+
+    def render(self) -> str:
+        """
+        The counters of the node in the Prometheus text exposition format.
+        """
+        total = self.collect()
+        programs = sorted(
+            {program for program, _ in total.finished} | set(total.running)
+        )
+        lines = [
+            "# HELP recordings_ffmpeg_running Processes running now.",
+            "# TYPE recordings_ffmpeg_running gauge",
+        ]
+        lines += [
+            f'recordings_ffmpeg_running{{program="{program}"}} {total.running[program]}'
+            for program in programs
+        ]
+        lines += [
+            "# HELP recordings_ffmpeg_processes_total Processes that ended, by outcome.",
+            "# TYPE recordings_ffmpeg_processes_total counter",
+        ]
+        lines += [
+            f'recordings_ffmpeg_processes_total{{program="{program}",outcome="{outcome}"}} '
+            f"{total.finished[program, outcome]}"
+            for program in programs
+            for outcome in OUTCOMES
+        ]
+        lines += [
+            "# HELP recordings_ffmpeg_seconds_total Wall clock time of ended processes.",
+            "# TYPE recordings_ffmpeg_seconds_total counter",
+        ]
+        lines += [
+            f'recordings_ffmpeg_seconds_total{{program="{program}"}} '
+            f"{total.seconds.get(program, 0.0):.3f}"
+            for program in programs
+        ]
+        return "\n".join(lines) + "\n"
+
+
+process_metrics = ProcessMetrics()
+os.register_at_fork(after_in_child=process_metrics.reset)
@@ -0,0 +1,220 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.recordings.admission import get_slots
+from app.recordings.ffmpeg import (
+    FILE_CHUNK_BYTES,
+    OPUS_OUTPUT_ARGS,
+    FFmpegError,
+    iter_file_chunks,
+    probe_audio,
+    run_ffmpeg,
+    transcode_stream,
+)
+from app.recordings.ingest import remove_quietly
+from app.recordings.storage import spool_dir
+from app.recordings.vad import (
+    FRAME_SECONDS,
+    PCM_ARGS,
+    PCM_INPUT_ARGS,
+    VAD_SAMPLE_RATE,
+    frame_energy_db,
+)
+
+logger = logging.getLogger(__name__)
+
+# libopus delays its output by this many samples at 48 kHz (the pre-skip)
+# and encodes 20 ms frames
+OPUS_DELAY_SAMPLES = 312
+OPUS_FRAME_SAMPLES = 960
+# Boundaries move to the quietest frame this close to where they would fall
+SPLIT_SEARCH_SECONDS = 10.0
+
+
+def plan_segments(samples: NDArray[np.int16], segment_samples: int) -> list[int]:
+    """
+    Sample offsets to split PCM at, first 0 and last its length.
+
+    Each split is at the quietest frame near a multiple of ``segment_samples``,
+    a pause in speech where there is one, moved forward to where the previous
+    segment ends on a whole Opus frame.
+    """
+    boundaries = [0]
+    frame = int(VAD_SAMPLE_RATE * FRAME_SECONDS)
+    search = min(int(SPLIT_SEARCH_SECONDS * VAD_SAMPLE_RATE), segment_samples // 4)
+    target = segment_samples
+    while target + search < len(samples):
+        low = target - search
+        db = frame_energy_db(samples[low : target + search], frame)
+        split = low + int(np.argmin(db)) * frame + frame // 2
+        # Every segment but the first carries the encoder delay in front
+        split += -(split + OPUS_DELAY_SAMPLES) % OPUS_FRAME_SAMPLES
+        if split >= len(samples):
+            break
+        boundaries.append(split)
+        target = split + segment_samples
+    boundaries.append(len(samples))
+    return boundaries
+
+
+async def _iter_range(path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+    with path.open("rb") as f:
+        f.seek(start)
+        while start < end:
+            chunk = await run_in_threadpool(f.read, min(FILE_CHUNK_BYTES, end - start))
+            if not chunk:
+                return
+            start += len(chunk)
+            yield chunk
+
+
+def _concat_list(segments: list[Path], boundaries: list[int]) -> str:
+    """
+    A concat demuxer script that places each segment where its audio started.
+
+    Segments after the first begin with the encoder delay, which stands in
+    for the samples cut from their start, so every segment but the last is
+    given its full encoded length rather than the length ffmpeg would assume.
+    """
+    lines = []
+    for i, path in enumerate(segments):
+        lines.append(f"file '{path}'")
+        if i < len(segments) - 1:
+            length = boundaries[i + 1] - boundaries[i]
+            if i == 0:
+                length += OPUS_DELAY_SAMPLES
+            lines.append(f"duration {length / VAD_SAMPLE_RATE:.6f}")
+    return "\n".join(lines) + "\n"
+
+
+async def encode_segments(
+    pcm_path: Path, destination: Path, boundaries: list[int], workers: int
+) -> None:
+    """
+    Encode the PCM between ``boundaries`` as separate Opus streams, ``workers``
+    ffmpeg processes at a time, and join them without re-encoding.
+    """
+    directory = Path(tempfile.mkdtemp(dir=spool_dir("segments")))
+    segments = [directory / f"{i:05d}.opus" for i in range(len(boundaries) - 1)]
+    pending: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(len(segments)):
+        pending.put_nowait(i)
+
+    async def work() -> None:
+        while not pending.empty():
+            i = pending.get_nowait()
+            # The encoder delay replaces as many samples at the start
+            start = boundaries[i] + (OPUS_DELAY_SAMPLES if i else 0)
+            await transcode_stream(
+                _iter_range(pcm_path, start * 2, boundaries[i + 1] * 2),
+                segments[i],
+                OPUS_OUTPUT_ARGS,
+                PCM_INPUT_ARGS,
+            )
+
+    try:
+        tasks = [asyncio.create_task(work()) for _ in range(workers)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        concat_list = directory / "segments.txt"
+        concat_list.write_text(_concat_list(segments, boundaries))
+        joined = directory / "joined.opus"
+        await run_ffmpeg(
+            [
+                "-f",
+                "concat",
+                "-safe",
+                "0",
+                "-i",
+                str(concat_list),
+                "-c",
+                "copy",
+                "-f",
+                "ogg",
+                "-y",
+                str(joined),
+            ]
+        )
+        os.replace(joined, destination)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _plan(pcm_path: Path) -> list[int]:
+    length = pcm_path.stat().st_size // 2
+    if length < (settings.RECORDINGS_PARALLEL_MIN_SECONDS or 0) * VAD_SAMPLE_RATE:
+        return [0, length]
+    samples = np.memmap(pcm_path, dtype="<i2", mode="r", shape=(length,))
+    segment_samples = int(
+        settings.RECORDINGS_PARALLEL_SEGMENT_SECONDS * VAD_SAMPLE_RATE
+    )
+    return plan_segments(samples, segment_samples)
+
+
+async def _is_long(source: Path, min_seconds: float) -> bool:
+    try:
+        probe = await probe_audio(source)
+    except FFmpegError:
+        # Left to the encoder to report
+        return False
+    return probe.duration is not None and probe.duration >= min_seconds
+
+
+async def encode_master(
+    source: Path, destination: Path, input_args: list[str] | None = None
+) -> None:
+    """
+    Encode the Opus master, long recordings in segments on several cores.
+
+    Called holding a transcode slot. Segments are encoded on the slots that
+    are free at the time as well, and on this one alone when none are.
+    ``input_args`` is PCM_INPUT_ARGS when ``source`` is already decoded.
+    """
+    min_seconds = settings.RECORDINGS_PARALLEL_MIN_SECONDS
+    if min_seconds is None or (
+        input_args is None and not await _is_long(source, min_seconds)
+    ):
+        await transcode_stream(
+            iter_file_chunks(source), destination, OPUS_OUTPUT_ARGS, input_args
+        )
+        return
+    decoded = None
+    if input_args is None:
+        # Decoded once, segments are cut from the PCM
+        decoded = spool_dir("segments") / f"{destination.name}.pcm"
+        await transcode_stream(iter_file_chunks(source), decoded, PCM_ARGS)
+        source = decoded
+    try:
+        boundaries = await run_in_threadpool(_plan, source)
+        if len(boundaries) <= 2:
+            await transcode_stream(
+                iter_file_chunks(source), destination, OPUS_OUTPUT_ARGS, PCM_INPUT_ARGS
+            )
+            return
+        segments = len(boundaries) - 1
+        async with get_slots().hold_free(segments - 1) as extra:
+            logger.info(
+                "Encoding %s in %d segments on %d cores",
+                destination.name,
+                segments,
+                extra + 1,
+            )
+            await encode_segments(source, destination, boundaries, extra + 1)
+    finally:
+        if decoded is not None:
+            remove_quietly(decoded)
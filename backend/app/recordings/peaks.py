@@ -0,0 +1,131 @@
+import struct
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+from starlette.concurrency import run_in_threadpool
+
+from app.recordings.ffmpeg import pipe_stream
+from app.recordings.storage import RecordingStorage
+
+# A waveform does not need more than telephone quality
+PEAKS_SAMPLE_RATE = 8000
+# The finest level has one min/max pair per 8ms of audio
+PEAKS_SAMPLES_PER_PEAK = 64
+# Coarser levels halve the finest one until they are about this short
+PEAKS_MIN_LENGTH = 256
+MAX_LEVELS = 24
+
+PCM_OUTPUT_ARGS = ["-vn", "-ac", "1", "-ar", str(PEAKS_SAMPLE_RATE), "-f", "s16le"]
+
+# Sidecar layout, all little-endian: a header, one entry per level, then each
+# level as interleaved int16 (min, max) pairs
+HEADER = struct.Struct("<4sBBHI")
+LEVEL = struct.Struct("<III")
+MAGIC = b"PEAK"
+VERSION = 1
+
+
+@dataclass
+class PeaksLevel:
+    samples_per_peak: int
+    length: int
+    offset: int
+
+    @property
+    def byte_size(self) -> int:
+        return self.length * 4
+
+
+def peaks_key(content_hash: str) -> str:
+    return RecordingStorage.key_for(content_hash, ".peaks")
+
+
+class PeaksBuilder:
+    """
+    Fold a stream of s16le PCM into min/max pairs at the finest resolution.
+    """
+
+    def __init__(self, samples_per_peak: int = PEAKS_SAMPLES_PER_PEAK) -> None:
+        self.samples_per_peak = samples_per_peak
+        self._pending = b""
+        self._blocks: list[NDArray[np.int16]] = []
+
+    def _fold(self, samples: NDArray[np.int16]) -> None:
+        blocks = samples.reshape(-1, self.samples_per_peak)
+        self._blocks.append(np.stack([blocks.min(axis=1), blocks.max(axis=1)], 1))
+
+    def feed(self, pcm: bytes) -> None:
+        data = self._pending + pcm
+        usable = len(data) - len(data) % (self.samples_per_peak * 2)
+        if usable:
+            self._fold(np.frombuffer(data[:usable], dtype="<i2"))
+        self._pending = data[usable:]
+
+    def finish(self) -> NDArray[np.int16]:
+        tail = np.frombuffer(self._pending[: len(self._pending) // 2 * 2], "<i2")
+        if tail.size:
+            self._blocks.append(np.array([[tail.min(), tail.max()]], dtype=np.int16))
+        if not self._blocks:
+            return np.zeros((0, 2), dtype=np.int16)
+        return np.concatenate(self._blocks)
+
+
+def build_levels(finest: NDArray[np.int16]) -> list[NDArray[np.int16]]:
+    levels = [finest]
+    while len(levels) < MAX_LEVELS and len(levels[-1]) >= PEAKS_MIN_LENGTH * 2:
+        previous = levels[-1]
+        if len(previous) % 2:
+            previous = np.concatenate([previous, previous[-1:]])
+        pairs = previous.reshape(-1, 2, 2)
+        levels.append(np.stack([pairs[:, :, 0].min(1), pairs[:, :, 1].max(1)], 1))
+    return levels
+
+
+def encode_peaks(levels: list[NDArray[np.int16]]) -> bytes:
+    offset = HEADER.size + LEVEL.size * len(levels)
+    header = [HEADER.pack(MAGIC, VERSION, len(levels), 0, PEAKS_SAMPLE_RATE)]
+    for i, level in enumerate(levels):
+        header.append(LEVEL.pack(PEAKS_SAMPLES_PER_PEAK << i, len(level), offset))
+        offset += level.size * 2
+    return b"".join(header + [level.astype("<i2").tobytes() for level in levels])
+
+
+def decode_header(data: bytes) -> tuple[int, list[PeaksLevel]]:
+    """
+    Read the sample rate and level table from the start of a sidecar.
+    """
+    magic, version, count, _, sample_rate = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a peaks sidecar")
+    levels = [
+        PeaksLevel(*LEVEL.unpack_from(data, HEADER.size + i * LEVEL.size))
+        for i in range(count)
+    ]
+    return sample_rate, levels
+
+
+def choose_level(levels: list[PeaksLevel], resolution: int | None) -> PeaksLevel:
+    """
+    The coarsest level with at least ``resolution`` peaks, else the finest.
+    """
+    if resolution is not None:
+        for level in reversed(levels):
+            if level.length >= resolution:
+                return level
+    return levels[0]
+
+
+async def compute_peaks(chunks: AsyncIterator[bytes], destination: Path) -> None:
+    """
+    Decode the audio in ``chunks`` once and write its peaks sidecar.
+    """
+    builder = PeaksBuilder()
+    async with aclosing(pipe_stream(chunks, PCM_OUTPUT_ARGS)) as pcm:
+        async for chunk in pcm:
+            builder.feed(chunk)
+    data = encode_peaks(build_levels(builder.finish()))
+    await run_in_threadpool(destination.write_bytes, data)
@@ -0,0 +1,218 @@
+import fcntl
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.recordings.ingest import SNIFF_BYTES, remove_quietly, sniff_audio_format
+
+HASH_CHUNK_BYTES = 1024 * 1024
+TOO_MANY_OPEN_UPLOADS = "Too many unfinished uploads, complete or abandon some first"
+
+
+@dataclass
+class ResumableUpload:
+    """
+    An upload assembled from chunks on disk across several requests.
+
+    The bytes received so far live in ``<id>.part`` and the declared total size
+    and owner in ``<id>.json``, so any API process can continue an upload and
+    the current offset is simply the size of the part file.
+    """
+
+    id: uuid.UUID
+    size: int | None
+    owner_id: uuid.UUID
+
+    @property
+    def data_path(self) -> Path:
+        return uploads_dir() / f"{self.id}.part"
+
+    @property
+    def meta_path(self) -> Path:
+        return uploads_dir() / f"{self.id}.json"
+
+    @property
+    def offset(self) -> int:
+        try:
+            return self.data_path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+
+def uploads_dir() -> Path:
+    return settings.RECORDINGS_DIR / "uploads"
+
+
+def _mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return 0
+
+
+def _prune_expired() -> None:
+    cutoff = time.time() - settings.RECORDINGS_UPLOAD_EXPIRE_HOURS * 3600
+    for path in uploads_dir().glob("*.json"):
+        data_path = path.with_suffix(".part")
+        # Either file may be gone already, completed or pruned by another request
+        last_touched = max(_mtime(path), _mtime(data_path))
+        if 0 < last_touched < cutoff:
+            remove_quietly(data_path)
+            remove_quietly(path)
+
+
+def count_open(owner_id: uuid.UUID) -> int:
+    """
+    Uploads ``owner_id`` started and has not completed or let expire yet.
+    """
+    owner = str(owner_id)
+    count = 0
+    for path in uploads_dir().glob("*.json"):
+        try:
+            meta = json.loads(path.read_text())
+        except (FileNotFoundError, ValueError):
+            # Completed meanwhile, or still being written by create_upload
+            continue
+        count += meta.get("owner_id") == owner
+    return count
+
+
+def create_upload(
+    size: int | None, owner_id: uuid.UUID, max_open: int | None = None
+) -> ResumableUpload:
+    """
+    Start an upload for ``owner_id``, refused while they already have
+    ``max_open`` others open.
+    """
+    if size is not None and size > settings.RECORDINGS_MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Recording is too large")
+    uploads_dir().mkdir(parents=True, exist_ok=True)
+    _prune_expired()
+    if max_open is not None and count_open(owner_id) >= max_open:
+        raise HTTPException(status_code=429, detail=TOO_MANY_OPEN_UPLOADS)
+    upload = ResumableUpload(id=uuid.uuid4(), size=size, owner_id=owner_id)
+    upload.data_path.touch()
+    upload.meta_path.write_text(json.dumps({"size": size, "owner_id": str(owner_id)}))
+    return upload
+
+
+def get_upload(upload_id: uuid.UUID) -> ResumableUpload | None:
+    meta_path = uploads_dir() / f"{upload_id}.json"
+    try:
+        meta = json.loads(meta_path.read_text())
+    except FileNotFoundError:
+        return None
+    if "owner_id" not in meta:
+        # Started before uploads had owners, nobody can complete it
+        return None
+    return ResumableUpload(
+        id=upload_id, size=meta["size"], owner_id=uuid.UUID(meta["owner_id"])
+    )
+
+
+def _lock(fd: int) -> None:
+    # Held until the file is closed, one writer per upload at a time
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        raise HTTPException(status_code=409, detail="Upload is busy, retry shortly")
+
+
+def _read_head(path: Path, length: int) -> bytes:
+    with path.open("rb") as f:
+        return f.read(length)
+
+
+def _check_signature(head: bytes) -> None:
+    if sniff_audio_format(head) is None:
+        raise HTTPException(
+            status_code=400, detail="File content is not a supported audio format"
+        )
+
+
+async def append_chunks(
+    upload: ResumableUpload, offset: int, chunks: AsyncIterator[bytes]
+) -> int:
+    """
+    Append a request body to the upload at ``offset`` and return the new offset.
+
+    The offset has to match what is already stored, so a client that lost a
+    response asks for the current offset and resends from there. Bytes that
+    land before a connection drops are kept.
+    """
+    try:
+        fd = os.open(upload.data_path, os.O_WRONLY | os.O_APPEND)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    with os.fdopen(fd, "ab") as f:
+        _lock(fd)
+        current = upload.offset
+        if offset != current:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload offset mismatch, the upload is at {current}",
+            )
+        # The leading bytes are held back until the container is identified
+        head: bytes | None = None
+        if current < SNIFF_BYTES:
+            head = await run_in_threadpool(_read_head, upload.data_path, current)
+        pending = b""
+        async for chunk in chunks:
+            received = current + len(pending) + len(chunk)
+            if upload.size is not None and received > upload.size:
+                raise HTTPException(
+                    status_code=400, detail="Upload exceeds its declared size"
+                )
+            if received > settings.RECORDINGS_MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail="Recording is too large")
+            if head is not None:
+                head += chunk
+                pending += chunk
+                if len(head) < SNIFF_BYTES:
+                    continue
+                _check_signature(head)
+                head = None
+                chunk, pending = pending, b""
+            await run_in_threadpool(f.write, chunk)
+            current += len(chunk)
+        if pending:
+            await run_in_threadpool(f.write, pending)
+            current += len(pending)
+        await run_in_threadpool(f.flush)
+    return current
+
+
+def hash_file(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+async def finish_upload(upload: ResumableUpload, destination: Path) -> str:
+    """
+    Move a complete upload to ``destination`` and return its sha256.
+    """
+    with upload.data_path.open("rb") as f:
+        _lock(f.fileno())
+        current = upload.offset
+        if current == 0 or (upload.size is not None and current != upload.size):
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload is incomplete, the upload is at {current}",
+            )
+        _check_signature(await run_in_threadpool(f.read, SNIFF_BYTES))
+        content_hash = await run_in_threadpool(hash_file, upload.data_path)
+        os.replace(upload.data_path, destination)
+    remove_quietly(upload.meta_path)
+    return content_hash
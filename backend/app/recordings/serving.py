@@ -0,0 +1,128 @@
+import os
+import re
+from mimetypes import guess_type
+
+import anyio
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# A single byte range, OWS is tolerated around it
+BYTE_RANGE = re.compile(r"bytes=\s*([0-9]*)-([0-9]*)\s*")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """
+    Parse a single ``bytes=`` range into inclusive ``(start, end)`` offsets.
+
+    Returns None when the whole file should be sent: for multi-range requests
+    and for invalid ranges such as ``bytes=5-3``, which RFC 9110 says to
+    ignore. Raises RangeNotSatisfiable for valid ranges past the end.
+    """
+    match = BYTE_RANGE.fullmatch(header or "")
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and end < start:
+            return None
+    elif last:
+        # Suffix range, the final N bytes
+        if not int(last):
+            raise RangeNotSatisfiable()
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+class RangeFileResponse(Response):
+    """
+    Send ``count`` bytes of a file starting at ``offset``.
+
+    When the ASGI server offers the zero-copy send extension the file
+    descriptor is handed over and the server sendfile()s it, otherwise the
+    bytes are read in chunks off the event loop like FileResponse does.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        path: str | os.PathLike[str],
+        *,
+        offset: int,
+        count: int,
+        status_code: int = 200,
+        headers: dict[str, str] | None = None,
+        media_type: str | None = None,
+        background: BackgroundTask | None = None,
+    ) -> None:
+        self.path = path
+        self.offset = offset
+        self.count = count
+        self.status_code = status_code
+        self.media_type = media_type or guess_type(path)[0] or "audio/mpeg"
+        self.background = background
+        self.init_headers({**(headers or {}), "content-length": str(count)})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if scope["method"].upper() == "HEAD" or self.count == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        elif "http.response.zerocopysend" in scope.get("extensions", {}):
+            with open(self.path, "rb") as f:
+                await send(
+                    {
+                        "type": "http.response.zerocopysend",
+                        "file": f,
+                        "offset": self.offset,
+                        "count": self.count,
+                        "more_body": False,
+                    }
+                )
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as f:
+                await f.seek(self.offset)
+                remaining = self.count
+                while remaining > 0:
+                    chunk = await f.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": remaining > 0,
+                        }
+                    )
+                if remaining > 0:
+                    # The file shrank underneath us, end the body anyway
+                    await send(
+                        {"type": "http.response.body", "body": b"", "more_body": False}
+                    )
+        if self.background is not None:
+            await self.background()
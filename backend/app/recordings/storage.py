@@ -0,0 +1,378 @@
+import errno
+import hashlib
+import hmac
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import parse_qsl, quote, urlsplit
+
+import httpx
+
+from app.core.config import settings
+
+COPY_CHUNK_BYTES = 1024 * 1024
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+
+
+class StorageError(Exception):
+    pass
+
+
+def spool_dir(name: str) -> Path:
+    """
+    Node-local scratch directory for bytes that are not stored yet.
+    """
+    path = settings.RECORDINGS_DIR / name
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+class RecordingStorage(ABC):
+    """
+    Where finished recording files live, addressed by string keys.
+
+    Keys are sharded on the content hash (``ab/cd/abcd....mp3``) so no single
+    directory or key prefix grows without bound.
+    """
+
+    @staticmethod
+    def key_for(content_hash: str, suffix: str) -> str:
+        return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}{suffix}"
+
+    @abstractmethod
+    def save(self, key: str, source: Path) -> int:
+        """Store a local file under ``key``, consuming it, and return its size."""
+
+    @abstractmethod
+    def fetch(self, key: str, destination: Path) -> None:
+        """Copy the object at ``key`` to a local file."""
+
+    @abstractmethod
+    def read_range(self, key: str, offset: int, length: int) -> bytes | None:
+        """Up to ``length`` bytes from ``offset``, None when the key is missing."""
+
+    @abstractmethod
+    def size(self, key: str) -> int | None:
+        """Size of the object at ``key``, None when it does not exist."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        pass
+
+    def local_path(self, key: str) -> Path | None:  # noqa: ARG002
+        """Path on this node's disk, when the backend has one."""
+        return None
+
+    def presigned_get_url(self, key: str) -> str | None:  # noqa: ARG002
+        """Short lived URL clients can download from directly, if supported."""
+        return None
+
+    def presigned_put_url(self, key: str, expires: int) -> str | None:  # noqa: ARG002
+        """URL clients can upload to directly for ``expires`` seconds, if supported."""
+        return None
+
+
+class LocalStorage(RecordingStorage):
+    def __init__(self, root: Path) -> None:
+        self.root = root
+
+    def local_path(self, key: str) -> Path:
+        return self.root / key
+
+    def save(self, key: str, source: Path) -> int:
+        path = self.local_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.replace(source, path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            self._copy_across(source, path)
+        return path.stat().st_size
+
+    @staticmethod
+    def _copy_across(source: Path, path: Path) -> None:
+        # The spool is on another filesystem, e.g. an archive on its own disk.
+        # Copied next to the file and renamed, so it is never seen half written
+        partial = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+        try:
+            with source.open("rb") as src, partial.open("wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK_BYTES)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(partial, path)
+        except BaseException:
+            partial.unlink(missing_ok=True)
+            raise
+        source.unlink()
+
+    def fetch(self, key: str, destination: Path) -> None:
+        shutil.copyfile(self.local_path(key), destination)
+
+    def read_range(self, key: str, offset: int, length: int) -> bytes | None:
+        try:
+            with self.local_path(key).open("rb") as f:
+                f.seek(offset)
+                return f.read(length)
+        except FileNotFoundError:
+            return None
+
+    def size(self, key: str) -> int | None:
+        try:
+            return self.local_path(key).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key: str) -> None:
+        self.local_path(key).unlink(missing_ok=True)
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+
+def _uri_encode(value: str, safe: str = "") -> str:
+    return quote(value, safe="-_.~" + safe)
+
+
+class SigV4Signer:
+    """
+    AWS Signature Version 4 for S3 compatible stores (AWS, MinIO, Ceph...).
+    """
+
+    def __init__(self, access_key_id: str, secret_access_key: str, region: str):
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.region = region
+
+    def _scope(self, now: datetime) -> str:
+        return f"{now:%Y%m%d}/{self.region}/s3/aws4_request"
+
+    def _signature(self, now: datetime, canonical_request: str) -> str:
+        string_to_sign = "\n".join(
+            [
+                "AWS4-HMAC-SHA256",
+                f"{now:%Y%m%dT%H%M%SZ}",
+                self._scope(now),
+                hashlib.sha256(canonical_request.encode()).hexdigest(),
+            ]
+        )
+        key = _hmac(f"AWS4{self.secret_access_key}".encode(), f"{now:%Y%m%d}")
+        for part in (self.region, "s3", "aws4_request"):
+            key = _hmac(key, part)
+        return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+    @staticmethod
+    def _canonical_query(query: dict[str, str]) -> str:
+        return "&".join(
+            f"{_uri_encode(k)}={_uri_encode(v)}" for k, v in sorted(query.items())
+        )
+
+    def sign_headers(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        *,
+        payload_hash: str = UNSIGNED_PAYLOAD,
+        now: datetime | None = None,
+    ) -> dict[str, str]:
+        """
+        Return ``headers`` plus the x-amz-* and Authorization headers.
+        """
+        now = now or datetime.now(timezone.utc)
+        parts = urlsplit(url)
+        signed = {k.lower(): v.strip() for k, v in headers.items()}
+        signed["host"] = parts.netloc
+        signed["x-amz-content-sha256"] = payload_hash
+        signed["x-amz-date"] = f"{now:%Y%m%dT%H%M%SZ}"
+        names = sorted(signed)
+        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+        canonical_request = "\n".join(
+            [
+                method,
+                _uri_encode(parts.path or "/", safe="/"),
+                self._canonical_query(query),
+                "".join(f"{name}:{signed[name]}\n" for name in names),
+                ";".join(names),
+                payload_hash,
+            ]
+        )
+        signature = self._signature(now, canonical_request)
+        signed["authorization"] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key_id}/{self._scope(now)}, "
+            f"SignedHeaders={';'.join(names)}, Signature={signature}"
+        )
+        signed.pop("host")
+        return signed
+
+    def presign_url(
+        self,
+        method: str,
+        url: str,
+        *,
+        expires: int,
+        now: datetime | None = None,
+    ) -> str:
+        now = now or datetime.now(timezone.utc)
+        parts = urlsplit(url)
+        query = {
+            "X-Amz-Algorithm": "AWS4-HMAC-SHA256",
+            "X-Amz-Credential": f"{self.access_key_id}/{self._scope(now)}",
+            "X-Amz-Date": f"{now:%Y%m%dT%H%M%SZ}",
+            "X-Amz-Expires": str(expires),
+            "X-Amz-SignedHeaders": "host",
+        }
+        canonical_request = "\n".join(
+            [
+                method,
+                _uri_encode(parts.path or "/", safe="/"),
+                self._canonical_query(query),
+                f"host:{parts.netloc}\n",
+                "host",
+                UNSIGNED_PAYLOAD,
+            ]
+        )
+        query["X-Amz-Signature"] = self._signature(now, canonical_request)
+        return f"{parts.scheme}://{parts.netloc}{parts.path}?{self._canonical_query(query)}"
+
+
+class S3Storage(RecordingStorage):
+    """
+    Path-style S3 client on top of httpx, so any S3 compatible store works
+    without an SDK dependency.
+    """
+
+    def __init__(
+        self,
+        *,
+        endpoint_url: str,
+        bucket: str,
+        access_key_id: str,
+        secret_access_key: str,
+        region: str,
+        presign_expire_seconds: int = 900,
+        storage_class: str | None = None,
+        transport: httpx.BaseTransport | None = None,
+    ) -> None:
+        self.endpoint_url = endpoint_url.rstrip("/")
+        self.bucket = bucket
+        self.storage_class = storage_class
+        self.signer = SigV4Signer(access_key_id, secret_access_key, region)
+        self.presign_expire_seconds = presign_expire_seconds
+        self.client = httpx.Client(transport=transport, timeout=60)
+
+    def _url(self, key: str) -> str:
+        return f"{self.endpoint_url}/{self.bucket}/{_uri_encode(key, safe='/')}"
+
+    def _headers(
+        self, method: str, key: str, headers: dict[str, str] | None = None
+    ) -> dict[str, str]:
+        return self.signer.sign_headers(method, self._url(key), headers or {})
+
+    def save(self, key: str, source: Path) -> int:
+        size = source.stat().st_size
+        put_headers = {"content-length": str(size)}
+        if self.storage_class:
+            put_headers["x-amz-storage-class"] = self.storage_class
+        headers = self._headers("PUT", key, put_headers)
+        try:
+            with source.open("rb") as f:
+                response = self.client.put(self._url(key), headers=headers, content=f)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise StorageError(f"Could not store {key}: {e}") from e
+        source.unlink()
+        return size
+
+    def fetch(self, key: str, destination: Path) -> None:
+        headers = self._headers("GET", key)
+        try:
+            with self.client.stream("GET", self._url(key), headers=headers) as r:
+                r.raise_for_status()
+                with destination.open("wb") as f:
+                    for chunk in r.iter_bytes(COPY_CHUNK_BYTES):
+                        f.write(chunk)
+        except httpx.HTTPError as e:
+            raise StorageError(f"Could not fetch {key}: {e}") from e
+
+    def read_range(self, key: str, offset: int, length: int) -> bytes | None:
+        headers = self._headers(
+            "GET", key, {"range": f"bytes={offset}-{offset + length - 1}"}
+        )
+        try:
+            response = self.client.get(self._url(key), headers=headers)
+            if response.status_code == 404:
+                return None
+            if response.status_code == 416:
+                return b""
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise StorageError(f"Could not read {key}: {e}") from e
+        if response.status_code == 200:
+            # Range was ignored, the whole object came back
+            return response.content[offset : offset + length]
+        return response.content
+
+    def size(self, key: str) -> int | None:
+        try:
+            response = self.client.head(
+                self._url(key), headers=self._headers("HEAD", key)
+            )
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise StorageError(f"Could not stat {key}: {e}") from e
+        return int(response.headers["content-length"])
+
+    def delete(self, key: str) -> None:
+        headers = self._headers("DELETE", key)
+        try:
+            response = self.client.delete(self._url(key), headers=headers)
+            if response.status_code != 404:
+                response.raise_for_status()
+        except httpx.HTTPError as e:
+            raise StorageError(f"Could not delete {key}: {e}") from e
+
+    def presigned_get_url(self, key: str) -> str:
+        return self.signer.presign_url(
+            "GET", self._url(key), expires=self.presign_expire_seconds
+        )
+
+    def presigned_put_url(self, key: str, expires: int) -> str:
+        return self.signer.presign_url("PUT", self._url(key), expires=expires)
+
+
+def _s3_storage(storage_class: str | None = None) -> S3Storage:
+    # Both are checked when the settings load
+    assert settings.RECORDINGS_S3_ENDPOINT_URL and settings.RECORDINGS_S3_BUCKET
+    return S3Storage(
+        endpoint_url=settings.RECORDINGS_S3_ENDPOINT_URL,
+        bucket=settings.RECORDINGS_S3_BUCKET,
+        access_key_id=settings.RECORDINGS_S3_ACCESS_KEY_ID,
+        secret_access_key=settings.RECORDINGS_S3_SECRET_ACCESS_KEY,
+        region=settings.RECORDINGS_S3_REGION,
+        storage_class=storage_class,
+    )
+
+
+@lru_cache
+def get_storage() -> RecordingStorage:
+    if settings.RECORDINGS_STORAGE_BACKEND == "s3":
+        return _s3_storage()
+    return LocalStorage(settings.RECORDINGS_DIR)
+
+
+@lru_cache
+def get_archive_storage() -> RecordingStorage:
+    """
+    Cheaper storage for recordings nobody played in a long time.
+    """
+    if settings.RECORDINGS_STORAGE_BACKEND == "s3":
+        return _s3_storage(settings.RECORDINGS_S3_ARCHIVE_STORAGE_CLASS)
+    return LocalStorage(settings.RECORDINGS_ARCHIVE_DIR)
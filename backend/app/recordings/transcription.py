@@ -0,0 +1,350 @@
+import asyncio
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from contextlib import aclosing
+from functools import lru_cache, partial
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from app import crud
+from app.core.config import settings
+from app.core.db import engine
+from app.models import RecordingBlob, TranscriptSegment
+from app.recordings.admission import get_slots
+from app.recordings.ffmpeg import FFmpegError, iter_file_chunks, pipe_stream
+from app.recordings.heartbeat import heartbeat, stale_before
+from app.recordings.ingest import remove_quietly
+from app.recordings.storage import (
+    StorageError,
+    get_archive_storage,
+    get_storage,
+    spool_dir,
+)
+from app.recordings.vad import detect_speech
+
+logger = logging.getLogger(__name__)
+
+# What speech recognition models are trained on
+TRANSCRIPTION_SAMPLE_RATE = 16000
+PCM_OUTPUT_ARGS = [
+    "-vn",
+    "-ac",
+    "1",
+    "-ar",
+    str(TRANSCRIPTION_SAMPLE_RATE),
+    "-f",
+    "s16le",
+]
+# An idle worker looks for transcripts queued by other processes this often
+POLL_SECONDS = 30.0
+
+
+class TranscriptionError(Exception):
+    pass
+
+
+class TranscriptionEngine(ABC):
+    """
+    Speech to text over a batch of recordings in one call.
+
+    Engines are created once per process and kept, so the model is loaded
+    and warmed up once and not for every recording.
+    """
+
+    name: str
+
+    @abstractmethod
+    def transcribe(
+        self, batch: list[NDArray[np.int16]]
+    ) -> list[list[TranscriptSegment]]:
+        """
+        Segments of every recording in ``batch``, mono PCM at
+        TRANSCRIPTION_SAMPLE_RATE. Blocking, it runs in a worker thread.
+        """
+
+
+class StubEngine(TranscriptionEngine):
+    """
+    One numbered placeholder per stretch of speech, the same on every run.
+    """
+
+    name = "stub"
+
+    def transcribe(
+        self, batch: list[NDArray[np.int16]]
+    ) -> list[list[TranscriptSegment]]:
+        rate = TRANSCRIPTION_SAMPLE_RATE
+        return [
+            [
+                TranscriptSegment(start=start / rate, end=end / rate, text=f"[{i}]")
+                for i, (start, end) in enumerate(detect_speech(samples, rate), 1)
+            ]
+            for samples in batch
+        ]
+
+
+class WhisperEngine(TranscriptionEngine):
+    """
+    Whisper on the CPU with faster-whisper, int8 quantized. Each recording is
+    cut into chunks that are decoded in batches.
+    """
+
+    def __init__(self, model: str, language: str | None) -> None:
+        try:
+            from faster_whisper import (  # type: ignore[import-not-found, unused-ignore]
+                BatchedInferencePipeline,
+                WhisperModel,
+            )
+        except ImportError as e:
+            raise TranscriptionError("faster-whisper is not installed") from e
+        self.name = f"whisper:{model}"
+        self.language = language
+        self._pipeline = BatchedInferencePipeline(
+            model=WhisperModel(model, device="cpu", compute_type="int8")
+        )
+
+    def transcribe(
+        self, batch: list[NDArray[np.int16]]
+    ) -> list[list[TranscriptSegment]]:
+        results = []
+        for samples in batch:
+            audio = samples.astype(np.float32) / 32768
+            segments, _ = self._pipeline.transcribe(audio, language=self.language)
+            results.append(
+                [
+                    TranscriptSegment(
+                        start=segment.start, end=segment.end, text=segment.text.strip()
+                    )
+                    for segment in segments
+                ]
+            )
+        return results
+
+
+@lru_cache
+def get_engine() -> TranscriptionEngine:
+    if settings.RECORDINGS_TRANSCRIPTION_ENGINE == "stub":
+        return StubEngine()
+    if settings.RECORDINGS_TRANSCRIPTION_ENGINE == "whisper":
+        return WhisperEngine(
+            settings.RECORDINGS_TRANSCRIPTION_MODEL,
+            settings.RECORDINGS_TRANSCRIPTION_LANGUAGE,
+        )
+    raise TranscriptionError("Transcription is turned off")
+
+
+def queue_transcript(session: Session, content_hash: str) -> None:
+    if settings.RECORDINGS_TRANSCRIPTION_ENGINE != "none":
+        crud.queue_recording_transcript(session=session, content_hash=content_hash)
+
+
+def _claim(limit: int) -> list[str]:
+    with Session(engine) as session:
+        return crud.claim_recording_transcripts(session=session, limit=limit)
+
+
+def _requeue(content_hashes: list[str]) -> None:
+    with Session(engine) as session:
+        crud.requeue_recording_transcripts(
+            session=session, content_hashes=content_hashes
+        )
+
+
+def _beat(content_hashes: list[str]) -> None:
+    with Session(engine) as session:
+        crud.beat_recording_transcripts(session=session, content_hashes=content_hashes)
+
+
+def requeue_stale_transcripts() -> int:
+    """
+    Queue again transcripts left running by a worker process that died, e.g.
+    killed for the memory the model took.
+    """
+    with Session(engine) as session:
+        return crud.requeue_stale_recording_transcripts(
+            session=session, stale_before=stale_before()
+        )
+
+
+def _finish(
+    content_hash: str,
+    engine_name: str,
+    segments: list[TranscriptSegment] | None = None,
+    error: str | None = None,
+) -> None:
+    with Session(engine) as session:
+        crud.finish_recording_transcript(
+            session=session,
+            content_hash=content_hash,
+            engine=engine_name,
+            segments=[(s.start, s.end, s.text) for s in segments]
+            if segments is not None
+            else None,
+            error=error,
+        )
+
+
+def _fetch_audio(content_hash: str, destination: Path) -> Path:
+    with Session(engine) as session:
+        blob = session.get(RecordingBlob, content_hash)
+    if blob is None:
+        raise StorageError(f"Recording {content_hash} was deleted")
+    # The archive copy is smaller but as good for speech
+    storage = get_archive_storage() if blob.tier == "archive" else get_storage()
+    local = storage.local_path(blob.filename)
+    if local is not None:
+        return local
+    storage.fetch(blob.filename, destination)
+    return destination
+
+
+async def _decode(content_hash: str, pcm_path: Path) -> None:
+    fetched = spool_dir("transcription") / f"{content_hash}.audio"
+    try:
+        source = await run_in_threadpool(_fetch_audio, content_hash, fetched)
+        with pcm_path.open("wb") as f:
+            async with aclosing(
+                pipe_stream(iter_file_chunks(source), PCM_OUTPUT_ARGS)
+            ) as pcm:
+                async for chunk in pcm:
+                    await run_in_threadpool(f.write, chunk)
+    finally:
+        remove_quietly(fetched)
+
+
+def _load(pcm_path: Path) -> NDArray[np.int16]:
+    length = pcm_path.stat().st_size // 2
+    if not length:
+        return np.zeros(0, dtype=np.int16)
+    return np.memmap(pcm_path, dtype="<i2", mode="r", shape=(length,))
+
+
+async def transcribe_batch(content_hashes: list[str]) -> None:
+    """
+    Transcribe claimed files with one engine call.
+
+    Every file is decoded to PCM on disk and memory-mapped, so a batch of
+    long recordings does not have to fit in memory. A file that cannot be
+    decoded fails alone, an engine error fails the whole batch.
+    """
+    transcription_engine = get_engine()
+    pcm_paths: dict[str, Path] = {}
+    try:
+        for content_hash in content_hashes:
+            fd, name = tempfile.mkstemp(dir=spool_dir("transcription"), suffix=".pcm")
+            os.close(fd)
+            pcm_paths[content_hash] = Path(name)
+            try:
+                async with get_slots().hold():
+                    await _decode(content_hash, pcm_paths[content_hash])
+            except (FFmpegError, StorageError, OSError) as e:
+                logger.warning(
+                    "Could not decode %s for transcription: %s", content_hash, e
+                )
+                await run_in_threadpool(
+                    _finish,
+                    content_hash,
+                    transcription_engine.name,
+                    error=f"Conversion error: {e}",
+                )
+                remove_quietly(pcm_paths.pop(content_hash))
+        if not pcm_paths:
+            return
+        audio = [await run_in_threadpool(_load, path) for path in pcm_paths.values()]
+        try:
+            # Without a transcode slot: one batch runs at a time per process,
+            # and holding a slot for the whole call would stall conversions
+            results = await run_in_threadpool(transcription_engine.transcribe, audio)
+        except Exception as e:
+            logger.exception("Transcription of %d recordings failed", len(audio))
+            for content_hash in pcm_paths:
+                await run_in_threadpool(
+                    _finish,
+                    content_hash,
+                    transcription_engine.name,
+                    error=f"Transcription error: {e}",
+                )
+            return
+        for content_hash, segments in zip(pcm_paths, results, strict=True):
+            await run_in_threadpool(
+                _finish, content_hash, transcription_engine.name, segments
+            )
+    finally:
+        for path in pcm_paths.values():
+            remove_quietly(path)
+
+
+async def transcribe_pending() -> int:
+    """
+    Claim one batch of queued transcripts and transcribe it, returns its size.
+    """
+    content_hashes = await run_in_threadpool(
+        _claim, settings.RECORDINGS_TRANSCRIPTION_BATCH_SIZE
+    )
+    if not content_hashes:
+        return 0
+    try:
+        async with heartbeat(partial(_beat, content_hashes)):
+            await transcribe_batch(content_hashes)
+    except asyncio.CancelledError:
+        # Shutting down, leave them for the next start to pick up
+        await run_in_threadpool(_requeue, content_hashes)
+        raise
+    return len(content_hashes)
+
+
+class TranscriptionWorker:
+    """
+    Background task that transcribes queued recordings one batch at a time.
+
+    Uploads wake it up when they queue a transcript, and it polls for those
+    queued by other API processes.
+    """
+
+    def __init__(self) -> None:
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    async def start(self) -> None:
+        if settings.RECORDINGS_TRANSCRIPTION_ENGINE == "none":
+            return
+        # Loads the model before the first batch is waiting on it
+        await run_in_threadpool(get_engine)
+        if stale := await run_in_threadpool(requeue_stale_transcripts):
+            logger.warning("Queued %d transcripts left running again", stale)
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._work(), name="transcription-worker")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    async def _work(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                if await transcribe_pending():
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Transcription worker crashed")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+
+transcription_worker = TranscriptionWorker()
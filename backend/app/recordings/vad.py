@@ -0,0 +1,165 @@
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+from starlette.concurrency import run_in_threadpool
+
+from app.recordings.ffmpeg import pipe_stream
+
+# Opus works at 48 kHz, decoding at that rate keeps the master at full quality
+VAD_SAMPLE_RATE = 48000
+PCM_ARGS = ["-ac", "1", "-ar", str(VAD_SAMPLE_RATE), "-f", "s16le"]
+# Input arguments to encode the trimmed PCM again
+PCM_INPUT_ARGS = ["-f", "s16le", "-ar", str(VAD_SAMPLE_RATE), "-ac", "1"]
+
+FRAME_SECONDS = 0.02
+# Frame energies are computed this many frames at a time to bound memory
+FRAMES_PER_BLOCK = 8192
+# A frame is speech when it is this far above the noise floor...
+NOISE_MARGIN_DB = 12.0
+# ...or at most this far below the loud parts, and never below the floor
+DYNAMIC_RANGE_DB = 30.0
+SILENCE_FLOOR_DB = -55.0
+MIN_SPEECH_SECONDS = 0.1
+# Shorter pauses are part of the speech around them
+MIN_SILENCE_SECONDS = 0.3
+# Kept around every segment so words are not clipped
+PADDING_SECONDS = 0.15
+
+Segment = tuple[int, int]
+
+
+def frame_energy_db(samples: NDArray[np.int16], frame: int) -> NDArray[np.float32]:
+    """
+    Energy of each full frame in dB relative to full scale.
+    """
+    frames = samples[: len(samples) // frame * frame].reshape(-1, frame)
+    energy = np.empty(len(frames), dtype=np.float32)
+    for start in range(0, len(frames), FRAMES_PER_BLOCK):
+        block = frames[start : start + FRAMES_PER_BLOCK].astype(np.float32) / 32768
+        energy[start : start + len(block)] = np.einsum("ij,ij->i", block, block)
+    energy /= frame
+    db: NDArray[np.float32] = 10 * np.log10(energy + 1e-10)
+    return db
+
+
+def _runs(mask: NDArray[np.bool_]) -> tuple[NDArray[np.intp], NDArray[np.intp]]:
+    edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def detect_speech(samples: NDArray[np.int16], sample_rate: int) -> list[Segment]:
+    """
+    Speech segments as ``(start, end)`` sample offsets, end exclusive.
+    """
+    frame = int(sample_rate * FRAME_SECONDS)
+    db = frame_energy_db(samples, frame)
+    if not len(db):
+        return []
+    noise_floor, loud = np.percentile(db, [10, 95])
+    threshold = max(
+        SILENCE_FLOOR_DB, min(noise_floor + NOISE_MARGIN_DB, loud - DYNAMIC_RANGE_DB)
+    )
+    starts, ends = _runs(db > threshold)
+    if not len(starts):
+        return []
+    # Bridge short pauses, then drop what is left too short to be speech
+    keep = starts[1:] - ends[:-1] >= MIN_SILENCE_SECONDS / FRAME_SECONDS
+    starts = starts[np.concatenate([[True], keep])]
+    ends = ends[np.concatenate([keep, [True]])]
+    long_enough = ends - starts >= MIN_SPEECH_SECONDS / FRAME_SECONDS
+    starts, ends = starts[long_enough], ends[long_enough]
+    padding = int(PADDING_SECONDS / FRAME_SECONDS)
+    starts = np.maximum(starts - padding, 0) * frame
+    ends = np.minimum((ends + padding) * frame, len(samples))
+    return list(zip(starts.tolist(), ends.tolist(), strict=True))
+
+
+def plan_trim(
+    segments: list[Segment], total: int, max_pause: int | None
+) -> list[Segment]:
+    """
+    Sample ranges to keep: from the first to the last speech, with pauses
+    longer than ``max_pause`` shortened to it.
+    """
+    if not segments:
+        # Nothing that sounds like speech, keep the recording as it was
+        return [(0, total)]
+    if max_pause is None:
+        return [(segments[0][0], segments[-1][1])]
+    keep = [segments[0]]
+    for start, end in segments[1:]:
+        previous_start, previous_end = keep[-1]
+        if start - previous_end <= max_pause:
+            keep[-1] = (previous_start, end)
+        else:
+            half = max_pause // 2
+            keep[-1] = (previous_start, previous_end + half)
+            keep.append((start - (max_pause - half), end))
+    return keep
+
+
+def remap_segments(segments: list[Segment], keep: list[Segment]) -> list[Segment]:
+    """
+    Where ``segments`` end up once only the ``keep`` ranges are left.
+    """
+    remapped = []
+    offset = 0
+    kept = iter(keep)
+    keep_start, keep_end = next(kept)
+    for start, end in segments:
+        while start >= keep_end:
+            offset += keep_end - keep_start
+            keep_start, keep_end = next(kept)
+        remapped.append((offset + start - keep_start, offset + end - keep_start))
+    return remapped
+
+
+def _write_trimmed(
+    pcm_path: Path, destination: Path, max_pause_seconds: float | None
+) -> list[tuple[float, float]]:
+    length = pcm_path.stat().st_size // 2
+    if not length:
+        destination.write_bytes(b"")
+        return []
+    samples = np.memmap(pcm_path, dtype="<i2", mode="r", shape=(length,))
+    segments = detect_speech(samples, VAD_SAMPLE_RATE)
+    max_pause = (
+        None if max_pause_seconds is None else int(max_pause_seconds * VAD_SAMPLE_RATE)
+    )
+    keep = plan_trim(segments, len(samples), max_pause)
+    with destination.open("wb") as f:
+        for start, end in keep:
+            samples[start:end].tofile(f)
+    return [
+        (round(start / VAD_SAMPLE_RATE, 3), round(end / VAD_SAMPLE_RATE, 3))
+        for start, end in remap_segments(segments, keep)
+    ]
+
+
+async def trim_silence(
+    chunks: AsyncIterator[bytes],
+    destination: Path,
+    *,
+    max_pause_seconds: float | None = None,
+) -> list[tuple[float, float]]:
+    """
+    Decode the audio in ``chunks``, drop leading and trailing silence and
+    write the rest to ``destination`` as raw PCM (see ``PCM_INPUT_ARGS``).
+
+    Returns the speech segments, in seconds on the trimmed timeline. The
+    decoded audio is memory-mapped so long recordings are not held in memory.
+    """
+    pcm_path = destination.with_name(destination.name + ".decoded")
+    try:
+        with pcm_path.open("wb") as f:
+            async with aclosing(pipe_stream(chunks, PCM_ARGS)) as pcm:
+                async for chunk in pcm:
+                    await run_in_threadpool(f.write, chunk)
+        return await run_in_threadpool(
+            _write_trimmed, pcm_path, destination, max_pause_seconds
+        )
+    finally:
+        pcm_path.unlink(missing_ok=True)
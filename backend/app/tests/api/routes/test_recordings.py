@@ -0,0 +1,1574 @@
+import asyncio
+import hashlib
+import math
+import os
+import time
+import uuid
+from collections.abc import Generator
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any
+
+import httpx
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, col, delete, func, select
+from starlette.testclient import WebSocketDenialResponse
+from starlette.websockets import WebSocketDisconnect
+
+from app import crud
+from app.core.config import settings
+from app.models import (
+    Recording,
+    RecordingBlob,
+    RecordingJob,
+    RecordingTranscript,
+    User,
+    UserUpdate,
+)
+from app.recordings.admission import TranscodeSlots
+from app.recordings.hls import hls_key
+from app.recordings.jobs import fail_stale_jobs, register_upload, run_transcode_job
+from app.recordings.lifecycle import archive_key
+from app.recordings.parallel import encode_master
+from app.recordings.storage import LocalStorage, RecordingStorage
+from app.recordings.transcription import (
+    StubEngine,
+    requeue_stale_transcripts,
+    transcribe_pending,
+)
+from app.tests.utils.recording import (
+    create_random_recording,
+    random_melody,
+    to_pcm,
+    to_wav,
+)
+from app.tests.utils.s3 import FakeS3
+from app.tests.utils.user import create_random_user, user_authentication_headers
+from app.tests.utils.utils import random_lower_string
+
+WEBM_HEADER = b"\x1a\x45\xdf\xa3" + b"\x00" * 28
+
+
+@pytest.fixture(autouse=True)
+def fake_ffmpeg(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    # Copies stdin to stdout, standing in for a real encoder
+    script = tmp_path / "ffmpeg"
+    script.write_text("#!/bin/sh\nexec cat\n")
+    script.chmod(0o755)
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_PATH", str(script))
+    # Random bytes make no sense as PCM, tests that trim turn it back on
+    monkeypatch.setattr(settings, "RECORDINGS_TRIM_SILENCE", False)
+    return script
+
+
+@pytest.fixture(autouse=True)
+def fake_ffprobe(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    script = tmp_path / "ffprobe"
+    script.write_text(
+        "#!/bin/sh\n"
+        'echo \'{"format": {"duration": "1.5"}, "streams": [{"codec_name": "mp3"}]}\'\n'
+    )
+    script.chmod(0o755)
+    monkeypatch.setattr(settings, "RECORDINGS_FFPROBE_PATH", str(script))
+    return script
+
+
+@pytest.fixture(autouse=True)
+def authenticated(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> Generator[None, None, None]:
+    # Uploads need a user, the superuser is not held to quotas
+    client.headers.update(superuser_token_headers)
+    yield
+    client.headers.pop("Authorization", None)
+
+
+def user_with_headers(client: TestClient, db: Session) -> tuple[User, dict[str, str]]:
+    password = random_lower_string()
+    user = create_random_user(db)
+    user = crud.update_user(
+        session=db, db_user=user, user_in=UserUpdate(password=password)
+    )
+    headers = user_authentication_headers(
+        client=client, email=user.email, password=password
+    )
+    return user, headers
+
+
+def wait_for_job(
+    client: TestClient, job_id: str, headers: dict[str, str] | None = None
+) -> dict[str, Any]:
+    # Read as the uploader when given, the superuser otherwise
+    for _ in range(100):
+        r = client.get(
+            f"{settings.API_V1_STR}/recordings/jobs/{job_id}", headers=headers
+        )
+        assert r.status_code == 200
+        content: dict[str, Any] = r.json()
+        if content["status"] in ("done", "failed"):
+            return content
+        time.sleep(0.05)
+    raise AssertionError(f"Recording job {job_id} did not finish")
+
+
+def random_webm() -> bytes:
+    return WEBM_HEADER + random_lower_string().encode() * 100
+
+
+def test_upload_recording(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    data = random_webm()
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", data, "audio/webm")},
+    )
+    assert r.status_code == 202
+    content = r.json()
+    assert content["status"] in ("queued", "running")
+    job = wait_for_job(client, content["id"])
+    assert job["status"] == "done"
+    assert job["filename"] == RecordingStorage.key_for(job["content_hash"], ".opus")
+    assert (settings.RECORDINGS_DIR / job["filename"]).read_bytes() == data
+
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/{job['recording_id']}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    recording = r.json()
+    assert recording["filename"] == job["filename"]
+    assert recording["content_hash"] == job["content_hash"]
+    assert recording["duration"] == 1.5
+    assert recording["codec"] == "mp3"
+    assert recording["byte_size"] == len(data)
+
+
+def test_upload_recording_duplicate(client: TestClient, db: Session) -> None:
+    data = random_webm()
+    files = {"file": ("clip.webm", data, "audio/webm")}
+    r = client.post(f"{settings.API_V1_STR}/recordings/", files=files)
+    assert r.status_code == 202
+    first = wait_for_job(client, r.json()["id"])
+
+    r = client.post(f"{settings.API_V1_STR}/recordings/", files=files)
+    assert r.status_code == 200
+    second = r.json()
+    assert second["status"] == "done"
+    assert second["id"] != first["id"]
+    assert second["filename"] == first["filename"]
+    assert second["content_hash"] == first["content_hash"]
+    assert second["recording_id"] != first["recording_id"]
+    recording = db.get(Recording, uuid.UUID(second["recording_id"]))
+    assert recording
+    assert recording.duration == 1.5
+
+    blob = db.get(RecordingBlob, first["content_hash"])
+    assert blob
+    db.refresh(blob)
+    assert blob.ref_count == 2
+
+
+def test_upload_recording_duplicate_while_queued(
+    client: TestClient, db: Session
+) -> None:
+    data = random_webm()
+    content_hash = hashlib.sha256(data).hexdigest()
+    first_user, first_headers = user_with_headers(client, db)
+    second_user, second_headers = user_with_headers(client, db)
+    sources = []
+    for _ in range(3):
+        source = settings.RECORDINGS_DIR / f"{uuid.uuid4()}.upload"
+        source.parent.mkdir(parents=True, exist_ok=True)
+        source.write_bytes(data)
+        sources.append(source)
+
+    crud.reserve_recording_quota(
+        session=db, user_id=first_user.id, max_count=None, max_bytes=None
+    )
+    first, queued = register_upload(
+        session=db,
+        source_path=sources[0],
+        content_hash=content_hash,
+        owner_id=first_user.id,
+    )
+    assert queued
+    # A retry by the same user gets the queued job back
+    crud.reserve_recording_quota(
+        session=db, user_id=first_user.id, max_count=None, max_bytes=None
+    )
+    retry, queued = register_upload(
+        session=db,
+        source_path=sources[1],
+        content_hash=content_hash,
+        owner_id=first_user.id,
+    )
+    assert retry.id == first.id
+    assert not queued
+    # Another user gets a job and a recording of their own
+    crud.reserve_recording_quota(
+        session=db, user_id=second_user.id, max_count=None, max_bytes=None
+    )
+    second, queued = register_upload(
+        session=db,
+        source_path=sources[2],
+        content_hash=content_hash,
+        owner_id=second_user.id,
+    )
+    assert second.id != first.id
+    assert queued
+
+    for job in (first, second):
+        asyncio.run(run_transcode_job(job.id))
+    for job, headers in ((first, first_headers), (second, second_headers)):
+        done = wait_for_job(client, str(job.id), headers)
+        assert done["status"] == "done"
+        r = client.get(
+            f"{settings.API_V1_STR}/recordings/{done['recording_id']}",
+            headers=headers,
+        )
+        assert r.status_code == 200
+    blob = db.get(RecordingBlob, content_hash)
+    assert blob
+    db.refresh(blob)
+    assert blob.ref_count == 2
+    # Each user is charged once, the retry gave its reservation back
+    for user in (first_user, second_user):
+        db.refresh(user)
+        assert user.recording_count == 1
+
+
+def test_upload_recording_conversion_error(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_PATH", "false")
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", random_webm(), "audio/webm")},
+    )
+    assert r.status_code == 202
+    job = wait_for_job(client, r.json()["id"])
+    assert job["status"] == "failed"
+    assert job["filename"] is None
+    assert job["error"].startswith("Conversion error")
+
+
+def test_upload_recording_not_authenticated(client: TestClient) -> None:
+    del client.headers["Authorization"]
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", random_webm(), "audio/webm")},
+    )
+    assert r.status_code == 401
+
+
+def test_upload_recording_quota(client: TestClient, db: Session) -> None:
+    user, headers = user_with_headers(client, db)
+    data = random_webm()
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", data, "audio/webm")},
+        headers=headers,
+    )
+    assert r.status_code == 202
+    job = wait_for_job(client, r.json()["id"], headers)
+    assert job["status"] == "done"
+    db.refresh(user)
+    assert user.recording_count == 1
+    assert user.recording_bytes == len(data)
+
+    r = client.delete(
+        f"{settings.API_V1_STR}/recordings/{job['recording_id']}", headers=headers
+    )
+    assert r.status_code == 200
+    db.refresh(user)
+    assert user.recording_count == 0
+    assert user.recording_bytes == 0
+
+
+def test_upload_recording_quota_exceeded(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user, headers = user_with_headers(client, db)
+    create_random_recording(db, owner_id=user.id)
+    monkeypatch.setattr(settings, "RECORDINGS_USER_MAX_COUNT", 1)
+    jobs = db.exec(select(func.count()).select_from(RecordingJob)).one()
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", random_webm(), "audio/webm")},
+        headers=headers,
+    )
+    assert r.status_code == 403
+    assert r.json()["detail"] == "Recording quota exceeded"
+    assert db.exec(select(func.count()).select_from(RecordingJob)).one() == jobs
+
+    monkeypatch.setattr(settings, "RECORDINGS_USER_MAX_COUNT", None)
+    monkeypatch.setattr(settings, "RECORDINGS_USER_MAX_BYTES", 1)
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", random_webm(), "audio/webm")},
+        headers=headers,
+    )
+    assert r.status_code == 403
+
+    # The superuser is not held to the quota
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", random_webm(), "audio/webm")},
+    )
+    assert r.status_code == 202
+
+
+def test_upload_recordings_batch(client: TestClient) -> None:
+    first, second = random_webm(), random_webm()
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/batch",
+        files=[
+            ("files", ("one.webm", first, "audio/webm")),
+            ("files", ("two.webm", second, "audio/webm")),
+            ("files", ("again.webm", first, "audio/webm")),
+        ],
+    )
+    assert r.status_code == 202
+    results = r.json()["data"]
+    assert [result["filename"] for result in results] == [
+        "one.webm",
+        "two.webm",
+        "again.webm",
+    ]
+    assert all(result["error"] is None for result in results)
+    # The same bytes twice in one batch are converted once
+    assert results[2]["job"]["id"] == results[0]["job"]["id"]
+    for result in results[:2]:
+        job = wait_for_job(client, result["job"]["id"])
+        assert job["status"] == "done"
+    assert results[1]["job"]["content_hash"] == hashlib.sha256(second).hexdigest()
+
+
+def test_upload_recordings_batch_quota(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user, headers = user_with_headers(client, db)
+    monkeypatch.setattr(settings, "RECORDINGS_USER_MAX_COUNT", 1)
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/batch",
+        files=[
+            ("files", ("one.webm", random_webm(), "audio/webm")),
+            ("files", ("two.webm", random_webm(), "audio/webm")),
+        ],
+        headers=headers,
+    )
+    assert r.status_code == 202
+    first, second = r.json()["data"]
+    assert wait_for_job(client, first["job"]["id"], headers)["status"] == "done"
+    assert second["job"] is None
+    assert second["error"] == "Recording quota exceeded"
+    db.refresh(user)
+    assert user.recording_count == 1
+
+
+def test_upload_recordings_batch_invalid_file(client: TestClient, db: Session) -> None:
+    user, headers = user_with_headers(client, db)
+    jobs = db.exec(select(func.count()).select_from(RecordingJob)).one()
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/batch",
+        files=[
+            ("files", ("one.webm", random_webm(), "audio/webm")),
+            ("files", ("notes.webm", b"not audio at all", "audio/webm")),
+        ],
+        headers=headers,
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "File content is not a supported audio format"
+    # Nothing is queued and the reservation of the valid file is released
+    assert db.exec(select(func.count()).select_from(RecordingJob)).one() == jobs
+    db.refresh(user)
+    assert user.recording_count == 0
+
+
+def test_upload_recordings_batch_too_many_files(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_BATCH_MAX_FILES", 1)
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/batch",
+        files=[
+            ("files", ("one.webm", random_webm(), "audio/webm")),
+            ("files", ("two.webm", random_webm(), "audio/webm")),
+        ],
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Too many files, at most 1 per request"
+
+
+def test_upload_recording_conversion_error_releases_quota(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user, headers = user_with_headers(client, db)
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_PATH", "false")
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", random_webm(), "audio/webm")},
+        headers=headers,
+    )
+    assert r.status_code == 202
+    assert wait_for_job(client, r.json()["id"], headers)["status"] == "failed"
+    db.refresh(user)
+    assert user.recording_count == 0
+    assert user.recording_bytes == 0
+
+
+def test_upload_recording_unexpected_error(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user, headers = user_with_headers(client, db)
+
+    async def crash(*_: Any) -> None:
+        raise ValueError("boom")
+
+    files = {"file": ("clip.webm", random_webm(), "audio/webm")}
+    with monkeypatch.context() as m:
+        m.setattr("app.recordings.jobs.encode_master", crash)
+        r = client.post(
+            f"{settings.API_V1_STR}/recordings/", files=files, headers=headers
+        )
+        assert r.status_code == 202
+        job = wait_for_job(client, r.json()["id"], headers)
+    assert job["status"] == "failed"
+    assert job["error"] == "Internal error"
+    db.refresh(user)
+    assert user.recording_count == 0
+
+    # The failed job does not stand in for the next upload of the same bytes
+    r = client.post(f"{settings.API_V1_STR}/recordings/", files=files, headers=headers)
+    assert r.status_code == 202
+    assert r.json()["id"] != job["id"]
+
+
+def test_fail_stale_jobs(db: Session) -> None:
+    user = create_random_user(db)
+    crud.reserve_recording_quota(
+        session=db, user_id=user.id, max_count=None, max_bytes=None
+    )
+    source = settings.RECORDINGS_DIR / f"{uuid.uuid4()}.upload"
+    source.parent.mkdir(parents=True, exist_ok=True)
+    source.write_bytes(random_webm())
+    stale = crud.create_recording_job(
+        session=db,
+        source_path=str(source),
+        content_hash=random_lower_string(),
+        status="running",
+        owner_id=user.id,
+    )
+    stale.started_at = stale.heartbeat_at = datetime.now(timezone.utc) - timedelta(
+        days=1
+    )
+    db.add(stale)
+    # Started as long ago, but its worker is still alive
+    alive = crud.create_recording_job(
+        session=db,
+        source_path=str(source),
+        content_hash=random_lower_string(),
+        status="running",
+    )
+    alive.started_at = stale.started_at
+    db.add(alive)
+    db.commit()
+
+    # What the queue does when it starts
+    assert fail_stale_jobs() == 1
+    db.refresh(alive)
+    assert alive.status == "running"
+    db.refresh(stale)
+    db.refresh(user)
+    assert stale.status == "failed"
+    assert stale.error == "Conversion was interrupted"
+    assert user.recording_count == 0
+    assert not source.exists()
+
+
+def test_finish_job_failed_as_stale(
+    db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user = create_random_user(db)
+    crud.reserve_recording_quota(
+        session=db, user_id=user.id, max_count=None, max_bytes=None
+    )
+    data = random_webm()
+    source = settings.RECORDINGS_DIR / f"{uuid.uuid4()}.upload"
+    source.parent.mkdir(parents=True, exist_ok=True)
+    source.write_bytes(data)
+    job, _ = register_upload(
+        session=db,
+        source_path=source,
+        content_hash=hashlib.sha256(data).hexdigest(),
+        owner_id=user.id,
+    )
+    monkeypatch.setattr(settings, "RECORDINGS_JOB_STALE_SECONDS", -60)
+
+    async def encode_while_failed(*args: Any) -> None:
+        # Another process takes the job for abandoned while it is encoded
+        assert fail_stale_jobs() == 1
+        source.write_bytes(data)
+        await encode_master(*args)
+
+    monkeypatch.setattr("app.recordings.jobs.encode_master", encode_while_failed)
+    asyncio.run(run_transcode_job(job.id))
+    db.refresh(job)
+    db.refresh(user)
+    assert job.status == "failed"
+    assert job.recording_id is None
+    assert user.recording_count == 0
+    assert user.recording_bytes == 0
+    # The file stored for it is dropped again
+    assert db.get(RecordingBlob, job.content_hash) is None
+
+
+def test_read_recording_job_not_found(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/jobs/{uuid.uuid4()}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Recording job not found"
+
+
+def test_read_recording_job_of_another_user(client: TestClient, db: Session) -> None:
+    _, headers = user_with_headers(client, db)
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", random_webm(), "audio/webm")},
+        headers=headers,
+    )
+    assert r.status_code == 202
+    job_id = r.json()["id"]
+    assert wait_for_job(client, job_id, headers)["status"] == "done"
+
+    _, other_headers = user_with_headers(client, db)
+    url = f"{settings.API_V1_STR}/recordings/jobs/{job_id}"
+    r = client.get(url, headers=other_headers)
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Recording job not found"
+
+    del client.headers["Authorization"]
+    assert client.get(url).status_code == 401
+
+
+def test_upload_recording_trims_silence(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_TRIM_SILENCE", True)
+    # The fake ffmpeg passes bytes through, so the upload decodes as this PCM
+    t = np.arange(48000) / 48000
+    speech = (np.sin(2 * np.pi * 220 * t) * 8000).astype("<i2")
+    silence = np.zeros(48000, dtype="<i2")
+    data = WEBM_HEADER + np.concatenate([silence, speech, silence]).tobytes()
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", data, "audio/webm")},
+    )
+    job = wait_for_job(client, r.json()["id"])
+    assert job["status"] == "done"
+
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/{job['recording_id']}",
+        headers=superuser_token_headers,
+    )
+    [(start, end)] = r.json()["speech_segments"]
+    assert start == 0
+    assert 1.2 <= end <= 1.4
+    master = (settings.RECORDINGS_DIR / job["filename"]).read_bytes()
+    assert len(master) == round(end * 48000) * 2
+
+
+def test_upload_recording_backlog_full(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_TRANSCODE_QUEUE_LIMIT", 1)
+    monkeypatch.setattr(settings, "RECORDINGS_TRANSCODE_CONCURRENCY", 1)
+    started_at = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for status, seconds in (("queued", 0), ("done", 30), ("done", 50)):
+        job = RecordingJob(source_path="unused", status=status)
+        if status == "done":
+            job.started_at = started_at
+            job.finished_at = started_at + timedelta(seconds=seconds)
+        db.add(job)
+    db.commit()
+    queued = crud.count_recording_jobs(session=db, status="queued")
+    durations = crud.get_recent_recording_job_durations(session=db, limit=20)
+
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", random_webm(), "audio/webm")},
+    )
+    assert r.status_code == 429
+    assert r.json()["detail"] == (
+        "Too many recordings are waiting for conversion, retry later"
+    )
+    assert int(r.headers["retry-after"]) == math.ceil(
+        queued * sum(durations) / len(durations)
+    )
+    db.execute(delete(RecordingJob).where(col(RecordingJob.source_path) == "unused"))
+    db.commit()
+
+
+def test_record_live(client: TestClient, db: Session) -> None:
+    data = random_webm()
+    with client.websocket_connect(f"{settings.API_V1_STR}/recordings/live") as ws:
+        # Timeslices smaller than the sniffed header still work
+        for start in range(0, len(data), 5):
+            ws.send_bytes(data[start : start + 5])
+        ws.send_text("stop")
+        job = ws.receive_json()
+    assert job["status"] == "done"
+    assert job["content_hash"] == hashlib.sha256(data).hexdigest()
+    assert job["filename"] == RecordingStorage.key_for(job["content_hash"], ".opus")
+    assert (settings.RECORDINGS_DIR / job["filename"]).read_bytes() == data
+    recording = db.get(Recording, uuid.UUID(job["recording_id"]))
+    assert recording
+    assert recording.duration == 1.5
+    assert recording.byte_size == len(data)
+
+
+def test_record_live_token_query(client: TestClient, db: Session) -> None:
+    user, headers = user_with_headers(client, db)
+    token = headers["Authorization"].removeprefix("Bearer ")
+    del client.headers["Authorization"]
+    with client.websocket_connect(
+        f"{settings.API_V1_STR}/recordings/live?token={token}"
+    ) as ws:
+        ws.send_bytes(random_webm())
+        ws.send_text("stop")
+        job = ws.receive_json()
+    assert job["status"] == "done"
+    recording = db.get(Recording, uuid.UUID(job["recording_id"]))
+    assert recording
+    assert recording.owner_id == user.id
+
+
+def test_record_live_not_authenticated(client: TestClient) -> None:
+    del client.headers["Authorization"]
+    with pytest.raises(WebSocketDisconnect) as e:
+        with client.websocket_connect(f"{settings.API_V1_STR}/recordings/live"):
+            pass
+    assert e.value.code == 1008
+
+
+def test_record_live_not_audio(client: TestClient) -> None:
+    with client.websocket_connect(f"{settings.API_V1_STR}/recordings/live") as ws:
+        ws.send_bytes(b"definitely not audio")
+        with pytest.raises(WebSocketDisconnect) as e:
+            ws.receive_json()
+    assert e.value.code == 1003
+    assert e.value.reason == "Stream is not a supported audio format"
+
+
+def test_record_live_conversion_error(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_PATH", "false")
+    with client.websocket_connect(f"{settings.API_V1_STR}/recordings/live") as ws:
+        ws.send_bytes(random_webm())
+        ws.send_text("stop")
+        job = ws.receive_json()
+    assert job["status"] == "failed"
+    assert job["error"].startswith("Conversion error")
+
+
+def test_record_live_unexpected_error(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user, headers = user_with_headers(client, db)
+    client.headers.update(headers)
+
+    async def crash(*_: Any) -> None:
+        raise ValueError("boom")
+
+    monkeypatch.setattr("app.recordings.jobs.probe_audio", crash)
+    with client.websocket_connect(f"{settings.API_V1_STR}/recordings/live") as ws:
+        ws.send_bytes(random_webm())
+        ws.send_text("stop")
+        job = ws.receive_json()
+    assert job["status"] == "failed"
+    assert job["error"] == "Internal error"
+    # Saved before the recording was processed
+    assert job["content_hash"]
+    db.refresh(user)
+    assert user.recording_count == 0
+
+
+def test_record_live_cancel(client: TestClient, db: Session) -> None:
+    user, headers = user_with_headers(client, db)
+    client.headers.update(headers)
+    with client.websocket_connect(f"{settings.API_V1_STR}/recordings/live") as ws:
+        ws.send_bytes(random_webm())
+        ws.send_text("cancel")
+        with pytest.raises(WebSocketDisconnect):
+            ws.receive_json()
+    job = db.exec(
+        select(RecordingJob)
+        .where(RecordingJob.owner_id == user.id)
+        .order_by(col(RecordingJob.created_at).desc())
+    ).first()
+    assert job
+    db.refresh(job)
+    assert job.status == "failed"
+    assert job.error == "Recording was cancelled"
+    db.refresh(user)
+    assert user.recording_count == 0
+
+
+def test_record_live_too_many(
+    client: TestClient, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(
+        "app.api.routes.recordings.get_live_slots",
+        lambda: TranscodeSlots(tmp_path, 0),
+    )
+    with pytest.raises(WebSocketDenialResponse) as e:
+        with client.websocket_connect(f"{settings.API_V1_STR}/recordings/live"):
+            pass
+    assert e.value.status_code == 429
+    assert e.value.json()["detail"] == "Too many live recordings, retry later"
+
+
+def test_read_recording_features(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", random_webm(), "audio/webm")},
+    )
+    job = wait_for_job(client, r.json()["id"])
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/{job['recording_id']}/features",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    features = r.json()
+    # The fake encoder passes the upload through, it is read back as PCM
+    assert features["duration"] == pytest.approx(len(random_webm()) / 2 / 16000)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/features/aggregate",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    aggregate = r.json()
+    assert aggregate["count"] >= 1
+    assert aggregate["features"]["duration"]["count"] >= 1
+    assert aggregate["features"]["duration"]["max"] >= features["duration"]
+
+
+def test_read_recording_features_not_found(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    recording = create_random_recording(db)
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/{recording.id}/features",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Recording features not found"
+
+
+def upload_wav(client: TestClient, data: bytes) -> dict[str, Any]:
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.wav", data, "audio/wav")},
+    )
+    assert r.status_code in (200, 202)
+    job = wait_for_job(client, r.json()["id"])
+    assert job["status"] == "done"
+    return job
+
+
+def test_read_recording_duplicates(client: TestClient, db: Session) -> None:
+    seed = uuid.uuid4().int
+    melody = random_melody(seed)
+    original = upload_wav(client, to_wav(to_pcm(melody)))
+    # Trimmed and at another level, so different bytes
+    trimmed = upload_wav(client, to_wav(to_pcm(melody[10000:] * 0.5)))
+    other = upload_wav(client, to_wav(to_pcm(random_melody(seed + 1))))
+    assert trimmed["content_hash"] != original["content_hash"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/{original['recording_id']}/duplicates"
+    )
+    assert r.status_code == 200
+    duplicates = {d["recording"]["id"]: d["score"] for d in r.json()["data"]}
+    assert trimmed["recording_id"] in duplicates
+    assert other["recording_id"] not in duplicates
+    assert original["recording_id"] not in duplicates
+
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/{original['recording_id']}/duplicates",
+        params={"min_score": 1},
+    )
+    assert r.json()["data"] == []
+
+    # The fingerprint goes with the stored file
+    client.delete(f"{settings.API_V1_STR}/recordings/{trimmed['recording_id']}")
+    assert (
+        crud.get_recording_fingerprint(session=db, content_hash=trimmed["content_hash"])
+        is None
+    )
+
+
+def test_read_recording_duplicates_not_found(client: TestClient, db: Session) -> None:
+    recording = create_random_recording(db)
+    r = client.get(f"{settings.API_V1_STR}/recordings/{recording.id}/duplicates")
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Recording fingerprint not found"
+
+
+def speech_webm(speech_seconds: float) -> bytes:
+    # Read back as 16 kHz PCM through the fake encoder
+    t = np.arange(int(speech_seconds * 16000)) / 16000
+    speech = (np.sin(2 * np.pi * 220 * t) * 8000).astype("<i2")
+    silence = np.zeros(16000, dtype="<i2")
+    return WEBM_HEADER + np.concatenate([silence, speech, silence]).tobytes()
+
+
+def test_read_recording_transcript(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_TRANSCRIPTION_ENGINE", "stub")
+    slots = TranscodeSlots(tmp_path, 1)
+    monkeypatch.setattr("app.recordings.transcription.get_slots", lambda: slots)
+    batches = []
+
+    class RecordingEngine(StubEngine):
+        def transcribe(self, batch: list[Any]) -> Any:
+            batches.append(len(batch))
+            # Decoding is done, conversions can run during the engine call
+            fd = slots._try_acquire()
+            assert fd is not None
+            os.close(fd)
+            return super().transcribe(batch)
+
+    monkeypatch.setattr(
+        "app.recordings.transcription.get_engine", lambda: RecordingEngine()
+    )
+    jobs = []
+    for seconds in (1, 2):
+        r = client.post(
+            f"{settings.API_V1_STR}/recordings/",
+            files={"file": ("clip.webm", speech_webm(seconds), "audio/webm")},
+        )
+        jobs.append(wait_for_job(client, r.json()["id"]))
+    url = f"{settings.API_V1_STR}/recordings/{jobs[1]['recording_id']}/transcript"
+    r = client.get(url)
+    assert r.status_code == 200
+    assert r.json()["status"] == "queued"
+
+    # Both recordings go to the engine in one call
+    assert asyncio.run(transcribe_pending()) == 2
+    assert batches == [2]
+    r = client.get(url)
+    transcript = r.json()
+    assert transcript["status"] == "done"
+    assert transcript["engine"] == "stub"
+    assert transcript["text"] == "[1]"
+    [segment] = transcript["segments"]
+    assert 0.8 <= segment["start"] <= 1.0
+    assert 3.0 <= segment["end"] <= 3.2
+    assert asyncio.run(transcribe_pending()) == 0
+
+    # The transcript goes with the stored file
+    client.delete(f"{settings.API_V1_STR}/recordings/{jobs[1]['recording_id']}")
+    assert (
+        crud.get_recording_transcript(session=db, content_hash=jobs[1]["content_hash"])
+        is None
+    )
+
+
+def test_requeue_stale_transcripts(db: Session) -> None:
+    old = datetime.now(timezone.utc) - timedelta(days=1)
+    stale, alive, abandoned = (
+        RecordingTranscript(content_hash=random_lower_string(), status="running")
+        for _ in range(3)
+    )
+    stale.updated_at = abandoned.updated_at = old
+    db.add_all([stale, alive, abandoned])
+    db.commit()
+
+    # What the transcription worker does when it starts
+    assert requeue_stale_transcripts() >= 2
+    for transcript in (stale, alive, abandoned):
+        db.refresh(transcript)
+    assert stale.status == "queued"
+    assert alive.status == "running"
+
+    # The backfill can queue one again when no worker was started since
+    alive.updated_at = old
+    db.add(alive)
+    db.commit()
+    crud.queue_recording_transcript(
+        session=db,
+        content_hash=alive.content_hash,
+        requeue=True,
+        stale_before=datetime.now(timezone.utc) - timedelta(hours=1),
+    )
+    db.refresh(alive)
+    assert alive.status == "queued"
+    for transcript in (stale, alive, abandoned):
+        db.delete(transcript)
+    db.commit()
+
+
+def test_read_recording_transcript_not_found(client: TestClient, db: Session) -> None:
+    recording = create_random_recording(db)
+    r = client.get(f"{settings.API_V1_STR}/recordings/{recording.id}/transcript")
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Recording transcript not found"
+
+
+def test_read_recording_features_aggregate_other_owner(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/features/aggregate",
+        headers=normal_user_token_headers,
+        params={"owner_id": str(uuid.uuid4())},
+    )
+    assert r.status_code == 400
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/features/aggregate",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 200
+    assert r.json()["count"] == 0
+
+
+def test_upload_recording_not_audio_type(client: TestClient) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("notes.txt", b"hello world, not audio", "text/plain")},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "File must be an audio type"
+
+
+def test_upload_recording_bad_magic_bytes(client: TestClient) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={
+            "file": ("fake.webm", b"<html>definitely not audio</html>", "audio/webm")
+        },
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "File content is not a supported audio format"
+
+
+def test_upload_recording_too_large(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_MAX_UPLOAD_BYTES", 1024)
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("big.webm", WEBM_HEADER + b"\x00" * 4096, "audio/webm")},
+    )
+    assert r.status_code == 413
+    assert r.json()["detail"] == "Recording is too large"
+
+
+def test_resumable_upload(client: TestClient) -> None:
+    data = random_webm()
+    half = len(data) // 2
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/uploads/", json={"size": len(data)}
+    )
+    assert r.status_code == 201
+    upload = r.json()
+    assert upload["offset"] == 0
+    url = f"{settings.API_V1_STR}/recordings/uploads/{upload['id']}"
+
+    r = client.patch(url, content=data[:half], headers={"Upload-Offset": "0"})
+    assert r.status_code == 200
+    assert r.json()["offset"] == half
+    assert r.headers["Upload-Offset"] == str(half)
+
+    # A resent chunk at a stale offset is refused with the current offset
+    r = client.patch(url, content=data[:half], headers={"Upload-Offset": "0"})
+    assert r.status_code == 409
+    r = client.get(url)
+    assert r.json()["offset"] == half
+
+    r = client.post(f"{url}/complete")
+    assert r.status_code == 409
+
+    r = client.patch(url, content=data[half:], headers={"Upload-Offset": str(half)})
+    assert r.json()["offset"] == len(data)
+    r = client.post(f"{url}/complete")
+    assert r.status_code == 202
+    job = wait_for_job(client, r.json()["id"])
+    assert job["status"] == "done"
+    assert (settings.RECORDINGS_DIR / job["filename"]).read_bytes() == data
+
+    r = client.get(url)
+    assert r.status_code == 404
+
+
+def test_resumable_upload_other_user(client: TestClient, db: Session) -> None:
+    r = client.post(f"{settings.API_V1_STR}/recordings/uploads/", json={})
+    url = f"{settings.API_V1_STR}/recordings/uploads/{r.json()['id']}"
+    _, headers = user_with_headers(client, db)
+    r = client.get(url, headers=headers)
+    assert r.status_code == 404
+    r = client.post(f"{url}/complete", headers=headers)
+    assert r.status_code == 404
+
+
+def test_resumable_upload_bad_magic_bytes(client: TestClient) -> None:
+    r = client.post(f"{settings.API_V1_STR}/recordings/uploads/", json={})
+    url = f"{settings.API_V1_STR}/recordings/uploads/{r.json()['id']}"
+    r = client.patch(
+        url, content=b"<html>not audio</html>", headers={"Upload-Offset": "0"}
+    )
+    assert r.status_code == 400
+    assert client.get(url).json()["offset"] == 0
+
+
+def test_read_recordings_keyset_pagination(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    owner = create_random_user(db)
+    created = [create_random_recording(db, owner_id=owner.id) for _ in range(5)]
+    seen: list[str] = []
+    cursor = None
+    for _ in range(3):
+        params: dict[str, Any] = {"owner_id": str(owner.id), "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        r = client.get(
+            f"{settings.API_V1_STR}/recordings/",
+            headers=superuser_token_headers,
+            params=params,
+        )
+        assert r.status_code == 200
+        content = r.json()
+        seen += [recording["id"] for recording in content["data"]]
+        cursor = content["next_cursor"]
+    assert cursor is None
+    assert seen == [str(recording.id) for recording in reversed(created)]
+
+
+def test_read_recordings_created_filter(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    owner = create_random_user(db)
+    older = create_random_recording(db, owner_id=owner.id)
+    newer = create_random_recording(db, owner_id=owner.id)
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/",
+        headers=superuser_token_headers,
+        params={
+            "owner_id": str(owner.id),
+            "created_after": newer.created_at.isoformat(),
+        },
+    )
+    assert [recording["id"] for recording in r.json()["data"]] == [str(newer.id)]
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/",
+        headers=superuser_token_headers,
+        params={
+            "owner_id": str(owner.id),
+            "created_before": newer.created_at.isoformat(),
+        },
+    )
+    assert [recording["id"] for recording in r.json()["data"]] == [str(older.id)]
+
+
+def test_read_recordings_other_owner(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    owner = create_random_user(db)
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/",
+        headers=normal_user_token_headers,
+        params={"owner_id": str(owner.id)},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Not enough permissions"
+
+
+def test_read_recordings_invalid_cursor(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/",
+        headers=superuser_token_headers,
+        params={"cursor": "not-a-cursor"},
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Invalid cursor"
+
+
+def test_delete_recording(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    recording = create_random_recording(db)
+    r = client.delete(
+        f"{settings.API_V1_STR}/recordings/{recording.id}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    assert r.json()["message"] == "Recording deleted successfully"
+    assert db.get(RecordingBlob, recording.content_hash) is None
+
+
+def write_recording_audio(recording: Recording, data: bytes) -> None:
+    path = settings.RECORDINGS_DIR / recording.filename
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def test_read_recording_audio(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    recording = create_random_recording(db)
+    data = random_lower_string().encode() * 10
+    write_recording_audio(recording, data)
+    url = f"{settings.API_V1_STR}/recordings/{recording.id}/audio"
+
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert r.content == data
+    assert r.headers["etag"] == f'"{recording.content_hash}.0.mp3"'
+    assert r.headers["accept-ranges"] == "bytes"
+    assert r.headers["cache-control"] == "private, no-cache"
+
+    r = client.get(url, headers={**superuser_token_headers, "Range": "bytes=10-19"})
+    assert r.status_code == 206
+    assert r.content == data[10:20]
+    assert r.headers["content-range"] == f"bytes 10-19/{len(data)}"
+
+    r = client.get(url, headers={**superuser_token_headers, "Range": "bytes=-5"})
+    assert r.status_code == 206
+    assert r.content == data[-5:]
+
+    r = client.get(
+        url, headers={**superuser_token_headers, "Range": f"bytes={len(data)}-"}
+    )
+    assert r.status_code == 416
+    assert r.headers["content-range"] == f"bytes */{len(data)}"
+
+    # An invalid range is ignored
+    r = client.get(url, headers={**superuser_token_headers, "Range": "bytes=5-3"})
+    assert r.status_code == 200
+    assert r.content == data
+
+    etag = f'"{recording.content_hash}.0.mp3"'
+    r = client.get(url, headers={**superuser_token_headers, "If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.content == b""
+
+
+def test_read_recording_audio_restores_archive(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    archive = LocalStorage(tmp_path / "archive")
+    monkeypatch.setattr("app.recordings.lifecycle.get_archive_storage", lambda: archive)
+    recording = create_random_recording(db)
+    data = random_lower_string().encode() * 10
+    key = archive_key(recording.content_hash)
+    source = tmp_path / "archived"
+    source.write_bytes(data)
+    archive.save(key, source)
+    blob = db.get(RecordingBlob, recording.content_hash)
+    assert blob is not None
+    blob.tier = "archive"
+    blob.filename = key
+    blob.revision = 1
+    db.add(blob)
+    db.commit()
+
+    # Cached before it was archived, the restored copy is encoded differently
+    played = f'"{recording.content_hash}.0.opus"'
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/{recording.id}/audio?format=opus",
+        headers={**superuser_token_headers, "If-None-Match": played},
+    )
+    assert r.status_code == 200
+    assert r.content == data
+    assert r.headers["etag"] == f'"{recording.content_hash}.1.opus"'
+    db.refresh(blob)
+    assert blob.tier == "hot"
+    assert blob.filename == RecordingStorage.key_for(recording.content_hash, ".opus")
+
+
+def test_read_recording_peaks(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    data = random_webm()
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", data, "audio/webm")},
+    )
+    job = wait_for_job(client, r.json()["id"])
+    assert job["status"] == "done"
+
+    # The fake ffmpeg passes bytes through, so they decode as the PCM itself
+    samples = np.frombuffer(data[: len(data) // 2 * 2], dtype="<i2")
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/{job['recording_id']}/peaks",
+        params={"resolution": 10},
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    assert r.headers["x-peaks-samples-per-peak"] == "64"
+    assert r.headers["x-peaks-sample-rate"] == "8000"
+    peaks = np.frombuffer(r.content, dtype="<i2").reshape(-1, 2)
+    assert len(peaks) == -(-len(samples) // 64)
+    assert peaks[0].tolist() == [samples[:64].min(), samples[:64].max()]
+
+
+def test_read_recording_peaks_not_found(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    recording = create_random_recording(db)
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/{recording.id}/peaks",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Recording peaks not found"
+
+
+def test_read_recording_audio_derived_format(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    data = random_webm()
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", data, "audio/webm")},
+    )
+    job = wait_for_job(client, r.json()["id"])
+    url = f"{settings.API_V1_STR}/recordings/{job['recording_id']}/audio"
+    cached = (
+        settings.RECORDINGS_DIR
+        / "cache"
+        / RecordingStorage.key_for(job["content_hash"], ".mp3")
+    )
+    assert not cached.exists()
+
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "audio/mpeg"
+    assert r.headers["etag"] == f'"{job["content_hash"]}.0.mp3"'
+    assert r.content == data
+    assert cached.read_bytes() == data
+
+    r = client.get(url, params={"format": "opus"}, headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "audio/ogg"
+    assert r.content == data
+
+    r = client.get(url, params={"format": "wav"}, headers=superuser_token_headers)
+    assert r.status_code == 422
+
+
+def test_read_recording_audio_accel_redirect(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(
+        settings, "RECORDINGS_ACCEL_REDIRECT_PREFIX", "/protected-recordings/"
+    )
+    recording = create_random_recording(db)
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/{recording.id}/audio",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    assert r.content == b""
+    assert (
+        r.headers["x-accel-redirect"] == f"/protected-recordings/{recording.filename}"
+    )
+
+
+def test_read_recording_audio_not_enough_permissions(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    recording = create_random_recording(db)
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/{recording.id}/audio",
+        headers=normal_user_token_headers,
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Not enough permissions"
+
+
+@pytest.fixture
+def fake_hls_ffmpeg(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Passes audio through like the fake encoder, and writes a two segment
+    # package when asked for HLS
+    script = tmp_path / "ffmpeg-hls"
+    script.write_text(
+        "#!/bin/sh\n"
+        'case "$*" in *" hls "*) ;; *) exec cat ;; esac\n'
+        "for playlist; do :; done\n"
+        'dir=$(dirname "$playlist")\n'
+        "printf '#EXTM3U\\n#EXTINF:6.0,\\nseg00000.ts\\n#EXTINF:2.0,\\nseg00001.ts\\n"
+        '#EXT-X-ENDLIST\\n\' > "$playlist"\n'
+        'printf first > "$dir/seg00000.ts"\n'
+        'printf second > "$dir/seg00001.ts"\n'
+    )
+    script.chmod(0o755)
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_PATH", str(script))
+    monkeypatch.setattr(settings, "RECORDINGS_HLS", True)
+    monkeypatch.setattr(settings, "RECORDINGS_HLS_MIN_SECONDS", 1)
+
+
+@pytest.mark.usefixtures("fake_hls_ffmpeg")
+def test_read_recording_hls(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", random_webm(), "audio/webm")},
+    )
+    job = wait_for_job(client, r.json()["id"])
+    assert job["status"] == "done"
+    url = f"{settings.API_V1_STR}/recordings/{job['recording_id']}/hls"
+
+    r = client.get(f"{url}/index.m3u8", headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/vnd.apple.mpegurl"
+    assert r.headers["cache-control"] == "private, no-cache"
+    assert "seg00001.ts" in r.text
+
+    r = client.get(f"{url}/seg00001.ts", headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert r.content == b"second"
+    assert r.headers["content-type"] == "video/mp2t"
+    etag = r.headers["etag"]
+    r = client.get(
+        f"{url}/seg00001.ts",
+        headers={**superuser_token_headers, "If-None-Match": etag},
+    )
+    assert r.status_code == 304
+
+    r = client.get(f"{url}/..%2Fsecret.ts", headers=superuser_token_headers)
+    assert r.status_code == 404
+
+    segment = settings.RECORDINGS_DIR / hls_key(job["content_hash"], "seg00000.ts")
+    assert segment.exists()
+    r = client.delete(
+        f"{settings.API_V1_STR}/recordings/{job['recording_id']}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 200
+    assert not segment.exists()
+
+
+@pytest.mark.usefixtures("fake_hls_ffmpeg")
+def test_read_recording_hls_short_recording(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_HLS_MIN_SECONDS", 600)
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", random_webm(), "audio/webm")},
+    )
+    job = wait_for_job(client, r.json()["id"])
+    r = client.get(
+        f"{settings.API_V1_STR}/recordings/{job['recording_id']}/hls/index.m3u8",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Recording HLS file not found"
+
+
+def test_direct_upload(client: TestClient, db: Session) -> None:
+    user, headers = user_with_headers(client, db)
+    r = client.post(f"{settings.API_V1_STR}/recordings/direct/", headers=headers)
+    assert r.status_code == 201
+    upload = r.json()
+    # Served by the API itself without an object store, no credentials needed
+    data = random_webm()
+    r = client.put(upload["url"], content=data, headers={"Authorization": ""})
+    assert r.status_code == 204
+
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/direct/{upload['id']}/complete",
+        headers=headers,
+    )
+    assert r.status_code == 202
+    job = wait_for_job(client, r.json()["id"], headers)
+    assert job["status"] == "done"
+    assert job["content_hash"] == hashlib.sha256(data).hexdigest()
+    db.refresh(user)
+    assert user.recording_count == 1
+    # The uploaded object is consumed
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/direct/{upload['id']}/complete",
+        headers=headers,
+    )
+    assert r.status_code == 404
+    db.refresh(user)
+    assert user.recording_count == 1
+
+
+def test_direct_upload_invalid_signature(client: TestClient) -> None:
+    r = client.post(f"{settings.API_V1_STR}/recordings/direct/")
+    url = r.json()["url"]
+    r = client.put(url.replace("signature=", "signature=0"), content=random_webm())
+    assert r.status_code == 403
+    assert r.json()["detail"] == "Invalid or expired upload URL"
+    expired = url.replace("expires=", "expires=1&ignored=")
+    r = client.put(expired, content=random_webm())
+    assert r.status_code == 403
+
+
+def test_direct_upload_complete_other_user(client: TestClient, db: Session) -> None:
+    r = client.post(f"{settings.API_V1_STR}/recordings/direct/")
+    upload = r.json()
+    client.put(upload["url"], content=random_webm())
+    _, headers = user_with_headers(client, db)
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/direct/{upload['id']}/complete",
+        headers=headers,
+    )
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Upload not found"
+
+
+def test_direct_upload_not_audio(client: TestClient, db: Session) -> None:
+    user, headers = user_with_headers(client, db)
+    r = client.post(f"{settings.API_V1_STR}/recordings/direct/", headers=headers)
+    upload = r.json()
+    client.put(upload["url"], content=b"not audio at all")
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/direct/{upload['id']}/complete",
+        headers=headers,
+    )
+    assert r.status_code == 202
+    job = wait_for_job(client, r.json()["id"], headers)
+    assert job["status"] == "failed"
+    assert job["error"] == "File content is not a supported audio format"
+    db.refresh(user)
+    assert user.recording_count == 0
+
+
+def test_direct_upload_max_open(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_USER_MAX_OPEN_UPLOADS", 1)
+    _, headers = user_with_headers(client, db)
+    urls = [
+        client.post(
+            f"{settings.API_V1_STR}/recordings/direct/", headers=headers
+        ).json()["url"]
+        for _ in range(2)
+    ]
+    assert client.put(urls[0], content=random_webm()).status_code == 204
+    # Sending the same upload again is fine, another one is not
+    assert client.put(urls[0], content=random_webm()).status_code == 204
+    r = client.put(urls[1], content=random_webm())
+    assert r.status_code == 429
+    # Completed uploads no longer count
+    upload_id = urls[0].split("?")[0].rpartition("/")[2]
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/direct/{upload_id}/complete",
+        headers=headers,
+    )
+    assert r.status_code == 202
+    wait_for_job(client, r.json()["id"], headers)
+    assert client.put(urls[1], content=random_webm()).status_code == 204
+
+
+def test_resumable_upload_max_open(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_USER_MAX_OPEN_UPLOADS", 1)
+    _, headers = user_with_headers(client, db)
+    url = f"{settings.API_V1_STR}/recordings/uploads/"
+    assert client.post(url, json={}, headers=headers).status_code == 201
+    r = client.post(url, json={}, headers=headers)
+    assert r.status_code == 429
+    # Superusers are not limited
+    assert client.post(url, json={}).status_code == 201
+
+
+@pytest.fixture
+def fake_s3(monkeypatch: pytest.MonkeyPatch) -> FakeS3:
+    s3 = FakeS3()
+    storage = s3.storage()
+    monkeypatch.setattr("app.recordings.jobs.get_storage", lambda: storage)
+    monkeypatch.setattr("app.api.routes.recordings.get_storage", lambda: storage)
+    monkeypatch.setattr("app.recordings.lifecycle.get_storage", lambda: storage)
+    monkeypatch.setattr("app.recordings.hls.get_storage", lambda: storage)
+    monkeypatch.setattr("app.recordings.lifecycle.get_archive_storage", lambda: storage)
+    return s3
+
+
+def test_direct_upload_s3(client: TestClient, fake_s3: FakeS3) -> None:
+    r = client.post(f"{settings.API_V1_STR}/recordings/direct/")
+    upload = r.json()
+    assert upload["url"].startswith("http://minio:9000/recordings/direct/")
+    assert "X-Amz-Signature=" in upload["url"]
+    # The client sends the bytes to the object store, not to the API
+    data = random_webm()
+    with httpx.Client(transport=httpx.MockTransport(fake_s3.handler)) as s3:
+        assert s3.put(upload["url"], content=data).status_code == 200
+
+    r = client.post(f"{settings.API_V1_STR}/recordings/direct/{upload['id']}/complete")
+    assert r.status_code == 202
+    # The API only looked at the object, the worker downloads and hashes it
+    assert r.json()["content_hash"] is None
+    job = wait_for_job(client, r.json()["id"])
+    assert job["status"] == "done"
+    assert job["content_hash"] == hashlib.sha256(data).hexdigest()
+    assert fake_s3.objects[job["filename"]] == data
+    assert not any(key.startswith("direct/") for key in fake_s3.objects)
+
+
+def test_upload_recording_s3(client: TestClient, fake_s3: FakeS3) -> None:
+    data = random_webm()
+    r = client.post(
+        f"{settings.API_V1_STR}/recordings/",
+        files={"file": ("clip.webm", data, "audio/webm")},
+    )
+    assert r.status_code == 202
+    job = wait_for_job(client, r.json()["id"])
+    assert job["status"] == "done"
+    assert fake_s3.objects[job["filename"]] == data
+    assert not (settings.RECORDINGS_DIR / job["filename"]).exists()
+
+
+def test_read_recording_audio_s3(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    db: Session,
+    fake_s3: FakeS3,
+) -> None:
+    recording = create_random_recording(db)
+    fake_s3.objects[recording.filename] = b"audio"
+    url = f"{settings.API_V1_STR}/recordings/{recording.id}"
+    r = client.get(
+        f"{url}/audio", headers=superuser_token_headers, follow_redirects=False
+    )
+    assert r.status_code == 307
+    assert r.headers["location"].startswith(
+        f"http://minio:9000/recordings/{recording.filename}?"
+    )
+
+    r = client.delete(url, headers=superuser_token_headers)
+    assert r.status_code == 200
+    assert recording.filename not in fake_s3.objects
@@ -0,0 +1,36 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_metrics(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_METRICS_TOKEN", "scrape")
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/",
+        headers={"Authorization": "Bearer scrape"},
+    )
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert "# TYPE recordings_ffmpeg_processes_total counter" in r.text
+
+
+def test_metrics_token_only(
+    client: TestClient,
+    superuser_token_headers: dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_METRICS_TOKEN", "scrape")
+    url = f"{settings.API_V1_STR}/utils/metrics/"
+    for headers in ({}, {"Authorization": "Bearer wrong"}, superuser_token_headers):
+        r = client.get(url, headers=headers)
+        assert r.status_code == 403
+
+
+def test_metrics_not_enabled(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics/", headers=superuser_token_headers
+    )
+    assert r.status_code == 404
@@ -1,4 +1,5 @@
 from collections.abc import Generator
+from pathlib import Path
 
 import pytest
 from fastapi.testclient import TestClient
@@ -7,7 +8,20 @@ from sqlmodel import Session, delete
 from app.core.config import settings
 from app.core.db import engine, init_db
 from app.main import app
-from app.models import Item, User
+from app.models import (
+    Item,
+    Recording,
+    RecordingBlob,
+    RecordingFingerprint,
+    RecordingFingerprintHash,
+    RecordingJob,
+    RecordingTranscript,
+    User,
+)
+from app.recordings.admission import get_live_slots, get_slots
+from app.recordings.features import get_feature_store
+from app.recordings.formats import get_cache
+from app.recordings.storage import get_archive_storage, get_storage
 from app.tests.utils.user import authentication_token_from_email
 from app.tests.utils.utils import get_superuser_token_headers
 
@@ -17,6 +31,18 @@ def db() -> Generator[Session, None, None]:
     with Session(engine) as session:
         init_db(session)
         yield session
+        statement = delete(RecordingJob)
+        session.execute(statement)
+        statement = delete(Recording)
+        session.execute(statement)
+        statement = delete(RecordingBlob)
+        session.execute(statement)
+        statement = delete(RecordingFingerprintHash)
+        session.execute(statement)
+        statement = delete(RecordingFingerprint)
+        session.execute(statement)
+        statement = delete(RecordingTranscript)
+        session.execute(statement)
         statement = delete(Item)
         session.execute(statement)
         statement = delete(User)
@@ -24,6 +50,32 @@ def db() -> Generator[Session, None, None]:
         session.commit()
 
 
+@pytest.fixture(autouse=True)
+def recordings_dir(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> Generator[None, None, None]:
+    """
+    Keep every test's recordings, spool and slots in a directory of its own,
+    not relative to the current directory.
+    """
+    monkeypatch.setattr(settings, "RECORDINGS_DIR", tmp_path / "recordings")
+    monkeypatch.setattr(settings, "RECORDINGS_ARCHIVE_DIR", tmp_path / "archived")
+    monkeypatch.setattr(settings, "RECORDINGS_FEATURES_DIR", tmp_path / "features")
+    getters = (
+        get_storage,
+        get_archive_storage,
+        get_slots,
+        get_live_slots,
+        get_cache,
+        get_feature_store,
+    )
+    for getter in getters:
+        getter.cache_clear()
+    yield
+    for getter in getters:
+        getter.cache_clear()
+
+
 @pytest.fixture(scope="module")
 def client() -> Generator[TestClient, None, None]:
     with TestClient(app) as c:
@@ -0,0 +1,36 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.recordings.admission import TranscodeSlots
+
+
+def test_slots_limit_concurrency(tmp_path: Path) -> None:
+    slots = TranscodeSlots(tmp_path, limit=2)
+
+    async def run() -> None:
+        async with slots.hold(), slots.hold():
+            # Both slots are taken, a third conversion has to wait
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(slots.hold().__aenter__(), timeout=0.2)
+        async with slots.hold():
+            pass
+
+    asyncio.run(run())
+
+
+def test_slots_hold_free(tmp_path: Path) -> None:
+    slots = TranscodeSlots(tmp_path, limit=3)
+
+    async def run() -> None:
+        async with slots.hold():
+            async with slots.hold_free(5) as extra:
+                # Only what is left, without waiting for more
+                assert extra == 2
+                async with slots.hold_free(1) as none:
+                    assert none == 0
+            async with slots.hold_free(1) as extra:
+                assert extra == 1
+
+    asyncio.run(run())
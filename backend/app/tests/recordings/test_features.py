@@ -0,0 +1,113 @@
+import math
+from pathlib import Path
+
+import numpy as np
+from numpy.typing import NDArray
+
+from app.recordings.features import (
+    FEATURES_SAMPLE_RATE,
+    FeatureStore,
+    extract_features,
+    read_features,
+    summarize_features,
+)
+
+HASHES = ["a" * 64, "b" * 64, "c" * 64]
+
+
+def syllables(seconds: float, pitch: float = 200, rate: float = 4) -> NDArray[np.int16]:
+    # A voiced tone whose loudness rises and falls ``rate`` times a second
+    t = np.arange(int(seconds * FEATURES_SAMPLE_RATE)) / FEATURES_SAMPLE_RATE
+    envelope = 0.55 - 0.45 * np.cos(2 * np.pi * rate * t)
+    return (np.sin(2 * np.pi * pitch * t) * envelope * 8000).astype(np.int16)
+
+
+def silence(seconds: float) -> NDArray[np.int16]:
+    rng = np.random.default_rng(0)
+    return rng.integers(-30, 30, int(seconds * FEATURES_SAMPLE_RATE), dtype=np.int16)
+
+
+def features_row(duration: float) -> dict[str, float]:
+    row = dict.fromkeys(
+        (
+            "speech_ratio",
+            "speaking_rate",
+            "pause_count",
+            "pause_seconds",
+            "rms_mean_db",
+            "rms_std_db",
+            "pitch_mean_hz",
+            "pitch_std_hz",
+            "pitch_median_hz",
+        ),
+        math.nan,
+    )
+    return {**row, "duration": duration}
+
+
+def test_extract_features() -> None:
+    samples = np.concatenate(
+        [silence(1), syllables(2), silence(1), syllables(2), silence(1)]
+    )
+    features = extract_features(samples, FEATURES_SAMPLE_RATE)
+    assert features["duration"] == 7
+    assert features["pause_count"] == 1
+    # The pause loses the padding kept around speech on both sides
+    assert 0.6 <= features["pause_seconds"] <= 0.8
+    assert 0.6 <= features["speech_ratio"] <= 0.7
+    assert 3 <= features["speaking_rate"] <= 4.5
+    assert abs(features["pitch_median_hz"] - 200) < 5
+    assert features["pitch_std_hz"] < 5
+
+
+def test_extract_features_silence() -> None:
+    features = extract_features(silence(2), FEATURES_SAMPLE_RATE)
+    assert features["pause_count"] == 0
+    assert features["speech_ratio"] == 0
+    assert math.isnan(features["speaking_rate"])
+    assert math.isnan(features["pitch_mean_hz"])
+
+
+def test_feature_store(tmp_path: Path) -> None:
+    store = FeatureStore(tmp_path)
+    assert len(store.load()["content_hash"]) == 0
+    store.append(HASHES[0], features_row(1))
+    store.append(HASHES[1], features_row(2))
+    # Computed again, e.g. by a backfill, the latest row wins
+    store.append(HASHES[0], features_row(3))
+
+    data = store.load(("duration",))
+    assert sorted(data) == ["content_hash", "duration"]
+    hashes, durations = data["content_hash"].tolist(), data["duration"].tolist()
+    rows = dict(zip(hashes, durations, strict=True))
+    assert rows == {HASHES[0].encode(): 3, HASHES[1].encode(): 2}
+
+    store.compact()
+    assert len(list(tmp_path.glob("*.npz"))) == 1
+    features = read_features(store, HASHES[0])
+    assert features is not None
+    assert features["duration"] == 3
+    assert features["pitch_mean_hz"] is None
+    assert read_features(store, HASHES[2]) is None
+
+
+def test_summarize_features(tmp_path: Path) -> None:
+    store = FeatureStore(tmp_path)
+    for content_hash, duration in zip(HASHES, (1, 2, 10), strict=True):
+        store.append(content_hash, features_row(duration))
+
+    count, summaries = summarize_features(store, HASHES[:2])
+    assert count == 2
+    assert summaries["duration"]["count"] == 2
+    assert summaries["duration"]["mean"] == 1.5
+    assert summaries["duration"]["max"] == 2
+    # Not measurable on any of them
+    assert summaries["pitch_mean_hz"] == {
+        "count": 0,
+        "mean": None,
+        "std": None,
+        "min": None,
+        "median": None,
+        "p90": None,
+        "max": None,
+    }
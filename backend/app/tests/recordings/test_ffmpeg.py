@@ -0,0 +1,115 @@
+import asyncio
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import pytest
+
+from app.core.config import settings
+from app.recordings.ffmpeg import (
+    FFmpegError,
+    FFmpegTimeout,
+    pipe_stream,
+    probe_audio,
+    run_ffmpeg,
+)
+from app.recordings.metrics import process_metrics
+
+
+def fake_program(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, body: str) -> Path:
+    script = tmp_path / "ffmpeg"
+    script.write_text("#!/bin/sh\n" + body)
+    script.chmod(0o755)
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_PATH", str(script))
+    monkeypatch.setattr(settings, "RECORDINGS_FFPROBE_PATH", str(script))
+    return script
+
+
+async def no_input() -> AsyncIterator[bytes]:
+    yield b""
+
+
+async def collect(live: bool = False) -> bytes:
+    return b"".join([chunk async for chunk in pipe_stream(no_input(), [], live=live)])
+
+
+def test_limits_applied(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    fake_program(
+        tmp_path,
+        monkeypatch,
+        # Limits are set from the parent once the process is running. The
+        # nice value is the 19th field of the stat line
+        'sleep 0.2\necho "$(ulimit -v) $(cut -d" " -f19 /proc/$$/stat) $*"\n',
+    )
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_NICE", 5)
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_THREADS", 3)
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_MAX_MEMORY_BYTES", 512 * 1024**2)
+    memory, nice, args = asyncio.run(collect()).decode().split(" ", 2)
+    assert int(memory) == 512 * 1024
+    assert int(nice) >= 5
+    assert args.strip().endswith("-threads 3 pipe:1")
+    assert "-threads 3 -i pipe:0" in args
+
+
+def test_run_ffmpeg_threads_before_output(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    out = tmp_path / "args.txt"
+    fake_program(tmp_path, monkeypatch, f'echo "$*" > {out}\n')
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_THREADS", 1)
+    asyncio.run(run_ffmpeg(["-i", "in.opus", "-f", "hls", "out.m3u8"]))
+    assert out.read_text().split() == [
+        "-hide_banner",
+        "-loglevel",
+        "error",
+        "-threads",
+        "1",
+        "-i",
+        "in.opus",
+        "-f",
+        "hls",
+        "-threads",
+        "1",
+        "out.m3u8",
+    ]
+
+
+def test_runaway_process_killed(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    fake_program(tmp_path, monkeypatch, "exec sleep 30\n")
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_TIMEOUT_SECONDS", 0.2)
+    timeouts = process_metrics.finished["ffmpeg", "timeout"]
+    with pytest.raises(FFmpegTimeout):
+        asyncio.run(collect())
+    with pytest.raises(FFmpegTimeout):
+        asyncio.run(run_ffmpeg(["out.ogg"]))
+    assert process_metrics.finished["ffmpeg", "timeout"] == timeouts + 2
+    assert process_metrics.running["ffmpeg"] == 0
+
+    probe_timeouts = process_metrics.finished["ffprobe", "timeout"]
+    with pytest.raises(FFmpegTimeout):
+        asyncio.run(probe_audio(tmp_path / "in.opus"))
+    assert process_metrics.finished["ffprobe", "timeout"] == probe_timeouts + 1
+
+
+def test_live_stream_not_timed_out(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    fake_program(tmp_path, monkeypatch, "sleep 0.5\necho done\n")
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_TIMEOUT_SECONDS", 0.1)
+    assert asyncio.run(collect(live=True)) == b"done\n"
+
+
+def test_outcomes_counted(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    fake_program(tmp_path, monkeypatch, "exit 1\n")
+    errors = process_metrics.finished["ffmpeg", "error"]
+    with pytest.raises(FFmpegError):
+        asyncio.run(collect())
+    assert process_metrics.finished["ffmpeg", "error"] == errors + 1
+
+    fake_program(tmp_path, monkeypatch, "kill -9 $$\n")
+    killed = process_metrics.finished["ffmpeg", "killed"]
+    with pytest.raises(FFmpegError):
+        asyncio.run(collect())
+    assert process_metrics.finished["ffmpeg", "killed"] == killed + 1
+    assert 'outcome="killed"' in process_metrics.render()
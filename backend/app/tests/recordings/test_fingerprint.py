@@ -0,0 +1,56 @@
+import numpy as np
+
+from app.recordings.fingerprint import (
+    FINGERPRINT_SAMPLE_RATE,
+    fingerprint,
+    match_offsets,
+)
+from app.tests.utils.recording import random_melody, to_pcm
+
+
+def score(query: np.ndarray, candidate: np.ndarray) -> float:
+    query_hashes, query_frames = fingerprint(to_pcm(query))
+    hashes, frames = fingerprint(to_pcm(candidate))
+    postings = [
+        (h, 1, f) for h, f in zip(hashes.tolist(), frames.tolist(), strict=True)
+    ]
+    votes = match_offsets(query_hashes, query_frames, postings)
+    return votes.get(1, 0) / min(len(query_hashes), len(hashes))
+
+
+def test_fingerprint_identical() -> None:
+    melody = random_melody(1)
+    hashes, frames = fingerprint(to_pcm(melody))
+    assert len(hashes) > 100
+    assert hashes.max() < 1 << 24
+    # One row per hash and frame
+    assert len(np.unique((frames << 24) | hashes)) == len(hashes)
+    assert score(melody, melody) == 1.0
+
+
+def test_fingerprint_trimmed_and_reencoded() -> None:
+    melody = random_melody(1)
+    rng = np.random.default_rng(0)
+    # Starts later, is quieter, noisier and low passed like a lossy encode
+    variant = melody[int(1.37 * FINGERPRINT_SAMPLE_RATE) :] * 0.5
+    variant = variant + 0.02 * rng.standard_normal(len(variant))
+    variant = np.convolve(variant, np.ones(3) / 3, mode="same")
+    assert score(melody, variant) > 0.15
+
+
+def test_fingerprint_different_audio() -> None:
+    assert score(random_melody(1), random_melody(2)) < 0.02
+
+
+def test_fingerprint_silence() -> None:
+    hashes, frames = fingerprint(np.zeros(100, dtype=np.int16))
+    assert len(hashes) == len(frames) == 0
+
+
+def test_match_offsets_needs_one_offset() -> None:
+    query_hashes = np.array([1, 2, 3, 4])
+    query_frames = np.array([0, 10, 20, 30])
+    # Candidate 7 has the hashes at a constant offset, candidate 8 scattered
+    postings = [(1, 7, 5), (2, 7, 15), (3, 7, 25), (1, 8, 0), (2, 8, 3), (3, 8, 40)]
+    assert match_offsets(query_hashes, query_frames, postings) == {7: 3, 8: 1}
+    assert match_offsets(query_hashes, query_frames, []) == {}
@@ -0,0 +1,41 @@
+import os
+from pathlib import Path
+
+from app.recordings.formats import DerivedAudioCache, master_format
+
+CONTENT_HASHES = ["a" * 64, "b" * 64, "c" * 64]
+
+
+def add_entry(cache: DerivedAudioCache, tmp_path: Path, content_hash: str) -> Path:
+    source = tmp_path / "output"
+    source.write_bytes(b"x" * 10)
+    path = cache.path_for(content_hash, "mp3")
+    cache.add(path, source)
+    return path
+
+
+def test_master_format() -> None:
+    assert master_format("ab/cd/abcd.mp3") == "mp3"
+    assert master_format("ab/cd/abcd.opus") == "opus"
+
+
+def test_cache_evicts_least_recently_used(tmp_path: Path) -> None:
+    cache = DerivedAudioCache(tmp_path / "cache", max_bytes=25)
+    first, second = (add_entry(cache, tmp_path, h) for h in CONTENT_HASHES[:2])
+    os.utime(first, (1, 1))
+    os.utime(second, (2, 2))
+    # A hit makes the oldest entry the most recent one
+    assert cache.touch(first)
+
+    third = add_entry(cache, tmp_path, CONTENT_HASHES[2])
+    assert first.exists()
+    assert not second.exists()
+    assert third.exists()
+    assert not cache.touch(second)
+
+
+def test_cache_discard(tmp_path: Path) -> None:
+    cache = DerivedAudioCache(tmp_path / "cache", max_bytes=100)
+    path = add_entry(cache, tmp_path, CONTENT_HASHES[0])
+    cache.discard(CONTENT_HASHES[0])
+    assert not path.exists()
@@ -0,0 +1,23 @@
+from app.recordings.hls import hls_key, playlist_segments
+
+PLAYLIST = b"""#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:6
+#EXT-X-PLAYLIST-TYPE:VOD
+#EXTINF:6.016000,
+seg00000.ts
+#EXTINF:1.984000,
+seg00001.ts
+#EXT-X-ENDLIST
+"""
+
+
+def test_playlist_segments() -> None:
+    assert playlist_segments(PLAYLIST) == ["seg00000.ts", "seg00001.ts"]
+    assert playlist_segments(b"#EXTM3U\n") == []
+
+
+def test_hls_key() -> None:
+    assert hls_key("abcd" + "0" * 60, "index.m3u8") == (
+        f"ab/cd/abcd{'0' * 60}.hls/index.m3u8"
+    )
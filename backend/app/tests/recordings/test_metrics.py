@@ -0,0 +1,27 @@
+import os
+
+from app.recordings.metrics import ProcessMetrics
+
+
+def test_collect_across_processes() -> None:
+    other = ProcessMetrics()
+    other.started("ffmpeg")
+    other.ended("ffmpeg", "ok", 1.5)
+    other.started("ffmpeg")
+    metrics = ProcessMetrics()
+    metrics.started("ffprobe")
+
+    total = metrics.collect()
+    assert total.running == {"ffmpeg": 1, "ffprobe": 1}
+    assert total.finished["ffmpeg", "ok"] == 1
+    assert total.seconds["ffmpeg"] == 1.5
+    assert 'program="ffmpeg",outcome="ok"} 1\n' in metrics.render()
+
+    # The other process exits, what it ran is still counted once
+    assert other._lock_fd is not None
+    os.close(other._lock_fd)
+    for _ in range(2):
+        total = metrics.collect()
+        assert total.running["ffmpeg"] == 0
+        assert total.finished["ffmpeg", "ok"] == 1
+        assert total.seconds["ffmpeg"] == 1.5
@@ -0,0 +1,109 @@
+import asyncio
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.typing import NDArray
+
+from app.core.config import settings
+from app.recordings.parallel import (
+    OPUS_DELAY_SAMPLES,
+    OPUS_FRAME_SAMPLES,
+    encode_master,
+    plan_segments,
+)
+from app.recordings.vad import PCM_INPUT_ARGS, VAD_SAMPLE_RATE
+
+
+def tone(seconds: float) -> NDArray[np.int16]:
+    t = np.arange(int(seconds * VAD_SAMPLE_RATE)) / VAD_SAMPLE_RATE
+    return (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16)
+
+
+def silence(seconds: float) -> NDArray[np.int16]:
+    return np.zeros(int(seconds * VAD_SAMPLE_RATE), dtype=np.int16)
+
+
+def speech_with_pauses() -> NDArray[np.int16]:
+    # Pauses just before 1 and 2 seconds in
+    return np.concatenate(
+        [tone(0.9), silence(0.1), tone(0.85), silence(0.1), tone(1.0)]
+    )
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Passes audio through, and joins the files of a concat list unchanged
+    script = tmp_path / "ffmpeg"
+    script.write_text(
+        "#!/bin/sh\n"
+        'case "$*" in *" concat "*) ;; *) exec cat ;; esac\n'
+        'while [ $# -gt 0 ]; do [ "$1" = -i ] && list=$2; out=$1; shift; done\n'
+        'sed -n "s/^file \'\\(.*\\)\'$/\\1/p" "$list" | xargs cat > "$out"\n'
+    )
+    script.chmod(0o755)
+    probe = tmp_path / "ffprobe"
+    probe.write_text(
+        "#!/bin/sh\n"
+        'echo \'{"format": {"duration": "3.5"}, "streams": [{"codec_name": "mp3"}]}\'\n'
+    )
+    probe.chmod(0o755)
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_PATH", str(script))
+    monkeypatch.setattr(settings, "RECORDINGS_FFPROBE_PATH", str(probe))
+    monkeypatch.setattr(settings, "RECORDINGS_PARALLEL_MIN_SECONDS", 1)
+    monkeypatch.setattr(settings, "RECORDINGS_PARALLEL_SEGMENT_SECONDS", 1)
+
+
+def expected_output(samples: NDArray[np.int16]) -> bytes:
+    # Later segments start after as many samples as the encoder delays them
+    boundaries = plan_segments(samples, VAD_SAMPLE_RATE)
+    parts = [samples[: boundaries[1]]]
+    for start, end in zip(boundaries[1:-1], boundaries[2:], strict=True):
+        parts.append(samples[start + OPUS_DELAY_SAMPLES : end])
+    return np.concatenate(parts).tobytes()
+
+
+def test_plan_segments_splits_at_pauses() -> None:
+    samples = speech_with_pauses()
+    boundaries = plan_segments(samples, VAD_SAMPLE_RATE)
+    assert len(boundaries) == 4
+    assert boundaries[0] == 0
+    assert boundaries[-1] == len(samples)
+    assert 0.9 <= boundaries[1] / VAD_SAMPLE_RATE <= 1.0
+    assert 1.85 <= boundaries[2] / VAD_SAMPLE_RATE <= 1.95
+    for boundary in boundaries[1:-1]:
+        assert (boundary + OPUS_DELAY_SAMPLES) % OPUS_FRAME_SAMPLES == 0
+
+
+def test_plan_segments_short_input() -> None:
+    samples = tone(1.1)
+    assert plan_segments(samples, VAD_SAMPLE_RATE) == [0, len(samples)]
+
+
+@pytest.mark.usefixtures("fake_ffmpeg")
+def test_encode_master_in_segments(tmp_path: Path) -> None:
+    samples = speech_with_pauses()
+    source = tmp_path / "speech.pcm"
+    source.write_bytes(samples.tobytes())
+    destination = tmp_path / "master.opus"
+    asyncio.run(encode_master(source, destination, PCM_INPUT_ARGS))
+    assert destination.read_bytes() == expected_output(samples)
+
+    # Audio that is not PCM yet is decoded once before it is split
+    destination.unlink()
+    asyncio.run(encode_master(source, destination))
+    assert destination.read_bytes() == expected_output(samples)
+    assert not list((settings.RECORDINGS_DIR / "segments").iterdir())
+
+
+@pytest.mark.usefixtures("fake_ffmpeg")
+def test_encode_master_short_recording(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_PARALLEL_MIN_SECONDS", 600)
+    samples = speech_with_pauses()
+    source = tmp_path / "speech.pcm"
+    source.write_bytes(samples.tobytes())
+    destination = tmp_path / "master.opus"
+    asyncio.run(encode_master(source, destination, PCM_INPUT_ARGS))
+    assert destination.read_bytes() == samples.tobytes()
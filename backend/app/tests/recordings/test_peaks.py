@@ -0,0 +1,67 @@
+import numpy as np
+
+from app.recordings.peaks import (
+    PEAKS_MIN_LENGTH,
+    PEAKS_SAMPLE_RATE,
+    PEAKS_SAMPLES_PER_PEAK,
+    PeaksBuilder,
+    build_levels,
+    choose_level,
+    decode_header,
+    encode_peaks,
+)
+
+
+def random_pcm(samples: int) -> bytes:
+    rng = np.random.default_rng(0)
+    return rng.integers(-32768, 32767, samples, dtype="<i2").tobytes()
+
+
+def test_builder_folds_chunks() -> None:
+    pcm = random_pcm(PEAKS_SAMPLES_PER_PEAK * 10 + 5)
+    builder = PeaksBuilder()
+    # Odd sized chunks split samples across feeds
+    for i in range(0, len(pcm), 333):
+        builder.feed(pcm[i : i + 333])
+    peaks = builder.finish()
+
+    samples = np.frombuffer(pcm, dtype="<i2")
+    assert peaks.shape == (11, 2)
+    assert peaks[0].tolist() == [
+        samples[:PEAKS_SAMPLES_PER_PEAK].min(),
+        samples[:PEAKS_SAMPLES_PER_PEAK].max(),
+    ]
+    assert peaks[-1].tolist() == [samples[-5:].min(), samples[-5:].max()]
+
+
+def test_builder_empty() -> None:
+    assert PeaksBuilder().finish().shape == (0, 2)
+
+
+def test_build_levels_halves() -> None:
+    builder = PeaksBuilder()
+    builder.feed(random_pcm(PEAKS_SAMPLES_PER_PEAK * PEAKS_MIN_LENGTH * 5))
+    levels = build_levels(builder.finish())
+    assert [len(level) for level in levels] == [1280, 640, 320]
+    assert levels[1][0].tolist() == [levels[0][:2, 0].min(), levels[0][:2, 1].max()]
+
+
+def test_encode_decode_sidecar() -> None:
+    builder = PeaksBuilder()
+    builder.feed(random_pcm(PEAKS_SAMPLES_PER_PEAK * PEAKS_MIN_LENGTH * 2))
+    levels = build_levels(builder.finish())
+    data = encode_peaks(levels)
+
+    sample_rate, table = decode_header(data)
+    assert sample_rate == PEAKS_SAMPLE_RATE
+    assert [level.samples_per_peak for level in table] == [64, 128]
+    for level, peaks in zip(table, levels, strict=True):
+        chunk = data[level.offset : level.offset + level.byte_size]
+        assert np.frombuffer(chunk, dtype="<i2").reshape(-1, 2).tolist() == (
+            peaks.tolist()
+        )
+
+    assert choose_level(table, None) == table[0]
+    assert choose_level(table, 100) == table[1]
+    assert choose_level(table, 300) == table[0]
+    assert choose_level(table, 10_000) == table[0]
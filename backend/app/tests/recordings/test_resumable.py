@@ -0,0 +1,64 @@
+import os
+import uuid
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from fastapi import HTTPException
+
+from app.recordings import direct, resumable
+from app.recordings.storage import LocalStorage
+
+
+class VanishingDir:
+    """
+    A directory whose files are removed between listing and reading them, as
+    when another request completes or prunes them meanwhile.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+
+    def glob(self, pattern: str) -> Iterator[Path]:  # noqa: ARG002
+        yield self.path / f"{uuid.uuid4()}.json"
+
+
+def test_prune_expired_files_gone(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(resumable, "uploads_dir", lambda: VanishingDir(tmp_path))
+    resumable._prune_expired()
+    assert resumable.count_open(uuid.uuid4()) == 0
+
+    storage = LocalStorage(tmp_path)
+    monkeypatch.setattr(storage, "local_path", lambda _key: VanishingDir(tmp_path))
+    direct.prune_expired(storage)
+
+
+def test_prune_expired_without_data(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(resumable, "uploads_dir", lambda: tmp_path)
+    owner_id = uuid.uuid4()
+    expired = resumable.create_upload(None, owner_id)
+    expired.data_path.unlink()
+    old = 1000.0
+    os.utime(expired.meta_path, (old, old))
+    kept = resumable.create_upload(None, owner_id)
+    assert not expired.meta_path.exists()
+    assert resumable.count_open(owner_id) == 1
+    assert resumable.get_upload(kept.id) == kept
+
+
+def test_create_upload_max_open(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(resumable, "uploads_dir", lambda: tmp_path)
+    owner_id = uuid.uuid4()
+    resumable.create_upload(None, owner_id, max_open=2)
+    resumable.create_upload(None, owner_id, max_open=2)
+    with pytest.raises(HTTPException) as e:
+        resumable.create_upload(None, owner_id, max_open=2)
+    assert e.value.status_code == 429
+    # Other users have their own
+    resumable.create_upload(None, uuid.uuid4(), max_open=2)
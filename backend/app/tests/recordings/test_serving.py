@@ -0,0 +1,35 @@
+import pytest
+
+from app.recordings.serving import RangeNotSatisfiable, parse_range
+
+
+def test_parse_range() -> None:
+    assert parse_range("bytes=10-19", 100) == (10, 19)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=90-200", 100) == (90, 99)
+    assert parse_range("bytes=-5", 100) == (95, 99)
+    assert parse_range("bytes=-500", 100) == (0, 99)
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        None,
+        "",
+        "bytes=5-3",
+        "bytes=-",
+        "bytes=--3",
+        "bytes=+1-2",
+        "items=0-1",
+        "bytes=0-1,5-6",
+    ],
+)
+def test_parse_range_ignored(header: str | None) -> None:
+    # Not a valid single range, the whole file is sent
+    assert parse_range(header, 100) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=150-200", "bytes=-0"])
+def test_parse_range_not_satisfiable(header: str) -> None:
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 100)
@@ -0,0 +1,26 @@
+import numpy as np
+from numpy.typing import NDArray
+
+from app.recordings.transcription import TRANSCRIPTION_SAMPLE_RATE, StubEngine
+
+
+def tone(seconds: float) -> NDArray[np.int16]:
+    t = np.arange(int(seconds * TRANSCRIPTION_SAMPLE_RATE)) / TRANSCRIPTION_SAMPLE_RATE
+    return (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16)
+
+
+def silence(seconds: float) -> NDArray[np.int16]:
+    return np.zeros(int(seconds * TRANSCRIPTION_SAMPLE_RATE), dtype=np.int16)
+
+
+def test_stub_engine() -> None:
+    speech = np.concatenate([silence(1), tone(1), silence(1), tone(0.5), silence(1)])
+    engine = StubEngine()
+    [first, quiet] = engine.transcribe([speech, silence(2)])
+    assert [segment.text for segment in first] == ["[1]", "[2]"]
+    assert 0.8 <= first[0].start <= 1.0
+    assert 2.0 <= first[0].end <= 2.2
+    assert 2.8 <= first[1].start <= 3.0
+    assert quiet == []
+    # The same audio always gives the same transcript
+    assert engine.transcribe([speech]) == [first]
@@ -0,0 +1,59 @@
+import numpy as np
+from numpy.typing import NDArray
+
+from app.recordings.vad import (
+    VAD_SAMPLE_RATE,
+    detect_speech,
+    plan_trim,
+    remap_segments,
+)
+
+
+def tone(seconds: float) -> NDArray[np.int16]:
+    t = np.arange(int(seconds * VAD_SAMPLE_RATE)) / VAD_SAMPLE_RATE
+    return (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16)
+
+
+def silence(seconds: float) -> NDArray[np.int16]:
+    rng = np.random.default_rng(0)
+    return rng.integers(-30, 30, int(seconds * VAD_SAMPLE_RATE), dtype=np.int16)
+
+
+def seconds(segments: list[tuple[int, int]]) -> list[tuple[float, float]]:
+    return [(start / VAD_SAMPLE_RATE, end / VAD_SAMPLE_RATE) for start, end in segments]
+
+
+def test_detect_speech() -> None:
+    samples = np.concatenate([silence(1), tone(1), silence(0.1), tone(0.5)])
+    samples = np.concatenate([samples, silence(2)])
+    # The short pause is bridged, the segment is padded on both sides
+    [(start, end)] = seconds(detect_speech(samples, VAD_SAMPLE_RATE))
+    assert 0.8 <= start <= 0.9
+    assert 2.7 <= end <= 2.8
+
+
+def test_detect_speech_only_silence() -> None:
+    assert detect_speech(silence(2), VAD_SAMPLE_RATE) == []
+    assert detect_speech(np.zeros(0, dtype=np.int16), VAD_SAMPLE_RATE) == []
+
+
+def test_plan_trim_compresses_pauses() -> None:
+    samples = np.concatenate([silence(1), tone(1), silence(3), tone(1), silence(1)])
+    segments = detect_speech(samples, VAD_SAMPLE_RATE)
+    assert len(segments) == 2
+
+    keep = plan_trim(segments, len(samples), None)
+    assert keep == [(segments[0][0], segments[1][1])]
+
+    max_pause = VAD_SAMPLE_RATE // 2
+    keep = plan_trim(segments, len(samples), max_pause)
+    assert len(keep) == 2
+    assert keep[1][0] - keep[0][1] > max_pause
+    remapped = remap_segments(segments, keep)
+    assert remapped[0][0] == 0
+    assert remapped[1][0] - remapped[0][1] == max_pause
+    assert remapped[1][1] == sum(end - start for start, end in keep)
+
+
+def test_plan_trim_without_speech() -> None:
+    assert plan_trim([], 100, None) == [(0, 100)]
@@ -0,0 +1,93 @@
+import hashlib
+import os
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session, select
+
+from app import crud
+from app.backfill_recordings import DEFAULT_TASKS, TASKS, backfill
+from app.core.config import settings
+from app.models import Recording, RecordingBlob
+from app.recordings.peaks import peaks_key
+from app.recordings.storage import get_storage
+from app.tests.utils.recording import create_random_recording
+
+
+@pytest.fixture(autouse=True)
+def fake_ffmpeg(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("#!/bin/sh\nexec cat\n")
+    ffprobe = tmp_path / "ffprobe"
+    ffprobe.write_text(
+        "#!/bin/sh\n"
+        'echo \'{"format": {"duration": "2.5"}, "streams": [{"codec_name": "opus"}]}\'\n'
+    )
+    for script in (ffmpeg, ffprobe):
+        script.chmod(0o755)
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_PATH", str(ffmpeg))
+    monkeypatch.setattr(settings, "RECORDINGS_FFPROBE_PATH", str(ffprobe))
+
+
+def test_backfill_recordings(db: Session, tmp_path: Path) -> None:
+    recording = create_random_recording(db)
+    old_path = settings.RECORDINGS_DIR / recording.filename
+    old_path.parent.mkdir(parents=True, exist_ok=True)
+    old_path.write_bytes(b"audio" * 100)
+    checkpoint_path = tmp_path / "backfill.json"
+
+    checkpoint = backfill(list(TASKS), checkpoint_path=checkpoint_path, workers=2)
+    assert recording.content_hash not in checkpoint["failed"]
+    assert checkpoint["after"] is not None
+    assert checkpoint["done"] >= 1
+
+    db.refresh(recording)
+    assert recording.filename.endswith(".opus")
+    assert recording.codec == "opus"
+    assert recording.duration == 2.5
+    assert recording.byte_size == 500
+    blob = db.get(RecordingBlob, recording.content_hash)
+    assert blob is not None
+    db.refresh(blob)
+    assert blob.filename == recording.filename
+    # Served under a new ETag
+    assert blob.revision == 1
+    storage = get_storage()
+    assert storage.size(recording.filename) == 500
+    assert storage.size(peaks_key(recording.content_hash)) is not None
+    assert not old_path.exists()
+
+    # Everything up to the checkpoint is done, a second run has nothing to do
+    resumed = backfill(["probe"], checkpoint_path=checkpoint_path, workers=1)
+    assert resumed["done"] == checkpoint["done"]
+
+
+def test_backfill_imports_legacy_recordings(
+    db: Session, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_TRIM_SILENCE", False)
+    # What uploads were saved as before recordings were in the database
+    data = os.urandom(2000)
+    legacy = settings.RECORDINGS_DIR / "recording-20240101-120000-000000.mp3"
+    legacy.parent.mkdir(parents=True, exist_ok=True)
+    legacy.write_bytes(data)
+    os.utime(legacy, (1704110400, 1704110400))
+    owner = crud.get_user_by_email(session=db, email=settings.FIRST_SUPERUSER)
+    assert owner is not None
+
+    assert "master" not in DEFAULT_TASKS
+    checkpoint = backfill(
+        list(DEFAULT_TASKS),
+        checkpoint_path=tmp_path / "backfill.json",
+        workers=1,
+        legacy_owner=settings.FIRST_SUPERUSER,
+    )
+    assert checkpoint["imported"] == 1
+    assert not legacy.exists()
+    content_hash = hashlib.sha256(data).hexdigest()
+    recording = db.exec(
+        select(Recording).where(Recording.content_hash == content_hash)
+    ).one()
+    assert recording.owner_id == owner.id
+    assert recording.created_at.timestamp() == 1704110400
+    assert get_storage().size(recording.filename) == len(data)
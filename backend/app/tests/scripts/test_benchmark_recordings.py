@@ -0,0 +1,43 @@
+import asyncio
+
+from sqlmodel import Session, col, func, select
+
+from app.benchmark_recordings import make_wav, parse_size, run_benchmark
+from app.models import Recording, RecordingJob
+from app.recordings.ingest import sniff_audio_format
+
+
+def test_parse_size() -> None:
+    assert parse_size("512") == 512
+    assert parse_size("64K") == 64 * 1024
+    assert parse_size("2m") == 2 * 1024 * 1024
+
+
+def test_make_wav() -> None:
+    data = make_wav(4096, seed=1)
+    assert len(data) == 4096
+    assert sniff_audio_format(data) == "wav"
+    assert make_wav(4096, seed=2) != data
+
+
+def test_benchmark_recordings(db: Session) -> None:
+    recordings = db.exec(select(func.count(col(Recording.id)))).one()
+    jobs = db.exec(select(func.count(col(RecordingJob.id)))).one()
+    report = asyncio.run(
+        run_benchmark(encoders=["fake"], sizes=[8192], concurrencies=[1, 3], uploads=3)
+    )
+    assert report["benchmark"] == "recordings-ingest"
+    assert [r["concurrency"] for r in report["results"]] == [1, 3]
+    for result in report["results"]:
+        assert result["encoder"] == "fake"
+        assert result["size_bytes"] == 8192
+        assert result["done"] == 3
+        assert result["failed"] == result["rejected"] == 0
+        assert result["uploads_per_second"] > 0
+        latency = result["finish_latency_seconds"]
+        assert 0 < latency["p50"] <= latency["p99"]
+        assert result["peak_rss_bytes"] > 0
+        assert result["loop_blocked_seconds"] >= 0
+    # Everything the benchmark uploaded is removed again
+    assert db.exec(select(func.count(col(Recording.id)))).one() == recordings
+    assert db.exec(select(func.count(col(RecordingJob.id)))).one() == jobs
@@ -0,0 +1,127 @@
+import asyncio
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session
+
+from app.core.config import settings
+from app.models import Recording, RecordingBlob, utcnow
+from app.recordings.lifecycle import (
+    archive_blob,
+    archive_key,
+    restore_blob,
+    run_lifecycle,
+)
+from app.recordings.storage import LocalStorage, RecordingStorage, get_storage
+from app.tests.utils.recording import create_random_recording
+
+
+@pytest.fixture(autouse=True)
+def fake_ffmpeg(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text("#!/bin/sh\nexec cat\n")
+    ffmpeg.chmod(0o755)
+    monkeypatch.setattr(settings, "RECORDINGS_FFMPEG_PATH", str(ffmpeg))
+
+
+@pytest.fixture(autouse=True)
+def archive(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> LocalStorage:
+    storage = LocalStorage(tmp_path / "archive")
+    monkeypatch.setattr("app.recordings.lifecycle.get_archive_storage", lambda: storage)
+    return storage
+
+
+def create_stored_recording(db: Session, data: bytes) -> Recording:
+    recording = create_random_recording(db)
+    path = settings.RECORDINGS_DIR / recording.filename
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return recording
+
+
+def test_archive_and_restore(db: Session, archive: LocalStorage) -> None:
+    recording = create_stored_recording(db, b"audio" * 100)
+    blob = db.get(RecordingBlob, recording.content_hash)
+    assert blob is not None
+    blob.accessed_at = utcnow() - timedelta(days=365)
+    db.add(blob)
+    db.commit()
+    hot_path = settings.RECORDINGS_DIR / recording.filename
+
+    archived, expired = asyncio.run(run_lifecycle(batch_size=1))
+    assert archived >= 1
+    assert expired == 0
+    db.refresh(blob)
+    db.refresh(recording)
+    assert blob.tier == "archive"
+    assert blob.filename == recording.filename == archive_key(blob.content_hash)
+    assert archive.size(blob.filename) == 500
+    assert not hot_path.exists()
+    # Played from the archive copy, under a new ETag
+    assert blob.revision == 1
+
+    # Archived files are off the candidate index, a second pass skips them
+    assert asyncio.run(run_lifecycle()) == (0, 0)
+
+    filename = asyncio.run(restore_blob(recording.content_hash))
+    assert filename == RecordingStorage.key_for(recording.content_hash, ".opus")
+    db.refresh(blob)
+    db.refresh(recording)
+    assert blob.tier == "hot"
+    assert blob.filename == recording.filename == filename
+    assert get_storage().size(filename) == 500
+    # A copy of what was played while archived
+    assert blob.revision == 1
+    # The archive copy is kept for when the file ages again
+    assert archive.size(archive_key(blob.content_hash)) == 500
+    # Restoring counts as an access, the file is not archived again yet
+    assert asyncio.run(run_lifecycle()) == (0, 0)
+
+
+def test_archive_on_another_filesystem(
+    db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # Spooled under RECORDINGS_DIR and saved to a tmpfs, the rename fails
+    shm = Path("/dev/shm")
+    if not shm.is_dir() or shm.stat().st_dev == os.stat(".").st_dev:
+        pytest.skip("needs a second filesystem")
+    root = Path(tempfile.mkdtemp(dir=shm))
+    try:
+        storage = LocalStorage(root)
+        monkeypatch.setattr(
+            "app.recordings.lifecycle.get_archive_storage", lambda: storage
+        )
+        recording = create_stored_recording(db, b"audio" * 100)
+        blob = db.get(RecordingBlob, recording.content_hash)
+        assert blob is not None
+        assert asyncio.run(archive_blob(blob))
+        db.refresh(blob)
+        assert blob.tier == "archive"
+        assert storage.size(archive_key(blob.content_hash)) == 500
+        assert not list(root.rglob("*.part"))
+        assert not list((settings.RECORDINGS_DIR / "archive").iterdir())
+    finally:
+        shutil.rmtree(root)
+
+
+def test_expire_recordings(db: Session, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "RECORDINGS_ARCHIVE_AFTER_DAYS", None)
+    monkeypatch.setattr(settings, "RECORDINGS_RETENTION_DAYS", 30)
+    old = create_stored_recording(db, b"old")
+    old.created_at = utcnow() - timedelta(days=31)
+    db.add(old)
+    db.commit()
+    recent = create_stored_recording(db, b"recent")
+    old_id, old_hash = old.id, old.content_hash
+
+    archived, expired = asyncio.run(run_lifecycle())
+    assert archived == 0
+    assert expired >= 1
+    db.expire_all()
+    assert db.get(Recording, old_id) is None
+    assert db.get(RecordingBlob, old_hash) is None
+    assert db.get(Recording, recent.id) is not None
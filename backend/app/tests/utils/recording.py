@@ -0,0 +1,66 @@
+import hashlib
+import uuid
+
+import numpy as np
+from numpy.typing import NDArray
+from sqlmodel import Session
+
+from app import crud
+from app.models import Recording
+from app.recordings.fingerprint import FINGERPRINT_SAMPLE_RATE
+from app.recordings.storage import RecordingStorage
+from app.tests.utils.utils import random_lower_string
+
+
+def create_random_recording(
+    db: Session, owner_id: uuid.UUID | None = None
+) -> Recording:
+    content_hash = hashlib.sha256(random_lower_string().encode()).hexdigest()
+    blob = crud.create_recording_blob(
+        session=db,
+        content_hash=content_hash,
+        filename=RecordingStorage.key_for(content_hash, ".mp3"),
+        byte_size=1024,
+    )
+    return crud.create_recording(
+        session=db, blob=blob, duration=1.5, codec="mp3", owner_id=owner_id
+    )
+
+
+def random_melody(seed: int, seconds: float = 20) -> NDArray[np.float64]:
+    """
+    Random quarter second notes with harmonics, as float samples at the
+    fingerprint sample rate.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(FINGERPRINT_SAMPLE_RATE // 4) / FINGERPRINT_SAMPLE_RATE
+    notes: list[NDArray[np.float64]] = []
+    for frequency in rng.uniform(150, 1500, int(seconds * 4)):
+        note = sum(np.sin(2 * np.pi * frequency * k * t) / k for k in (1, 2, 3))
+        notes.append(note * np.hanning(len(t)))
+    return np.concatenate(notes)
+
+
+def to_pcm(signal: NDArray[np.float64]) -> NDArray[np.int16]:
+    scale = 0.8 * 32767 / float(np.abs(signal).max())
+    return (signal * scale).astype(np.int16)
+
+
+def to_wav(samples: NDArray[np.int16]) -> bytes:
+    data = samples.astype("<i2").tobytes()
+    rate = FINGERPRINT_SAMPLE_RATE
+    header = (
+        b"RIFF"
+        + (36 + len(data)).to_bytes(4, "little")
+        + b"WAVEfmt "
+        + (16).to_bytes(4, "little")
+        + (1).to_bytes(2, "little")
+        + (1).to_bytes(2, "little")
+        + rate.to_bytes(4, "little")
+        + (rate * 2).to_bytes(4, "little")
+        + (2).to_bytes(2, "little")
+        + (16).to_bytes(2, "little")
+        + b"data"
+        + len(data).to_bytes(4, "little")
+    )
+    return header + data
@@ -0,0 +1,53 @@
+import httpx
+
+from app.recordings.storage import S3Storage
+
+
+class FakeS3:
+    """
+    In-memory stand-in for a MinIO style server, path-style buckets only.
+    """
+
+    def __init__(self, bucket: str = "recordings") -> None:
+        self.bucket = bucket
+        self.objects: dict[str, bytes] = {}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        signed = request.headers.get("authorization", "").startswith(
+            "AWS4-HMAC-SHA256 Credential="
+        )
+        # Presigned URLs carry the signature in the query instead
+        if not signed and "X-Amz-Signature" not in request.url.params:
+            return httpx.Response(403)
+        bucket, _, key = request.url.path.lstrip("/").partition("/")
+        if bucket != self.bucket:
+            return httpx.Response(404)
+        if request.method == "PUT":
+            self.objects[key] = request.read()
+            return httpx.Response(200)
+        if request.method == "DELETE":
+            self.objects.pop(key, None)
+            return httpx.Response(204)
+        if key not in self.objects:
+            return httpx.Response(404)
+        data = self.objects[key]
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={"content-length": str(len(data))})
+        first, _, last = (
+            request.headers.get("range", "").removeprefix("bytes=").partition("-")
+        )
+        if first:
+            if int(first) >= len(data):
+                return httpx.Response(416)
+            return httpx.Response(206, content=data[int(first) : int(last) + 1])
+        return httpx.Response(200, content=data)
+
+    def storage(self) -> S3Storage:
+        return S3Storage(
+            endpoint_url="http://minio:9000",
+            bucket=self.bucket,
+            access_key_id="minioadmin",
+            secret_access_key="minioadmin",
+            region="us-east-1",
+            transport=httpx.MockTransport(self.handler),
+        )
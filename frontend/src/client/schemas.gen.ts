@@ -350,6 +350,16 @@ export const UserPublicSchema = {
             type: 'string',
             format: 'uuid',
             title: 'Id'
+        },
+        recording_count: {
+            type: 'integer',
+            title: 'Recording Count',
+            default: 0
+        },
+        recording_bytes: {
+            type: 'integer',
+            title: 'Recording Bytes',
+            default: 0
         }
     },
     type: 'object',
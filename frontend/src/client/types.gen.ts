@@ -75,6 +75,8 @@ export type UserPublic = {
     is_superuser?: boolean;
     full_name?: (string | null);
     id: string;
+    recording_count?: number;
+    recording_bytes?: number;
 };
 
 export type UserRegister = {
@@ -1,6 +1,15 @@
 import * as React from "react";
 
 const BACKEND_UPLOAD_URL = "http://localhost:8000/api/v1/recordings/"; // change if your path is different
+// Audio is streamed here while recording, so it is converted by the time it stops
+const BACKEND_LIVE_URL = `${BACKEND_UPLOAD_URL.replace(/^http/, "ws")}live`;
+// How often MediaRecorder hands over a chunk to send
+const TIMESLICE_MS = 1000;
+
+// Recordings belong to the signed in user
+function accessToken(): string {
+  return localStorage.getItem("access_token") || "";
+}
 
 export function GlobalRecordButton() {
   const [isRecording, setIsRecording] = React.useState(false);
@@ -8,6 +17,44 @@ export function GlobalRecordButton() {
 
   const mediaRecorderRef = React.useRef<MediaRecorder | null>(null);
   const chunksRef = React.useRef<BlobPart[]>([]);
+  const socketRef = React.useRef<WebSocket | null>(null);
+  // Set when the live stream broke, the recording is uploaded at the end instead
+  const streamFailedRef = React.useRef(false);
+  // Chunks recorded before the socket opened, sent as soon as it does
+  const pendingRef = React.useRef<Blob[]>([]);
+  // Set once the server got audio, it then keeps a recording of its own
+  const streamedRef = React.useRef(false);
+
+  function openLiveSocket(): Promise<string> {
+    // Browsers cannot set headers on a WebSocket, the token goes in the URL
+    const socket = new WebSocket(
+      `${BACKEND_LIVE_URL}?token=${encodeURIComponent(accessToken())}`,
+    );
+    socketRef.current = socket;
+    streamFailedRef.current = false;
+    pendingRef.current = [];
+    streamedRef.current = false;
+    socket.onopen = () => {
+      for (const chunk of pendingRef.current) sendChunk(socket, chunk);
+      pendingRef.current = [];
+    };
+    // Resolves with the finished job's status once "stop" was sent
+    return new Promise((resolve, reject) => {
+      socket.onmessage = (event) => {
+        const job = JSON.parse(event.data);
+        resolve(job.status === "done" ? "Uploaded ✅" : "Upload failed");
+      };
+      socket.onerror = () => {
+        streamFailedRef.current = true;
+      };
+      socket.onclose = () => reject(new Error("Live upload closed"));
+    });
+  }
+
+  function sendChunk(socket: WebSocket, chunk: Blob) {
+    socket.send(chunk);
+    streamedRef.current = true;
+  }
 
   async function startRecording() {
     try {
@@ -17,10 +64,22 @@ export function GlobalRecordButton() {
       const recorder = new MediaRecorder(stream);
       mediaRecorderRef.current = recorder;
       chunksRef.current = [];
+      const liveResult = openLiveSocket();
+      // Handled on stop, this keeps an early failure from going unhandled
+      liveResult.catch(() => {});
 
       recorder.ondataavailable = (event) => {
         if (event.data.size > 0) {
+          // Kept as well, in case the live stream fails part way through
           chunksRef.current.push(event.data);
+          const socket = socketRef.current;
+          if (socket?.readyState === WebSocket.OPEN) {
+            sendChunk(socket, event.data);
+          } else if (socket?.readyState === WebSocket.CONNECTING) {
+            pendingRef.current.push(event.data);
+          } else {
+            streamFailedRef.current = true;
+          }
         }
       };
 
@@ -30,10 +89,37 @@ export function GlobalRecordButton() {
 
         const blob = new Blob(chunksRef.current, { type: "audio/webm" });
         chunksRef.current = [];
+        const socket = socketRef.current;
+        socketRef.current = null;
+        if (socket?.readyState === WebSocket.OPEN && !streamFailedRef.current) {
+          setUploadStatus("Finishing...");
+          socket.send("stop");
+          try {
+            setUploadStatus(await liveResult);
+            setTimeout(() => setUploadStatus(null), 4000);
+            return;
+          } catch {
+            // The server got the whole recording and kept or refused it,
+            // uploading it again could store it twice
+            setUploadStatus("Upload failed");
+            return;
+          }
+        }
+        if (socket?.readyState === WebSocket.OPEN && streamedRef.current) {
+          // Discard what was streamed, the whole recording is uploaded below
+          socket.send("cancel");
+          streamedRef.current = false;
+        }
+        socket?.close();
+        if (streamedRef.current) {
+          // The connection dropped, the server keeps what it received
+          setUploadStatus("Upload interrupted, saved what was sent");
+          return;
+        }
         await uploadRecording(blob);
       };
 
-      recorder.start();
+      recorder.start(TIMESLICE_MS);
       setIsRecording(true);
     } catch (err) {
       console.error(err);
@@ -58,6 +144,7 @@ export function GlobalRecordButton() {
 
       const res = await fetch(BACKEND_UPLOAD_URL, {
         method: "POST",
+        headers: { Authorization: `Bearer ${accessToken()}` },
         body: formData,
       });
 